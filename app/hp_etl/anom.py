@@ -1,5 +1,42 @@
-import statistics
-from typing import List, Tuple
+import math
+from typing import Dict, Hashable, List, Tuple
+
+from .features import _CANCEL, rolling_moments, window_moments, window_sum
+
+try:
+    import numpy as np
+except Exception:  # optional
+    np = None
+
+# stdev at or below this scores 0.0
+MIN_STDEV = 1e-7
+
+
+def backend() -> str:
+    """Which rolling_zscore_many implementation runs ("numpy" or "python")."""
+    return "numpy" if np is not None else "python"
+
+
+class RollingZ:
+    """Online z-score over the last `window` points, current point included.
+
+    Keeps the window's count, mean and m2 with features.rolling_moments,
+    amortised O(1) per point and computed from the window's own values.
+    Scores are 0.0 until two points are in and when the window is flat.
+    """
+
+    def __init__(self, window: int = 21):
+        if window < 1:
+            raise ValueError("window must be >= 1")
+        self.window = window
+        self.moments = rolling_moments(window)
+
+    def push(self, x: float) -> float:
+        n, mean, m2 = self.moments.push(x)
+        if n < 2:
+            return 0.0
+        stdev = math.sqrt(max(m2, 0.0) / (n - 1))
+        return (x - mean) / stdev if stdev > MIN_STDEV else 0.0
 
 
 def rolling_zscore(
@@ -9,24 +46,74 @@ def rolling_zscore(
     Compute the rolling z-score for each point based on trailing window (including current).
     Args:
         series: List of (iso_date, value), must be sorted by iso_date ascending.
-        window: Days in the rolling window.
+        window: Points in the rolling window.
     Returns:
-        List of (iso_date, zscore) with None for first points until window filled.
+        List of (iso_date, zscore); 0.0 until two points are in the window or
+        while the window is flat (sample stdev <= 1e-7).
+    """
+    rz = RollingZ(window)
+    return [(ts, rz.push(v)) for ts, v in series]
+
+
+def rolling_zscore_array(values, window: int = 21):
+    """rolling_zscore over a 2-D array, one series per row.
+
+    Rows shorter than the array are right-padded with NaN; padded positions
+    score NaN. Vectorised with centred window sums (features.window_sum), so
+    many series are scored in one pass; windows whose spread is within the
+    sums' rounding are recomputed from their values.
+    """
+    if np is None:
+        raise RuntimeError("numpy is required for rolling_zscore_array")
+    if window < 1:
+        raise ValueError("window must be >= 1")
+    a = np.atleast_2d(np.asarray(values, dtype=float))
+    nan = np.isnan(a)
+    valid = ~nan
+    count = valid.sum(axis=1, keepdims=True)
+    centre = np.where(valid, a, 0.0).sum(axis=1, keepdims=True) / np.maximum(count, 1)
+    filled = np.where(nan, 0.0, a - centre)
+    # zeros in front: the first window - 1 windows are partial
+    front = np.pad(filled, [(0, 0), (window - 1, 0)])
+    s1 = window_sum(front, window)
+    s2 = window_sum(front * front, window)
+    n = np.minimum(np.arange(1, a.shape[1] + 1), window).astype(float)
+    mean = s1 / n
+    m2 = s2 - s1 * mean
+    dev = filled - mean
+    # s2 == 0: every value equals the centre exactly
+    redo = (m2 <= _CANCEL * s2) & (s2 > 0) & valid & (n >= 2)
+    if redo.any():
+        padded = np.pad(a, [(0, 0), (window - 1, 0)], constant_values=np.nan)
+        wins = np.lib.stride_tricks.sliding_window_view(padded, window, axis=1)
+        wmean, m2[redo] = window_moments(wins[redo])
+        dev[redo] = a[redo] - wmean
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stdev = np.sqrt(np.maximum(m2, 0.0) / (n - 1))
+        z = np.where(stdev > MIN_STDEV, dev / stdev, 0.0)
+    z = np.where(n < 2, 0.0, z)
+    return np.where(nan, np.nan, z)
+
+
+def rolling_zscore_many(
+    series: Dict[Hashable, List[Tuple[str, float]]], window: int = 21
+) -> Dict[Hashable, List[Tuple[str, float]]]:
+    """rolling_zscore for many series, e.g. keyed by (person, metric).
+
+    Uses rolling_zscore_array when NumPy is installed, RollingZ otherwise.
     """
-    result = []
-    vals = [v for _, v in series]
-    for i in range(len(series)):
-        istart = max(0, i - window + 1)
-        win = vals[istart : i + 1]
-        if len(win) < 2:
-            result.append((series[i][0], 0.0))
-        else:
-            mean = statistics.mean(win)
-            stdev = statistics.stdev(win)
-            val = vals[i]
-            score = (val - mean) / stdev if stdev > 1e-7 else 0.0
-            result.append((series[i][0], score))
-    return result
+    if np is None or not series:
+        return {k: rolling_zscore(s, window) for k, s in series.items()}
+    keys = list(series)
+    width = max(len(series[k]) for k in keys)
+    a = np.full((len(keys), width), np.nan)
+    for row, k in enumerate(keys):
+        a[row, : len(series[k])] = [v for _, v in series[k]]
+    z = rolling_zscore_array(a, window) if width else a
+    return {
+        k: [(ts, float(s)) for (ts, _), s in zip(series[k], z[row])]
+        for row, k in enumerate(keys)
+    }
 
 
 def level_from_score(score: float) -> str:
@@ -0,0 +1,100 @@
+"""Streaming Record reader for Apple Health export.xml.
+
+iter_records() yields the attribute dict of each <Record> without building the
+document tree, so memory stays flat on multi-GB exports. Backends:
+
+- lxml: C iterparse that frees each top-level element once it ends (fastest,
+  optional dependency)
+- expat: stdlib pull parser that only materializes Record attributes
+- etree: stdlib ElementTree.iterparse (the historical path)
+
+HP_XML_BACKEND or the backend argument picks one; by default lxml is used when
+installed, otherwise expat.
+"""
+
+import os
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
+
+try:
+    from lxml import etree as lxml_etree
+except Exception:  # optional
+    lxml_etree = None
+
+READ_SIZE = 1 << 20
+
+
+def _open(source):
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, "rb"), True
+    return source, False
+
+
+def _iter_lxml(f):
+    for _, el in lxml_etree.iterparse(
+        f, events=("end",), huge_tree=True, resolve_entities=False
+    ):
+        if el.tag == "Record":
+            yield dict(el.attrib)
+        parent = el.getparent()
+        # free every finished child of the root (Records nested in a
+        # Correlation go with it), plus the siblings the root still holds
+        if parent is not None and parent.getparent() is None:
+            el.clear()
+            while el.getprevious() is not None:
+                del parent[0]
+
+
+def _iter_expat(f):
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    out = []
+
+    def start(name, attrs):
+        if name == "Record":
+            out.append(attrs)
+
+    parser.StartElementHandler = start
+    while True:
+        data = f.read(READ_SIZE)
+        parser.Parse(data, not data)
+        if out:
+            yield from out
+            out.clear()
+        if not data:
+            return
+
+
+def _iter_etree(f):
+    it = ET.iterparse(f, events=("start", "end"))
+    _, root = next(it)  # get root
+    for ev, el in it:
+        if ev == "end" and el.tag == "Record":
+            yield dict(el.attrib)
+            el.clear()
+            root.clear()
+
+
+BACKENDS = {"lxml": _iter_lxml, "expat": _iter_expat, "etree": _iter_etree}
+
+
+def default_backend() -> str:
+    name = os.getenv("HP_XML_BACKEND", "").strip().lower()
+    if name:
+        return name
+    return "lxml" if lxml_etree is not None else "expat"
+
+
+def iter_records(source, backend: str | None = None):
+    """Yield attribute dicts of Record elements from a path or binary file."""
+    backend = backend or default_backend()
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown XML backend: {backend}")
+    if backend == "lxml" and lxml_etree is None:
+        raise ValueError("XML backend lxml requested but lxml is not installed")
+    f, owned = _open(source)
+    try:
+        yield from BACKENDS[backend](f)
+    finally:
+        if owned:
+            f.close()
@@ -1,76 +1,356 @@
 """Cache abstraction: uses Redis if REDIS_URL is set and redis package available,
 otherwise falls back to the process-local simple_cache implementation.
+
+The Redis client is created on first use from a connection pool with short
+timeouts, values are encoded by app.hp_etl.serializers, and repeated Redis
+errors open a circuit breaker that routes calls to the local cache for
+HP_REDIS_BREAKER_COOLDOWN seconds. HP_CACHE_BACKEND=local skips Redis entirely.
+
+get_or_compute/aget_or_compute add request coalescing on top: concurrent misses
+for one key in a process run a single computation, and with stale_ttl an expired
+value keeps being served while one caller refreshes it in the background.
 """
 
-from typing import Any, Optional
+from typing import Any, Awaitable, Callable, Optional
+import asyncio
 import os
+import threading
+import time
 
-_use_redis = False
-_redis_client = None
+from . import serializers
+from .simple_cache import (
+    get as _get_local,
+    set as _set_local,
+    clear as _clear_local,
+)
 
 try:
     import redis
+except Exception:  # optional: without it everything stays process-local
+    redis = None
 
-    # Prefer Redis. Default to localhost if REDIS_URL not set so switching to Redis is simple for local dev.
-    REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
-    try:
-        _redis_client = redis.from_url(REDIS_URL)
-        # attempt a quick ping to verify availability
-        _redis_client.ping()
-        _use_redis = True
-    except Exception:
-        _use_redis = False
-        _redis_client = None
-except Exception:
-    _use_redis = False
-    _redis_client = None
+# Prefer Redis. Default to localhost if REDIS_URL not set so switching to Redis is simple for local dev.
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
 
-if not _use_redis:
-    # fallback to process-local cache
-    from .simple_cache import (
-        get as _get_local,
-        set as _set_local,
-        clear as _clear_local,
-    )
+_client = None
+_client_lock = threading.Lock()
+_serializer = None
+# circuit breaker: after N consecutive Redis errors use the local cache for a while
+_breaker = {"failures": 0, "open_until": 0.0}
 
 
-def get(key: str) -> Optional[Any]:
-    if _use_redis and _redis_client:
-        try:
-            raw = _redis_client.get(key)
-            if raw is None:
-                return None
-            # stored as JSON via Redis
-            import json
+def _breaker_threshold() -> int:
+    return int(os.getenv("HP_REDIS_BREAKER_THRESHOLD", "3"))
 
-            return json.loads(raw)
-        except Exception:
-            return None
-    else:
+
+def _breaker_cooldown() -> float:
+    return float(os.getenv("HP_REDIS_BREAKER_COOLDOWN", "30"))
+
+
+def _redis():
+    """Pooled client, created on first use; None while the breaker is open."""
+    global _client, _serializer
+    if redis is None or os.getenv("HP_CACHE_BACKEND", "redis") == "local":
+        return None
+    if _breaker["open_until"] > time.monotonic():
+        return None
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                timeout = float(os.getenv("HP_REDIS_TIMEOUT", "0.25"))
+                pool = redis.ConnectionPool.from_url(
+                    REDIS_URL,
+                    max_connections=int(os.getenv("HP_REDIS_MAX_CONNECTIONS", "32")),
+                    socket_connect_timeout=timeout,
+                    socket_timeout=timeout,
+                    health_check_interval=30,
+                )
+                _serializer = serializers.get_serializer()
+                _client = redis.Redis(connection_pool=pool)
+    return _client
+
+
+def _ok() -> None:
+    _breaker["failures"] = 0
+
+
+def _failed() -> None:
+    _breaker["failures"] += 1
+    if _breaker["failures"] >= _breaker_threshold():
+        _breaker["open_until"] = time.monotonic() + _breaker_cooldown()
+        _breaker["failures"] = 0
+
+
+def backend() -> str:
+    """Name of the backend the next call would use ("redis" or "local")."""
+    return "redis" if _redis() is not None else "local"
+
+
+def get(key: str) -> Optional[Any]:
+    client = _redis()
+    if client is None:
         return _get_local(key)
+    try:
+        raw = client.get(key)
+    except Exception:
+        _failed()
+        return _get_local(key)
+    _ok()
+    if raw is None:
+        # set() keeps values Redis cannot hold in this process
+        return _get_local(key)
+    try:
+        return serializers.loads(raw)
+    except Exception:
+        return None
 
 
-def set(key: str, value: Any, ttl: Optional[int] = None) -> None:
-    if _use_redis and _redis_client:
+def get_many(keys: list[str]) -> dict:
+    """Values for the keys that are cached, fetched in one round trip."""
+    keys = list(keys)
+    client = _redis()
+    if client is not None and keys:
         try:
-            import json
-
-            raw = json.dumps(value)
-            if ttl:
-                _redis_client.setex(key, int(ttl), raw)
-            else:
-                _redis_client.set(key, raw)
+            raws = client.mget(keys)
         except Exception:
-            return None
-    else:
+            _failed()
+        else:
+            _ok()
+            out = {}
+            for k, raw in zip(keys, raws):
+                if raw is None:
+                    v = _get_local(k)
+                    if v is not None:
+                        out[k] = v
+                    continue
+                try:
+                    out[k] = serializers.loads(raw)
+                except Exception:
+                    pass
+            return out
+    out = {}
+    for k in keys:
+        v = _get_local(k)
+        if v is not None:
+            out[k] = v
+    return out
+
+
+def set(key: str, value: Any, ttl: Optional[int] = None) -> None:
+    client = _redis()
+    if client is None:
         _set_local(key, value, ttl=ttl)
+        return
+    try:
+        raw = _serializer.dumps(value)
+    except Exception:
+        # not serializable: keep it in this process rather than not at all
+        _set_local(key, value, ttl=ttl)
+        return
+    try:
+        if ttl:
+            client.setex(key, int(ttl), raw)
+        else:
+            client.set(key, raw)
+    except Exception:
+        _failed()
+        _set_local(key, value, ttl=ttl)
+        return
+    _ok()
 
 
 def clear(key: str) -> None:
-    if _use_redis and _redis_client:
+    _clear_local(key)
+    client = _redis()
+    if client is None:
+        return
+    try:
+        client.delete(key)
+    except Exception:
+        _failed()
+    else:
+        _ok()
+
+
+# Stale-while-revalidate entries are stored wrapped so readers know when the
+# value stopped being fresh; the backend TTL covers the stale window as well.
+_ENVELOPE = "__swr__"
+
+_flights: dict = {}
+_flights_lock = threading.Lock()
+_aflights: dict = {}
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def single_flight(key: str, compute: Callable[[], Any]) -> Any:
+    """Run compute() once for concurrent callers of the same key (threads)."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+    try:
+        flight.value = compute()
+        return flight.value
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+async def asingle_flight(key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """Await compute() once for concurrent coroutines of the same key."""
+    loop = asyncio.get_running_loop()
+    fkey = (loop, key)
+    fut = _aflights.get(fkey)
+    if fut is not None:
+        # shield: one waiter being cancelled must not cancel the shared work
+        return await asyncio.shield(fut)
+    fut = loop.create_future()
+    _aflights[fkey] = fut
+    try:
+        value = await compute()
+    except BaseException as e:
+        if not fut.done():
+            fut.set_exception(e)
+            # mark retrieved so an unawaited failure does not log a warning
+            fut.exception()
+        raise
+    else:
+        fut.set_result(value)
+        return value
+    finally:
+        _aflights.pop(fkey, None)
+
+
+def _wrap(value: Any, ttl: Optional[int]) -> dict:
+    return {_ENVELOPE: 1, "v": value, "fresh_until": time.time() + (ttl or 0)}
+
+
+def _unwrap(raw: Any):
+    """(value, is_fresh) from a stored entry; plain values are always fresh."""
+    if isinstance(raw, dict) and raw.get(_ENVELOPE) == 1:
+        return raw.get("v"), time.time() < raw.get("fresh_until", 0)
+    return raw, True
+
+
+def _store(key: str, value: Any, ttl: Optional[int], stale_ttl: int) -> None:
+    if value is None:
+        return
+    if stale_ttl:
+        set(key, _wrap(value, ttl), ttl=(ttl or 0) + stale_ttl)
+    else:
+        set(key, value, ttl=ttl)
+
+
+def get_or_compute(
+    key: str,
+    compute: Callable[[], Any],
+    ttl: Optional[int] = None,
+    stale_ttl: int = 0,
+) -> Any:
+    """Cached value for key, computing it at most once per process on a miss.
+
+    With stale_ttl > 0 a value past its ttl is still returned for stale_ttl
+    more seconds while a background thread recomputes it.
+    """
+    raw = get(key)
+    if raw is not None:
+        value, fresh = _unwrap(raw)
+        if fresh:
+            return value
+        _refresh_in_background(key, compute, ttl, stale_ttl)
+        return value
+
+    def _fill():
+        # another flight may have filled the key while we queued
+        raw = get(key)
+        if raw is not None and _unwrap(raw)[1]:
+            return _unwrap(raw)[0]
+        value = compute()
+        _store(key, value, ttl, stale_ttl)
+        return value
+
+    return single_flight(key, _fill)
+
+
+def _refresh_in_background(key, compute, ttl, stale_ttl) -> None:
+    with _flights_lock:
+        if key in _flights:
+            return
+
+    def _run():
         try:
-            _redis_client.delete(key)
+            single_flight(key, lambda: _store(key, compute(), ttl, stale_ttl))
         except Exception:
             pass
-    else:
-        _clear_local(key)
+
+    threading.Thread(target=_run, name="hp-cache-refresh", daemon=True).start()
+
+
+async def _ablocking(fn, *args):
+    """Run a cache call off the event loop when it may wait on Redis."""
+    if _redis() is None:
+        return fn(*args)
+    return await asyncio.to_thread(fn, *args)
+
+
+async def aget_or_compute(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    ttl: Optional[int] = None,
+    stale_ttl: int = 0,
+) -> Any:
+    """Async twin of get_or_compute; the background refresh is a task.
+
+    Redis calls run in a worker thread so a slow Redis does not stall the loop.
+    """
+
+    async def _fill():
+        value = await compute()
+        await _ablocking(_store, key, value, ttl, stale_ttl)
+        return value
+
+    raw = await _ablocking(get, key)
+    if raw is not None:
+        value, fresh = _unwrap(raw)
+        if fresh:
+            return value
+        loop = asyncio.get_running_loop()
+        if (loop, key) not in _aflights:
+            task = loop.create_task(_arefresh(key, _fill))
+            # keep a strong reference so the task is not collected mid-run
+            _background[task] = None
+            task.add_done_callback(lambda t: _background.pop(t, None))
+        return value
+
+    return await asingle_flight(key, _fill)
+
+
+_background: dict = {}
+
+
+async def _arefresh(key, fill) -> None:
+    try:
+        await asingle_flight(key, fill)
+    except Exception:
+        pass
+
+
+def stale_ttl_default() -> int:
+    """Seconds an expired response may still be served while it refreshes."""
+    return int(os.getenv("HP_CACHE_STALE_TTL", "60"))
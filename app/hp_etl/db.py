@@ -1,7 +1,22 @@
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import atexit
 import os
+import threading
 import psycopg
 
+try:
+    from psycopg_pool import AsyncConnectionPool, ConnectionPool
+except Exception:  # pool package missing: every pg() call opens its own connection
+    AsyncConnectionPool = None
+    ConnectionPool = None
+
+_pools: dict = {}
+# (dsn, event loop) -> pool
+_async_pools: dict = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
 
 def dsn_from_env(default: str | None = None) -> str:
     return os.getenv(
@@ -9,7 +24,159 @@ def dsn_from_env(default: str | None = None) -> str:
     )
 
 
+def pooling_enabled() -> bool:
+    """Pooling is on by default; HP_DB_POOL=0 restores one connection per call."""
+    if ConnectionPool is None:
+        return False
+    return os.getenv("HP_DB_POOL", "1").strip().lower() not in ("0", "false", "no")
+
+
+def pool_settings() -> dict:
+    """Pool sizing from env. Keep HP_DB_POOL_MAX x workers under max_connections."""
+    return {
+        "min_size": int(os.getenv("HP_DB_POOL_MIN", "1")),
+        "max_size": int(os.getenv("HP_DB_POOL_MAX", "10")),
+        "timeout": float(os.getenv("HP_DB_POOL_TIMEOUT", "5")),
+        "max_lifetime": float(os.getenv("HP_DB_POOL_MAX_LIFETIME", "1800")),
+        "max_idle": float(os.getenv("HP_DB_POOL_MAX_IDLE", "300")),
+    }
+
+
+def _check_enabled() -> bool:
+    # Health check costs one round trip per checkout; HP_DB_POOL_CHECK=0 skips it
+    # and relies on max_idle/max_lifetime recycling alone.
+    return os.getenv("HP_DB_POOL_CHECK", "1").strip().lower() not in (
+        "0",
+        "false",
+        "no",
+    )
+
+
+def _reset(conn) -> None:
+    # Callers may switch autocommit off for explicit transactions; hand the
+    # connection back to the next borrower in the state pg() promises.
+    if not conn.autocommit:
+        conn.autocommit = True
+
+
+async def _areset(conn) -> None:
+    if not conn.autocommit:
+        await conn.set_autocommit(True)
+
+
+def _forget_inherited_pools() -> None:
+    # Pools own sockets and worker threads that do not survive fork(); a child
+    # process (uvicorn workers, job process pools) must build its own.
+    global _pools_pid
+    if os.getpid() != _pools_pid:
+        _pools.clear()
+        _async_pools.clear()
+        _pools_pid = os.getpid()
+
+
+def get_pool(dsn: str | None = None):
+    """Return the process-wide sync pool for dsn, creating it on first use."""
+    dsn = dsn or dsn_from_env()
+    with _pools_lock:
+        _forget_inherited_pools()
+        pool = _pools.get(dsn)
+        if pool is None:
+            pool = ConnectionPool(
+                dsn,
+                kwargs={"autocommit": True},
+                check=ConnectionPool.check_connection if _check_enabled() else None,
+                reset=_reset,
+                name="hp_etl",
+                open=True,
+                **pool_settings(),
+            )
+            _pools[dsn] = pool
+    return pool
+
+
+def _drop_orphaned_pools() -> None:
+    # A pool is bound to the event loop that opened it and cannot be awaited
+    # once that loop is closed (asyncio.run per script or test); close the idle
+    # connections it still holds instead of leaving them to the collector.
+    for key in [k for k in _async_pools if k[1].is_closed()]:
+        pool = _async_pools.pop(key)
+        for conn in list(getattr(pool, "_pool", ())):
+            conn.pgconn.finish()
+
+
+async def get_async_pool(dsn: str | None = None):
+    """Return the async pool for dsn bound to the running event loop."""
+    dsn = dsn or dsn_from_env()
+    loop = asyncio.get_running_loop()
+    with _pools_lock:
+        _forget_inherited_pools()
+        _drop_orphaned_pools()
+        pool = _async_pools.get((dsn, loop))
+        if pool is None:
+            pool = AsyncConnectionPool(
+                dsn,
+                kwargs={"autocommit": True},
+                check=(
+                    AsyncConnectionPool.check_connection if _check_enabled() else None
+                ),
+                reset=_areset,
+                name="hp_etl_async",
+                open=False,
+                **pool_settings(),
+            )
+            _async_pools[(dsn, loop)] = pool
+    await pool.open()
+    return pool
+
+
+def pool_stats() -> list[dict]:
+    """Snapshot of pool counters (requests, waits, connections) per pool."""
+    with _pools_lock:
+        pools = list(_pools.values()) + list(_async_pools.values())
+    return [{"name": p.name, **p.get_stats()} for p in pools]
+
+
+def close_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_pools)
+
+
+async def aclose_pools() -> None:
+    """Close the async pools of the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _pools_lock:
+        keys = [k for k in _async_pools if k[1] is loop]
+        pools = [_async_pools.pop(k) for k in keys]
+    for pool in pools:
+        await pool.close()
+
+
 @contextmanager
 def pg(dsn: str | None = None):
-    with psycopg.connect(dsn or dsn_from_env(), autocommit=True) as conn:
+    if not pooling_enabled():
+        with psycopg.connect(dsn or dsn_from_env(), autocommit=True) as conn:
+            yield conn
+        return
+    with get_pool(dsn).connection() as conn:
+        yield conn
+
+
+@asynccontextmanager
+async def apg(dsn: str | None = None):
+    """Async twin of pg() for request handlers running on the event loop."""
+    if not pooling_enabled():
+        conn = await psycopg.AsyncConnection.connect(
+            dsn or dsn_from_env(), autocommit=True
+        )
+        async with conn:
+            yield conn
+        return
+    pool = await get_async_pool(dsn)
+    async with pool.connection() as conn:
         yield conn
@@ -1,5 +1,8 @@
 from typing import Optional, Any
 from .db import pg
+from .labs_rollup import REFRESH_STAGED_SQL
+from .rollups import MARK_STAGED_SQL
+from . import ingest_eval
 
 INSERT_SQL = """
 INSERT INTO analytics.data_events (
@@ -13,11 +16,149 @@ INSERT INTO analytics.data_events (
 )
 """
 
+COLUMNS = (
+    "person_id",
+    "source",
+    "kind",
+    "code_system",
+    "code",
+    "display",
+    "effective_time",
+    "effective_start",
+    "effective_end",
+    "value_num",
+    "value_text",
+    "unit",
+    "device_id",
+    "status",
+    "raw",
+    "meta",
+)
+
+_COLS = ", ".join(COLUMNS)
+
+# Session-local staging table; emptied by every commit so a pooled connection
+# hands it to the next borrower clean.
+STAGE_SQL = f"""
+CREATE TEMP TABLE IF NOT EXISTS data_events_stage ON COMMIT DELETE ROWS AS
+SELECT {_COLS} FROM analytics.data_events WITH NO DATA
+"""
+
+# Text format on purpose: callers hand over ISO timestamp strings and JSON
+# that is already serialised, which text COPY passes through as is. Binary
+# COPY would need every timestamp parsed into a datetime and every raw/meta
+# document decoded again in Python just to be re-encoded, which costs more
+# than the server-side text parse it saves.
+COPY_SQL = f"COPY data_events_stage ({_COLS}) FROM STDIN"
+
+# Idempotent merge on uq_events_person_metric_time (init/062); re-importing an
+# export skips measurements that are already stored. That index only covers
+# rows with a value, so value-less point events (coded results, panels) are
+# matched on person, source, code and time instead.
+MERGE_SQL = f"""
+INSERT INTO analytics.data_events ({_COLS})
+SELECT {_COLS} FROM data_events_stage s
+WHERE s.value_num IS NOT NULL
+   OR s.effective_time IS NULL
+   OR NOT EXISTS (
+     SELECT 1 FROM analytics.data_events e
+     WHERE e.person_id = s.person_id
+       AND e.effective_time = s.effective_time
+       AND e.value_num IS NULL
+       AND e.source IS NOT DISTINCT FROM s.source
+       AND e.code_system IS NOT DISTINCT FROM s.code_system
+       AND e.code IS NOT DISTINCT FROM s.code
+   )
+ON CONFLICT (person_id, code_system, code, effective_time)
+  WHERE value_num IS NOT NULL DO NOTHING
+"""
+
+
+class EventLoader:
+    """COPY rows into analytics.data_events over a single connection.
+
+    Rows are buffered and flushed every batch_size rows (only on flush() when
+    batch_size is None): each flush COPYs into the staging table, merges it,
+    refreshes the lab rollup days it touched and queues the vitals rollup
+    buckets and rule evaluation, all in one transaction.
+
+        with EventLoader(dsn) as loader:
+            for row in rows:
+                loader.add(row)
+    """
+
+    def __init__(self, dsn: Optional[str] = None, batch_size: Optional[int] = 5000):
+        self.dsn = dsn
+        self.batch_size = batch_size
+        self.staged = 0
+        self.inserted = 0
+        self._rows: list = []
+        self._ctx = None
+        self.conn = None
+
+    def __enter__(self):
+        self._ctx = pg(self.dsn)
+        self.conn = self._ctx.__enter__()
+        self.conn.execute(STAGE_SQL)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self._ctx.__exit__(exc_type, exc, tb)
+            self._ctx = self.conn = None
+        return False
+
+    def add(self, row: dict[str, Any]) -> None:
+        self._rows.append(row)
+        if self.batch_size and len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def extend(self, rows) -> None:
+        for row in rows:
+            self.add(row)
+
+    def flush(self, before_commit=None) -> int:
+        """Write buffered rows; returns how many were new.
+
+        before_commit(cur) runs last in the same transaction, even with no
+        rows buffered, so a caller's progress marker commits with the rows.
+        """
+        rows, self._rows = self._rows, []
+        if not rows and before_commit is None:
+            return 0
+        inserted = 0
+        with self.conn.transaction():
+            with self.conn.cursor() as cur:
+                if rows:
+                    with cur.copy(COPY_SQL) as copy:
+                        for row in rows:
+                            copy.write_row([row.get(c) for c in COLUMNS])
+                    cur.execute(MERGE_SQL)
+                    inserted = cur.rowcount
+                    # keep analytics.labs_daily current for lab days in this batch
+                    cur.execute(REFRESH_STAGED_SQL)
+                    # queue vitals/liver rollup buckets (init/064)
+                    cur.execute(MARK_STAGED_SQL)
+                    # and the (person, code) pairs for rule evaluation (init/069)
+                    cur.execute(ingest_eval.MARK_STAGED_SQL)
+                if before_commit is not None:
+                    before_commit(cur)
+        self.staged += len(rows)
+        self.inserted += inserted
+        return inserted
+
 
 def bulk_insert(rows: list[dict[str, Any]], dsn: Optional[str] = None):
+    """Load rows via COPY + merge; returns the number of rows inserted.
+
+    Rows already stored (same person, code and time) are skipped and not
+    counted; this used to return len(rows).
+    """
     if not rows:
         return 0
-    with pg(dsn) as conn:
-        with conn.cursor() as cur:
-            cur.executemany(INSERT_SQL, rows)
-    return len(rows)
+    with EventLoader(dsn, batch_size=max(len(rows), 1)) as loader:
+        loader.extend(rows)
+    return loader.inserted
@@ -1,17 +1,84 @@
+from collections import deque
 from typing import Iterable, Optional, List
 import math
+import operator
+import warnings
+
+try:
+    import numpy as np
+except Exception:  # optional
+    np = None
+
+
+# volatility_array recomputes a window from its values when its centred sums
+# cancel down to less than this share of the sum of squares
+_CANCEL = 1e-6
+
+
+def _check_window(window: int) -> None:
+    if window < 1:
+        raise ValueError("window must be >= 1")
+
+
+class _Trailing:
+    """Aggregate of the last `window` values pushed, amortised O(1) per push.
+
+    Values are grouped in blocks of `window`; the trailing window is a suffix
+    of the previous block merged with a prefix of the current one, so each
+    result is built from that window's values alone. Nothing drifts, and a
+    NaN only reaches the windows that hold it.
+    """
+
+    def __init__(self, window: int, add, merge, empty):
+        _check_window(window)
+        self.window = window
+        self.add, self.merge, self.empty = add, merge, empty
+        self.block: list = []
+        self.prefix = empty
+        # suffixes[k]: aggregate of the previous block from position k on
+        self.suffixes: list = []
+
+    def push(self, x):
+        if len(self.block) == self.window:
+            acc, sufs = self.empty, [None] * self.window
+            for k in range(self.window - 1, -1, -1):
+                acc = sufs[k] = self.add(acc, self.block[k])
+            self.suffixes, self.block, self.prefix = sufs, [], self.empty
+        self.block.append(x)
+        self.prefix = self.add(self.prefix, x)
+        k = len(self.block)
+        if k == self.window or not self.suffixes:
+            return self.prefix
+        return self.merge(self.suffixes[k], self.prefix)
+
+
+def _moments_add(acc, x):
+    n, mean, m2 = acc
+    n += 1
+    d = x - mean
+    mean += d / n
+    return n, mean, m2 + d * (x - mean)
+
+
+def _moments_merge(a, b):
+    na, ma, qa = a
+    nb, mb, qb = b
+    n = na + nb
+    d = mb - ma
+    return n, ma + d * nb / n, qa + qb + d * d * na * nb / n
+
+
+def rolling_moments(window: int) -> _Trailing:
+    """push(x) returns (count, mean, m2) of the last `window` values."""
+    return _Trailing(window, _moments_add, _moments_merge, (0, 0.0, 0.0))
 
 
 def sma(xs: Iterable[float], window: int) -> List[Optional[float]]:
-    xs = list(xs)
-    out: List[Optional[float]] = []
-    for i in range(len(xs)):
-        if i + 1 < window:
-            out.append(None)
-        else:
-            chunk = xs[i + 1 - window : i + 1]
-            out.append(sum(chunk) / window)
-    return out
+    sums = _Trailing(window, operator.add, operator.add, 0.0)
+    return [
+        None if i + 1 < window else total / window
+        for i, total in enumerate(map(sums.push, xs))
+    ]
 
 
 def ema(xs: Iterable[float], alpha: float) -> List[Optional[float]]:
@@ -26,34 +93,165 @@ def ema(xs: Iterable[float], alpha: float) -> List[Optional[float]]:
     return out
 
 
-def rolling_min(xs: List[float], window: int) -> List[Optional[float]]:
+def _rolling_extreme(xs, window: int, better) -> List[Optional[float]]:
+    # monotonic deque of indices; the front is the extreme of the window
+    _check_window(window)
     out: List[Optional[float]] = []
-    for i in range(len(xs)):
-        if i + 1 < window:
-            out.append(None)
-        else:
-            out.append(min(xs[i + 1 - window : i + 1]))
+    q: deque = deque()
+    for i, x in enumerate(xs):
+        while q and not better(xs[q[-1]], x):
+            q.pop()
+        q.append(i)
+        if q[0] <= i - window:
+            q.popleft()
+        out.append(None if i + 1 < window else xs[q[0]])
     return out
 
 
+def rolling_min(xs: List[float], window: int) -> List[Optional[float]]:
+    return _rolling_extreme(list(xs), window, lambda kept, new: kept < new)
+
+
 def rolling_max(xs: List[float], window: int) -> List[Optional[float]]:
-    out: List[Optional[float]] = []
-    for i in range(len(xs)):
-        if i + 1 < window:
-            out.append(None)
-        else:
-            out.append(max(xs[i + 1 - window : i + 1]))
-    return out
+    return _rolling_extreme(list(xs), window, lambda kept, new: kept > new)
 
 
 def volatility(xs: List[float], window: int) -> List[Optional[float]]:
+    """Population standard deviation over a trailing window."""
+    moments = rolling_moments(window)
     out: List[Optional[float]] = []
-    for i in range(len(xs)):
+    for i, x in enumerate(xs):
+        _, _, m2 = moments.push(x)
         if i + 1 < window:
             out.append(None)
         else:
-            chunk = xs[i + 1 - window : i + 1]
-            mean = sum(chunk) / window
-            var = sum((x - mean) ** 2 for x in chunk) / window
-            out.append(math.sqrt(var))
+            # an inf in the window can leave m2 at -inf; NaN like the others
+            out.append(math.sqrt(m2 / window) if m2 >= 0 else math.nan)
+    return out
+
+
+# NumPy backend: 1-D arrays or 2-D (one series per row), windows run along the
+# last axis. Results are float arrays with NaN where the list versions return
+# None; a window containing NaN yields NaN.
+
+
+def _as_array(xs):
+    if np is None:
+        raise RuntimeError("numpy is required for the array backend")
+    return np.asarray(xs, dtype=float)
+
+
+def window_sum(a, window: int):
+    """Sum of every full window along the last axis (length n - window + 1).
+
+    Running sums restart every `window` values: each window is the suffix
+    of one block plus the prefix of the next, so rounding stays of the order
+    of the values in that window instead of the whole series.
+    """
+    n = a.shape[-1]
+    nblocks = -(-n // window)
+    pad = [(0, 0)] * (a.ndim - 1) + [(0, nblocks * window - n)]
+    blocks = np.pad(a, pad).reshape(a.shape[:-1] + (nblocks, window))
+    prefix = np.cumsum(blocks, axis=-1).reshape(a.shape[:-1] + (-1,))[..., :n]
+    suffix = np.cumsum(blocks[..., ::-1], axis=-1)[..., ::-1]
+    suffix = suffix.reshape(a.shape[:-1] + (-1,))[..., : n - window + 1]
+    # a window that starts a block is that block's suffix alone
+    aligned = np.arange(n - window + 1) % window == 0
+    return np.where(aligned, suffix, suffix + prefix[..., window - 1 :])
+
+
+def window_moments(wins):
+    """(mean, m2) of each row of a 2-D array of windows, NaN ignored.
+
+    Rows are taken relative to their last value, so near-flat windows of
+    large values keep their digits and a flat window's m2 is exactly 0.
+    """
+    last = wins[:, -1:]
+    d = wins - last
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN rows
+        dm = np.nanmean(d, axis=-1, keepdims=True)
+    m2 = np.nansum((d - dm) ** 2, axis=-1)
+    return (last + dm)[:, 0], m2
+
+
+def _window_sums(a, window: int):
+    """Centred window sums, sums of squares and NaN counts, and the centre."""
+    nan = np.isnan(a)
+    # centre each series so squared sums keep their precision
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN series
+        centre = np.nanmean(a, axis=-1, keepdims=True)
+    centre = np.where(np.isnan(centre), 0.0, centre)
+    filled = np.where(nan, 0.0, a - centre)
+    pad = [(0, 0)] * (a.ndim - 1) + [(1, 0)]
+    cn = np.pad(np.cumsum(nan, axis=-1), pad)
+    s1 = window_sum(filled, window)
+    s2 = window_sum(filled * filled, window)
+    n_nan = cn[..., window:] - cn[..., :-window]
+    return s1, s2, n_nan, centre
+
+
+def _pad_front(a, vals, window: int):
+    out = np.full(a.shape, np.nan)
+    out[..., window - 1 :] = vals
     return out
+
+
+def sma_array(xs, window: int):
+    _check_window(window)
+    a = _as_array(xs)
+    if a.shape[-1] < window:
+        return np.full(a.shape, np.nan)
+    s1, _, n_nan, centre = _window_sums(a, window)
+    vals = np.where(n_nan > 0, np.nan, s1 / window + centre)
+    return _pad_front(a, vals, window)
+
+
+def volatility_array(xs, window: int):
+    _check_window(window)
+    a = _as_array(xs)
+    if a.shape[-1] < window:
+        return np.full(a.shape, np.nan)
+    s1, s2, n_nan, _ = _window_sums(a, window)
+    m2 = s2 - s1 * (s1 / window)
+    # s2 == 0: every value equals the centre exactly
+    redo = (m2 <= _CANCEL * s2) & (s2 > 0) & (n_nan == 0)
+    if redo.any():
+        wins = np.lib.stride_tricks.sliding_window_view(a, window, axis=-1)
+        m2[redo] = window_moments(wins[redo])[1]
+    vals = np.where(n_nan > 0, np.nan, np.sqrt(np.maximum(m2, 0.0) / window))
+    return _pad_front(a, vals, window)
+
+
+def _extreme_array(xs, window: int, kind: str):
+    # van Herk/Gil-Werman: per-block prefix and suffix extremes, O(n) per series
+    _check_window(window)
+    a = _as_array(xs)
+    op, fill = (np.minimum, np.inf) if kind == "min" else (np.maximum, -np.inf)
+    n = a.shape[-1]
+    if n < window:
+        return np.full(a.shape, np.nan)
+    nblocks = -(-n // window)
+    pad = [(0, 0)] * (a.ndim - 1) + [(0, nblocks * window - n)]
+    blocks = np.pad(a, pad, constant_values=fill).reshape(
+        a.shape[:-1] + (nblocks, window)
+    )
+    prefix = op.accumulate(blocks, axis=-1).reshape(a.shape[:-1] + (-1,))[..., :n]
+    suffix = op.accumulate(blocks[..., ::-1], axis=-1)[..., ::-1]
+    suffix = suffix.reshape(a.shape[:-1] + (-1,))[..., :n]
+    vals = op(suffix[..., : n - window + 1], prefix[..., window - 1 :])
+    return _pad_front(a, vals, window)
+
+
+def rolling_min_array(xs, window: int):
+    return _extreme_array(xs, window, "min")
+
+
+def rolling_max_array(xs, window: int):
+    return _extreme_array(xs, window, "max")
+
+
+def to_optional_list(arr) -> List[Optional[float]]:
+    """1-D array result as a list with None for NaN, like the list versions."""
+    return [None if math.isnan(v) else float(v) for v in arr]
@@ -0,0 +1,236 @@
+"""Set-based FHIR Observation -> analytics.data_events mapping.
+
+A Mapping lists LOINC rules (target unit, SpO2 percent scaling, panel
+components such as the BP panel); compile() turns it into one
+INSERT ... SELECT ... ON CONFLICT statement that reads fhir_raw.resources
+server-side for an imported_at window. run() drives it from a watermark in
+analytics.etl_state, so each run maps only resources imported since the last
+one, in a single round trip.
+
+imported_at is the importing transaction's start time, so a long import can
+commit rows older than a watermark that a concurrent run already stored.
+Each window therefore starts OVERLAP_S before the watermark. Upserts are
+idempotent: re-running a window (run(..., since=...)) rewrites the same rows.
+"""
+
+from dataclasses import dataclass, field
+
+from .db import pg
+from . import generations
+
+# doubled % survives psycopg parameter formatting
+LOINC_SYSTEM = "%%loinc.org"
+
+# re-read this much before the watermark on every run (see module docstring)
+OVERLAP_S = 3600
+
+
+@dataclass(frozen=True)
+class Rule:
+    code: str
+    # unit written to data_events; with keep_unit the source unit wins when present
+    unit: str | None = None
+    keep_unit: bool = False
+    # values above 1.5 are percentages and are divided by 100 (SpO2)
+    percent_to_ratio: bool = False
+    # read from component[] of this panel code instead of the top-level value
+    panel: str | None = None
+
+
+@dataclass(frozen=True)
+class Mapping:
+    name: str
+    source: str
+    rules: tuple
+    # resource fields tried in order for effective_time
+    effective: tuple = ("effectiveDateTime",)
+    # jsonb expression over the resource alias `res`
+    meta_sql: str = "jsonb_build_object('fhir_id', res->>'id')"
+    # merge: keep existing meta keys; replace: overwrite and only touch changed values
+    update: str = "merge"
+    watermark_key: str = field(default="")
+
+    @property
+    def state_key(self) -> str:
+        return self.watermark_key or f"{self.name}_imported_at"
+
+
+def _in_list(codes) -> str:
+    return ", ".join("'" + c.replace("'", "''") + "'" for c in sorted(set(codes)))
+
+
+def _case(rules, expr_for) -> str:
+    whens = "\n".join(f"      WHEN '{r.code}' THEN {expr_for(r)}" for r in rules)
+    return f"CASE code\n{whens}\n    END"
+
+
+def _value_expr(rule: Rule) -> str:
+    if rule.percent_to_ratio:
+        return "CASE WHEN v > 1.5 THEN v / 100.0 ELSE v END"
+    return "v"
+
+
+def _unit_expr(rule: Rule) -> str:
+    target = "NULL" if rule.unit is None else "'" + rule.unit.replace("'", "''") + "'"
+    if rule.keep_unit:
+        return f"COALESCE(NULLIF(unit_in, ''), {target})"
+    return target
+
+
+def compile(mapping: Mapping) -> str:
+    """SQL for mapping; params since, until, overlap_s, person_id.
+
+    Returns (inserted, updated).
+    """
+    direct = [r for r in mapping.rules if not r.panel]
+    comps = [r for r in mapping.rules if r.panel]
+    eff = ", ".join(f"r.resource->>'{f}'" for f in mapping.effective)
+    parts = []
+    if direct:
+        parts.append(f"""
+  SELECT o.imported_at, o.res, o.eff,
+         o.res#>>'{{code,coding,0,code}}' AS code,
+         o.res#>>'{{code,coding,0,display}}' AS display,
+         o.res#>'{{valueQuantity,value}}' AS vq,
+         o.res#>>'{{valueQuantity,unit}}' AS unit_in
+  FROM obs o
+  WHERE lower(o.res#>>'{{code,coding,0,system}}') LIKE '{LOINC_SYSTEM}'
+    AND o.res#>>'{{code,coding,0,code}}' IN ({_in_list(r.code for r in direct)})""")
+    if comps:
+        parts.append(f"""
+  SELECT o.imported_at, o.res, o.eff,
+         c#>>'{{code,coding,0,code}}',
+         c#>>'{{code,coding,0,display}}',
+         c#>'{{valueQuantity,value}}',
+         c#>>'{{valueQuantity,unit}}'
+  FROM obs o
+  CROSS JOIN LATERAL jsonb_array_elements(
+    CASE WHEN jsonb_typeof(o.res->'component') = 'array'
+         THEN o.res->'component' ELSE '[]'::jsonb END) AS c
+  WHERE lower(o.res#>>'{{code,coding,0,system}}') LIKE '{LOINC_SYSTEM}'
+    AND o.res#>>'{{code,coding,0,code}}' IN ({_in_list(r.panel for r in comps)})
+    AND c#>>'{{code,coding,0,code}}' IN ({_in_list(r.code for r in comps)})""")
+    if mapping.update == "merge":
+        meta_set = "COALESCE(analytics.data_events.meta, '{}'::jsonb) || EXCLUDED.meta"
+        where = ""
+    else:
+        meta_set = "EXCLUDED.meta"
+        where = (
+            "\n  WHERE analytics.data_events.value_num"
+            " IS DISTINCT FROM EXCLUDED.value_num"
+        )
+    rules = list(mapping.rules)
+    vals = "\n  UNION ALL".join(parts)
+    return f"""
+WITH obs AS (
+  SELECT r.imported_at, r.resource AS res, COALESCE({eff}) AS eff
+  FROM fhir_raw.resources r
+  WHERE r.resource_type = 'Observation'
+    AND r.imported_at > %(since)s::timestamptz - make_interval(secs => %(overlap_s)s)
+    AND r.imported_at <= %(until)s
+), vals AS ({vals}
+), typed AS (
+  SELECT code, display, unit_in, res, imported_at,
+         CASE WHEN jsonb_typeof(vq) = 'number' THEN vq::float8 END AS v,
+         analytics.try_timestamptz(eff) AS effective_time  -- init/070
+  FROM vals
+), norm AS (
+  -- one row per key: the conflict target may not be hit twice by one statement
+  SELECT DISTINCT ON (code, effective_time)
+    code, display, effective_time, res,
+    {_case(rules, _value_expr)} AS value_num,
+    {_case(rules, _unit_expr)} AS unit
+  FROM typed
+  WHERE v IS NOT NULL AND effective_time IS NOT NULL
+  ORDER BY code, effective_time, imported_at DESC
+), ins AS (
+  INSERT INTO analytics.data_events
+    (person_id, source, kind, code_system, code, display, effective_time,
+     value_num, unit, raw, meta)
+  SELECT %(person_id)s, '{mapping.source}', 'Observation', 'LOINC', code, display,
+         effective_time, value_num, unit, res, {mapping.meta_sql}
+  FROM norm
+  ON CONFLICT (person_id, code_system, code, effective_time)
+    WHERE value_num IS NOT NULL
+  DO UPDATE SET
+    value_num = EXCLUDED.value_num,
+    unit      = EXCLUDED.unit,
+    meta      = {meta_set}{where}
+  RETURNING person_id, code, effective_time, (xmax = 0) AS inserted
+), dirty AS (
+  INSERT INTO analytics.rollup_dirty (person_id, code, day)
+  SELECT DISTINCT person_id, code, (effective_time AT TIME ZONE 'UTC')::date
+  FROM ins
+  WHERE code = ANY (analytics.rollup_codes())
+  ON CONFLICT DO NOTHING
+), touched AS (
+  -- rule evaluation at ingest (init/069); one row, joined below so it runs
+  SELECT analytics.queue_eval(
+    array_agg(person_id), array_agg(code), array_agg(effective_time)
+  )
+  FROM ins
+)
+SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted)
+FROM ins CROSS JOIN touched
+"""
+
+
+WATERMARK_SQL = "SELECT value FROM analytics.etl_state WHERE key = %s"
+
+SET_WATERMARK_SQL = """
+INSERT INTO analytics.etl_state(key, value) VALUES (%s, %s)
+ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+"""
+
+# Upper bound of the window, fixed before mapping so rows imported meanwhile
+# are left for the next run; limit caps how many resources one run covers
+UNTIL_SQL = """
+SELECT max(imported_at) FROM (
+  SELECT imported_at FROM fhir_raw.resources
+  WHERE resource_type = 'Observation' AND imported_at > %s
+  ORDER BY imported_at
+  LIMIT %s
+) w
+"""
+
+EPOCH = "-infinity"
+
+
+def run(
+    mapping: Mapping,
+    person_id: str,
+    dsn: str | None = None,
+    since: str | None = None,
+    limit: int | None = None,
+    overlap_s: float = OVERLAP_S,
+) -> dict:
+    """Map Observations imported after the watermark (or since) in one statement.
+
+    The window also re-reads overlap_s before it; limit counts only resources
+    past the watermark, so every run makes progress.
+    """
+    with pg(dsn) as conn:
+        with conn.transaction():
+            with conn.cursor() as cur:
+                if since is None:
+                    cur.execute(WATERMARK_SQL, (mapping.state_key,))
+                    row = cur.fetchone()
+                    since = row[0] if row and row[0] else EPOCH
+                cur.execute(UNTIL_SQL, (since, limit or None))
+                until = cur.fetchone()[0]
+                if until is None:
+                    return {"inserted": 0, "updated": 0, "watermark": since}
+                cur.execute(
+                    compile(mapping),
+                    {
+                        "since": since,
+                        "until": until,
+                        "overlap_s": overlap_s,
+                        "person_id": person_id,
+                    },
+                )
+                inserted, updated = cur.fetchone()
+                cur.execute(SET_WATERMARK_SQL, (mapping.state_key, until.isoformat()))
+                if inserted or updated:
+                    generations.bump(generations.DATA_EVENTS, cur=cur)
+    return {"inserted": inserted, "updated": updated, "watermark": until.isoformat()}
@@ -0,0 +1,121 @@
+"""Cache generations kept in analytics.etl_state.
+
+Jobs bump a source's generation (``<source>_version``) after they change it;
+cached endpoints fold the current generations into their cache keys, so a
+refresh or ingest makes every older entry unreachable and response TTLs can be
+measured in hours instead of seconds.
+"""
+
+import os
+import threading
+import time
+
+from .db import apg, pg
+
+# Sources with a generation counter. Views use their unqualified name.
+MV_DAILY_VITALS = "mv_daily_vitals"
+DATA_EVENTS = "data_events"
+AI_FINDINGS = "ai_findings"
+LAB_RESULTS = "lab_results"
+
+_memo: dict = {}
+_memo_lock = threading.Lock()
+
+BUMP_SQL = """
+INSERT INTO analytics.etl_state(key, value)
+SELECT k, '1' FROM unnest(%s::text[]) AS k
+ON CONFLICT (key) DO UPDATE SET value = (
+  CASE WHEN analytics.etl_state.value ~ '^[0-9]+$'
+       THEN analytics.etl_state.value::bigint + 1 ELSE 1 END
+)::text
+RETURNING key, value
+"""
+
+SELECT_SQL = "SELECT key, value FROM analytics.etl_state WHERE key = ANY(%s)"
+
+
+def state_key(source: str) -> str:
+    return f"{source.split('.')[-1]}_version"
+
+
+def memo_ttl() -> float:
+    """How long a process trusts generations it has read (HP_CACHE_GEN_TTL)."""
+    return float(os.getenv("HP_CACHE_GEN_TTL", "5"))
+
+
+def response_ttl(default: int = 6 * 3600) -> int:
+    """TTL for generation-keyed responses (HP_CACHE_TTL, seconds)."""
+    return int(os.getenv("HP_CACHE_TTL", str(default)))
+
+
+def bump(*sources: str, dsn: str | None = None, cur=None) -> dict:
+    """Increment the generation of each source; returns {source: new value}.
+
+    Pass ``cur`` to bump inside the caller's transaction so readers never see
+    the new generation before the data it covers.
+    """
+    if not sources:
+        return {}
+    keys = [state_key(s) for s in sources]
+    if cur is None:
+        with pg(dsn) as conn:
+            rows = conn.execute(BUMP_SQL, (keys,)).fetchall()
+    else:
+        cur.execute(BUMP_SQL, (keys,))
+        rows = cur.fetchall()
+    with _memo_lock:
+        _memo.clear()
+    values = dict(rows)
+    return {s: values.get(state_key(s)) for s in sources}
+
+
+def peek(*sources: str) -> dict | None:
+    """Generations remembered by this process, or None once they are stale."""
+    now = time.monotonic()
+    out = {}
+    with _memo_lock:
+        for s in sources:
+            entry = _memo.get(state_key(s))
+            if entry is None or entry[1] < now:
+                return None
+            out[s] = entry[0]
+    return out
+
+
+def remember(values: dict) -> None:
+    """Record generations read elsewhere (e.g. joined into a larger query)."""
+    expires = time.monotonic() + memo_ttl()
+    with _memo_lock:
+        for s, v in values.items():
+            _memo[state_key(s)] = (v, expires)
+
+
+def _from_rows(sources, rows) -> dict:
+    values = {k: v for k, v in rows}
+    return {s: values.get(state_key(s)) for s in sources}
+
+
+def current(*sources: str, dsn: str | None = None) -> dict:
+    gens = peek(*sources)
+    if gens is None:
+        with pg(dsn) as conn:
+            cur = conn.cursor()
+            cur.execute(SELECT_SQL, ([state_key(s) for s in sources],))
+            gens = _from_rows(sources, cur.fetchall())
+        remember(gens)
+    return gens
+
+
+async def acurrent(*sources: str, dsn: str | None = None) -> dict:
+    gens = peek(*sources)
+    if gens is None:
+        async with apg(dsn) as conn:
+            cur = conn.cursor()
+            await cur.execute(SELECT_SQL, ([state_key(s) for s in sources],))
+            gens = _from_rows(sources, await cur.fetchall())
+        remember(gens)
+    return gens
+
+
+def key_fragment(gens: dict) -> str:
+    return "gen=" + ",".join(f"{s}:{gens[s] or 0}" for s in sorted(gens))
@@ -0,0 +1,201 @@
+"""Ingest-time rule evaluation (see init/069_eval_pending.sql).
+
+Writers queue the (person, code) pairs they touched in analytics.eval_pending,
+in the same transaction as the write, through analytics.queue_eval():
+mark_touched() for Python writers, MARK_STAGED_SQL for EventLoader batches,
+direct calls in SQL for the FHIR mapping and the portal merge.
+process() claims queued pairs and runs analytics.anomaly_thresholds plus any
+extra rules (app.hp_etl.rules) over the points written since the pair was
+queued. It only reads back as much history as windowed rules need, and
+writes the hits to analytics.ai_findings. listen() runs process() whenever
+a writer commits.
+
+A finding is keyed by (person, point time, code), so when several rules fire
+on one point the first rule wins: thresholds, then extra rules in order.
+"""
+
+import json
+import logging
+import time
+
+import psycopg
+
+from .db import pg, dsn_from_env
+from . import generations
+from .rules import compile_rules, rules_from_thresholds
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "hp_eval"
+
+MARK_SQL = "SELECT analytics.queue_eval(%s::text[], %s::text[], %s::timestamptz[])"
+
+# Pairs in a data_events_stage batch (app.hp_etl.events)
+MARK_STAGED_SQL = """
+SELECT analytics.queue_eval(array_agg(person_id), array_agg(code), array_agg(since))
+FROM (
+  SELECT person_id, code, min(effective_time) AS since
+  FROM data_events_stage
+  WHERE effective_time IS NOT NULL AND value_num IS NOT NULL
+  GROUP BY person_id, code
+) t
+"""
+
+CLAIM_SQL = """
+DELETE FROM analytics.eval_pending p
+USING (
+  SELECT person_id, code FROM analytics.eval_pending
+  ORDER BY queued_at
+  LIMIT %s
+  FOR UPDATE SKIP LOCKED
+) c
+WHERE p.person_id = c.person_id AND p.code = c.code
+RETURNING p.person_id, p.code, p.since
+"""
+
+THRESHOLDS_SQL = """
+SELECT code, min_val, max_val, reason
+FROM analytics.anomaly_thresholds
+WHERE enabled
+"""
+
+POINTS_SQL = """
+SELECT q.person_id, q.code, e.effective_time, e.value_num
+FROM unnest(%s::text[], %s::text[], %s::timestamptz[]) AS q(person_id, code, since)
+JOIN analytics.data_events e
+  ON e.person_id = q.person_id AND e.code = q.code
+ AND e.effective_time >= q.since - make_interval(secs => %s)
+WHERE e.value_num IS NOT NULL
+ORDER BY 1, 2, 3
+"""
+
+INSERT_SQL = """
+INSERT INTO analytics.ai_findings
+  (person_id, finding_time, metric, method, score, level, "window", context)
+SELECT p, t, m, me, s, l, w, c
+FROM unnest(%s::text[], %s::timestamptz[], %s::text[], %s::text[], %s::float8[],
+            %s::text[], %s::jsonb[], %s::jsonb[]) AS f(p, t, m, me, s, l, w, c)
+ON CONFLICT (person_id, finding_time, metric) DO NOTHING
+"""
+
+
+def mark_touched(cur, points) -> None:
+    """Queue (person_id, code, effective_time) tuples for the next process()."""
+    persons, codes, times = [], [], []
+    for person_id, code, t in points:
+        if person_id and code and t:
+            persons.append(person_id)
+            codes.append(code)
+            times.append(t)
+    if persons:
+        cur.execute(MARK_SQL, (persons, codes, times))
+
+
+def _finding(person_id: str, res: dict) -> tuple:
+    threshold = str(res["rule_id"]).startswith("threshold:")
+    window = {"rule_id": res["rule_id"]}
+    for k in ("agg", "window", "consecutive"):
+        if k in res:
+            window[k] = res[k]
+    ctx = {
+        "value": res["value"],
+        "code": res["metric"],
+        "op": res["op"],
+        "threshold": res["threshold"],
+        "message": res["message"],
+    }
+    return (
+        person_id,
+        res["at"],
+        res["metric"],
+        "threshold" if threshold else "rule",
+        float(res["value"]),
+        res["level"] or "warn",
+        json.dumps(window),
+        json.dumps(ctx),
+    )
+
+
+def evaluate(ruleset, claimed, rows) -> list:
+    """ai_findings rows for claimed (person, code, since) pairs.
+
+    rows are POINTS_SQL results, ordered by person, code and time; points
+    before `since` only warm up windowed rules.
+    """
+    since = {(p, c): s for p, c, s in claimed}
+    out = []
+    state, key = None, None
+    for person_id, code, t, v in rows:
+        if (person_id, code) != key:
+            key, state = (person_id, code), ruleset.state()
+        hits = state.push(code, t, v)
+        if hits and t >= since[key]:
+            out.extend(_finding(person_id, res) for _, res in hits)
+    return out
+
+
+def process(dsn: str | None = None, rules=None, limit: int = 1000) -> tuple:
+    """Evaluate up to limit queued pairs; returns (pairs claimed, findings written)."""
+    with pg(dsn) as conn:
+        with conn.transaction():
+            with conn.cursor() as cur:
+                cur.execute(CLAIM_SQL, (limit,))
+                claimed = cur.fetchall()
+                n = len(claimed)
+                if not claimed:
+                    return 0, 0
+                cur.execute(THRESHOLDS_SQL)
+                ruleset = compile_rules(
+                    rules_from_thresholds(cur.fetchall()) + list(rules or [])
+                )
+                # pairs without rules are just dropped from the queue
+                claimed = [q for q in claimed if q[1] in ruleset.by_metric]
+                if not claimed:
+                    return n, 0
+                # consecutive-day rules may need the start of the first day too
+                lookback = ruleset.lookback_s
+                if any(r.consecutive for r in ruleset.rules):
+                    lookback += 86400
+                cur.execute(POINTS_SQL, (*map(list, zip(*claimed)), lookback))
+                found = evaluate(ruleset, claimed, cur.fetchall())
+                written = 0
+                if found:
+                    cur.execute(INSERT_SQL, tuple(map(list, zip(*found))))
+                    written = cur.rowcount
+                if written:
+                    generations.bump(generations.AI_FINDINGS, cur=cur)
+    return n, written
+
+
+def _drain(dsn, rules, limit) -> None:
+    try:
+        claimed, written = process(dsn, rules, limit)
+        while claimed:
+            if written:
+                logger.info("eval: %d pairs, %d findings", claimed, written)
+            claimed, written = process(dsn, rules, limit)
+    except Exception:
+        # the failed pass rolled back, so its pairs stay queued for the next one
+        logger.exception("eval pass failed")
+
+
+def listen(dsn: str | None = None, rules=None, limit: int = 1000, poll_s: float = 60.0):
+    """Process the queue on every NOTIFY hp_eval (and every poll_s); never returns.
+
+    A failed pass is logged and retried on the next wakeup; a lost LISTEN
+    connection is reopened after poll_s.
+    """
+    while True:
+        try:
+            with psycopg.connect(dsn or dsn_from_env(), autocommit=True) as conn:
+                conn.execute(f"LISTEN {CHANNEL}")
+                while True:
+                    t0 = time.monotonic()
+                    _drain(dsn, rules, limit)
+                    for _ in conn.notifies(timeout=poll_s, stop_after=1):
+                        pass
+                    # let a burst of small commits coalesce into one pass
+                    time.sleep(max(0.0, 0.2 - (time.monotonic() - t0)))
+        except psycopg.OperationalError:
+            logger.exception("eval listener lost its connection")
+            time.sleep(poll_s)
@@ -0,0 +1,30 @@
+"""Maintenance of analytics.labs_daily (see init/063_labs_daily.sql).
+
+Ingest paths call analytics.labs_daily_refresh() with the event times they
+wrote (EventLoader through REFRESH_STAGED_SQL, the portal merges directly), so
+only the touched person/days are recomputed; rebuild() recomputes everything.
+"""
+
+from .db import pg
+
+REBUILD_SQL = "SELECT analytics.labs_daily_rebuild()"
+
+# Touched lab days in a data_events_stage batch (app.hp_etl.events), one call
+# per person; batches without catalogued lab codes do no rollup work.
+REFRESH_STAGED_SQL = """
+SELECT analytics.labs_daily_refresh(s.person_id, array_agg(s.effective_time))
+FROM data_events_stage s
+WHERE s.value_num IS NOT NULL
+  AND s.effective_time IS NOT NULL
+  AND EXISTS (
+    SELECT 1 FROM analytics.labs_metric_catalog c
+    WHERE s.code_system ILIKE c.code_system AND s.code = c.code AND c.enabled
+  )
+GROUP BY s.person_id
+"""
+
+
+def rebuild(dsn: str | None = None) -> int:
+    with pg(dsn) as conn:
+        with conn.transaction():
+            return conn.execute(REBUILD_SQL).fetchone()[0] or 0
@@ -1,6 +1,9 @@
+import math
+from bisect import bisect_left
 from dataclasses import dataclass
-from typing import Optional, List
-from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, List
+from datetime import date, datetime, timedelta, timezone
 
 
 @dataclass
@@ -65,54 +68,201 @@ def expand_schedule(plan: MedPlan) -> List[DoseExpectation]:
     return doses
 
 
+# Events are matched 1:1 to doses in due_at order: the earliest unused event
+# in [window_start, window_end] is on time, else the earliest unused event up
+# to LATE_H hours after window_end is late, else the dose is missed.
+LATE_H = 12
+
+# score_plans refuses to expand more doses than this in one call
+MAX_DOSES = 200_000
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def epoch_s(v) -> float:
+    """Epoch seconds of an ISO string or datetime (naive means UTC)."""
+    dt = parse_isoz(v) if isinstance(v, str) else v
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+@lru_cache(maxsize=4096)
+def _day(days: int) -> str:
+    return date.fromordinal(_EPOCH_ORDINAL + days).isoformat()
+
+
+def _isoz_epoch(t: float) -> str:
+    """isoformatz() of epoch seconds without building a datetime."""
+    days, secs = divmod(math.floor(t), 86400)
+    return f"{_day(days)}T{secs // 3600:02d}:{secs // 60 % 60:02d}:{secs % 60:02d}Z"
+
+
+class _Events:
+    """One medication's events sorted by time; next_free() skips used ones."""
+
+    def __init__(self):
+        self.times: List[float] = []
+        self.taken: List[str] = []
+        self._next: List[int] = []
+
+    def freeze(self):
+        order = sorted(range(len(self.times)), key=self.times.__getitem__)
+        self.times = [self.times[i] for i in order]
+        self.taken = [self.taken[i] for i in order]
+        self._next = list(range(len(self.times) + 1))
+
+    def next_free(self, i: int) -> int:
+        # union-find with path halving over "next unused index at or after i"
+        nxt = self._next
+        while nxt[i] != i:
+            nxt[i] = nxt[nxt[i]]
+            i = nxt[i]
+        return i
+
+    def take(self, lo: float, hi: float) -> Optional[str]:
+        """Earliest unused event with lo <= t <= hi, marked used."""
+        i = self.next_free(bisect_left(self.times, lo))
+        if i < len(self.times) and self.times[i] <= hi:
+            self._next[i] = i + 1
+            return self.taken[i]
+        return None
+
+
+def _index_events(events: Iterable[MedEvent]) -> Dict[str, _Events]:
+    by_med: Dict[str, _Events] = {}
+    for ev in events:
+        idx = by_med.setdefault(ev.med_id, _Events())
+        t = epoch_s(ev.taken_at)
+        idx.times.append(t)
+        idx.taken.append(
+            ev.taken_at if isinstance(ev.taken_at, str) else _isoz_epoch(t)
+        )
+    for idx in by_med.values():
+        idx.freeze()
+    return by_med
+
+
+def _score(idx: Optional[_Events], med_id, due_at, ws, we) -> DoseScore:
+    if idx is not None:
+        taken = idx.take(ws, we)
+        if taken is not None:
+            return DoseScore(med_id, due_at, "on_time", taken)
+        # nothing unused is left inside the window, so the next one is after it
+        taken = idx.take(we, we + LATE_H * 3600)
+        if taken is not None:
+            return DoseScore(med_id, due_at, "late", taken)
+    return DoseScore(med_id, due_at, "missed", None)
+
+
 def score_adherence(
     expectations: List[DoseExpectation], events: List[MedEvent]
 ) -> List[DoseScore]:
-    # Greedy 1:1 matching of events to expectations by due_at ascending
-    sorted_exp = sorted(expectations, key=lambda d: d.due_at)
-    sorted_ev = sorted(events, key=lambda e: e.taken_at)
-    used_ev_indices = set()
-    scores = []
-
-    for dose in sorted_exp:
-        # due_dt not used directly; keep for readability
-        _due_dt = parse_isoz(dose.due_at)
-        window_end_dt = parse_isoz(dose.window_end)
-        matched_ev = None
-
-        # find first event within window_start..window_end AND not used
-        for i, ev in enumerate(sorted_ev):
-            if i in used_ev_indices:
-                continue
-            ev_dt = parse_isoz(ev.taken_at)
-            if ev.med_id != dose.med_id:
-                continue
-            if parse_isoz(dose.window_start) <= ev_dt <= window_end_dt:
-                matched_ev = ev
-                used_ev_indices.add(i)
-                break
-        if matched_ev:
-            scores.append(
-                DoseScore(dose.med_id, dose.due_at, "on_time", matched_ev.taken_at)
-            )
+    # Greedy 1:1 matching of events to expectations by due_at ascending;
+    # timestamps are parsed once, O((doses + events) log events)
+    by_med = _index_events(events)
+    return [
+        _score(
+            by_med.get(dose.med_id),
+            dose.med_id,
+            dose.due_at,
+            epoch_s(dose.window_start),
+            epoch_s(dose.window_end),
+        )
+        for dose in sorted(expectations, key=lambda d: d.due_at)
+    ]
+
+
+def plan_from_dict(d) -> MedPlan:
+    """MedPlan from untrusted input (e.g. a request body); ValueError if invalid."""
+    if not isinstance(d, dict):
+        raise ValueError("plan must be an object")
+    med_id = d.get("med_id")
+    if not isinstance(med_id, str) or not med_id:
+        raise ValueError("med_id must be a non-empty string")
+    ints = {}
+    for key, default, lo in (("interval_h", None, 1), ("window_min", 60, 0)):
+        v = d.get(key, default)
+        if isinstance(v, bool) or not isinstance(v, int) or v < lo:
+            raise ValueError(f"{med_id}: {key} must be an integer >= {lo}")
+        ints[key] = v
+    times = {}
+    for key in ("start", "end"):
+        v = d.get(key)
+        if v is None and key == "end":
+            times[key] = None
             continue
+        try:
+            times[key] = epoch_s(v) if isinstance(v, str) else None
+        except ValueError:
+            times[key] = None
+        if times[key] is None:
+            raise ValueError(f"{med_id}: {key} must be an ISO 8601 timestamp")
+    if times["end"] is not None and times["end"] < times["start"]:
+        raise ValueError(f"{med_id}: end is before start")
+    return MedPlan(
+        med_id=med_id,
+        name=str(d.get("name") or med_id),
+        start=d["start"],
+        end=d.get("end"),
+        **ints,
+    )
+
+
+def score_plans(
+    plans: Iterable[MedPlan],
+    events: Iterable[MedEvent],
+    until: Optional[datetime] = None,
+    max_doses: int = MAX_DOSES,
+) -> Dict[str, List[DoseScore]]:
+    """Score many plans against one event list: {med_id: [DoseScore, ...]}.
+
+    Schedules are generated as epoch offsets rather than DoseExpectation
+    strings. With `until`, only doses whose late window has closed by then
+    are scored, so future and still-open doses are not counted as missed;
+    without it open-ended plans run 30 days as in expand_schedule. Raises
+    ValueError for a non-positive interval or when the plans expand to more
+    than max_doses doses.
+    """
+    by_med = _index_events(events)
+    doses = []
+    for plan in plans:
+        start = epoch_s(plan.start)
+        end = epoch_s(plan.end) if plan.end else None
+        if until is not None:
+            due_by = epoch_s(until) - plan.window_min * 60 - LATE_H * 3600
+            end = due_by if end is None else min(end, due_by)
+        elif end is None:
+            end = start + 30 * 86400
+        if not plan.interval_h > 0:
+            raise ValueError(f"{plan.med_id}: interval_h must be > 0")
+        step = plan.interval_h * 3600
+        n = int((end - start) // step) + 1 if end >= start else 0
+        if len(doses) + n > max_doses:
+            raise ValueError(f"more than {max_doses} doses; shorten the plans")
+        doses.extend(
+            (start + k * step, plan.med_id, plan.window_min * 60) for k in range(n)
+        )
+    # plans sharing a med_id compete for its events in due order
+    doses.sort(key=lambda d: d[0])
+    out: Dict[str, List[DoseScore]] = {}
+    for due, med_id, window in doses:
+        due_at = _isoz_epoch(due)
+        out.setdefault(med_id, []).append(
+            _score(by_med.get(med_id), med_id, due_at, due - window, due + window)
+        )
+    return out
+
 
-        # find first event after window_end within +12h as 'late'
-        late_deadline = window_end_dt + timedelta(hours=12)
-        late_ev = None
-        for i, ev in enumerate(sorted_ev):
-            if i in used_ev_indices:
-                continue
-            ev_dt = parse_isoz(ev.taken_at)
-            if ev.med_id != dose.med_id:
-                continue
-            if window_end_dt < ev_dt <= late_deadline:
-                late_ev = ev
-                used_ev_indices.add(i)
-                break
-        if late_ev:
-            scores.append(DoseScore(dose.med_id, dose.due_at, "late", late_ev.taken_at))
-        else:
-            scores.append(DoseScore(dose.med_id, dose.due_at, "missed", None))
-
-    return scores
+def summarize(scores: List[DoseScore]) -> dict:
+    counts = {"on_time": 0, "late": 0, "missed": 0}
+    for s in scores:
+        counts[s.status] += 1
+    total = len(scores)
+    taken = counts["on_time"] + counts["late"]
+    return {
+        **counts,
+        "total": total,
+        "adherence": taken / total if total else None,
+        "on_time_rate": counts["on_time"] / total if total else None,
+    }
@@ -0,0 +1,260 @@
+"""Dependency-aware, parallel refresh of materialized views.
+
+refresh_all() reads the dependency graph from the catalog, refreshes views
+whose upstream views are done in parallel (one pooled connection each) and
+skips views whose source tables show no writes since their last refresh. Every
+view gets a row in analytics.mv_refresh_runs (init/065) with its status,
+duration and row count; analytics.v_mv_refresh_latest flags regressions.
+
+Change detection uses the cumulative insert/update/delete counters in
+pg_stat_all_tables (summed over partitions). Counters are flushed at commit
+and may lag by about a second; a stats reset changes them and forces a
+refresh, never a skip.
+"""
+
+import os
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Optional
+
+from .db import pg
+
+# Names come back schema-qualified, so callers pass "schema.view".
+# Relations each view reads, looking through plain views to the tables,
+# partitioned tables and materialized views underneath.
+DEPS_SQL = """
+WITH RECURSIVE dep AS (
+  SELECT r.ev_class AS mv, d.refobjid AS ref
+  FROM pg_rewrite r
+  JOIN pg_depend d
+    ON d.classid = 'pg_rewrite'::regclass AND d.objid = r.oid
+   AND d.refclassid = 'pg_class'::regclass AND d.refobjid <> r.ev_class
+  WHERE r.ev_class = ANY (%s::regclass[])
+  UNION
+  SELECT dep.mv, d.refobjid
+  FROM dep
+  JOIN pg_class v ON v.oid = dep.ref AND v.relkind = 'v'
+  JOIN pg_rewrite r ON r.ev_class = v.oid
+  JOIN pg_depend d
+    ON d.classid = 'pg_rewrite'::regclass AND d.objid = r.oid
+   AND d.refclassid = 'pg_class'::regclass AND d.refobjid <> r.ev_class
+)
+SELECT mn.nspname || '.' || m.relname, cn.nspname || '.' || c.relname, c.relkind::text
+FROM dep
+JOIN pg_class m ON m.oid = dep.mv
+JOIN pg_namespace mn ON mn.oid = m.relnamespace
+JOIN pg_class c ON c.oid = dep.ref
+JOIN pg_namespace cn ON cn.oid = c.relnamespace
+WHERE c.relkind IN ('r', 'p', 'm')
+"""
+
+# CONCURRENTLY needs a populated view with a plain unique index
+CONCURRENT_OK_SQL = """
+SELECT n.nspname || '.' || c.relname,
+       c.relispopulated AND EXISTS (
+         SELECT 1 FROM pg_index i
+         WHERE i.indrelid = c.oid AND i.indisunique
+           AND i.indpred IS NULL AND i.indexprs IS NULL
+       )
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.oid = ANY (%s::regclass[])
+"""
+
+SIG_SQL = """
+SELECT t.rel, sum(s.n_tup_ins + s.n_tup_upd + s.n_tup_del)
+FROM unnest(%s::text[]) AS t(rel)
+CROSS JOIN LATERAL pg_partition_tree(t.rel::regclass) p
+JOIN pg_stat_all_tables s ON s.relid = p.relid
+GROUP BY t.rel
+"""
+
+LAST_SIG_SQL = """
+SELECT DISTINCT ON (view_name) view_name, sources_sig
+FROM analytics.mv_refresh_runs
+WHERE view_name = ANY (%s) AND status <> 'failed'
+ORDER BY view_name, started_at DESC
+"""
+
+LOG_SQL = """
+INSERT INTO analytics.mv_refresh_runs
+  (run_id, view_name, status, started_at, duration_ms, row_count, sources_sig, error)
+VALUES (%s, %s, %s, to_timestamp(%s), %s, %s, %s, %s)
+"""
+
+REGRESSED_SQL = """
+SELECT view_name, duration_ms, baseline_p50_ms
+FROM analytics.v_mv_refresh_latest
+WHERE regressed AND view_name = ANY (%s)
+ORDER BY view_name
+"""
+
+
+@dataclass
+class Result:
+    view: str
+    status: str
+    started: float = 0.0
+    duration_ms: Optional[float] = None
+    row_count: Optional[int] = None
+    sig: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def refreshed(self) -> bool:
+        return self.status in ("concurrent", "exclusive", "exclusive_fallback")
+
+
+def default_workers() -> int:
+    # each worker holds a pooled connection; keep under HP_DB_POOL_MAX
+    return int(os.getenv("HP_MV_REFRESH_WORKERS", "4"))
+
+
+def load_graph(cur, views) -> dict:
+    """{view: {source: relkind}} for the given views."""
+    graph = {v: {} for v in views}
+    cur.execute(DEPS_SQL, (list(views),))
+    for view, ref, kind in cur.fetchall():
+        graph.setdefault(view, {})[ref] = kind
+    return graph
+
+
+def signature(sources: dict, counters: dict) -> str:
+    return ",".join(f"{s}={counters.get(s)}" for s in sorted(sources))
+
+
+def refresh_one(
+    view: str, concurrent: bool, dsn: str | None = None, fallback: bool = True
+) -> Result:
+    res = Result(view, "failed", started=time.time())
+    t0 = time.perf_counter()
+    with pg(dsn) as conn:
+        if concurrent:
+            try:
+                conn.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
+                res.status = "concurrent"
+            except Exception as e:
+                res.error = str(e).strip()
+        if res.status == "failed" and (not concurrent or fallback):
+            try:
+                conn.execute(f"REFRESH MATERIALIZED VIEW {view}")
+                res.status = "exclusive_fallback" if concurrent else "exclusive"
+            except Exception as e:
+                res.error = str(e).strip()
+        res.duration_ms = (time.perf_counter() - t0) * 1000.0
+        if res.refreshed:
+            res.row_count = conn.execute(f"SELECT count(*) FROM {view}").fetchone()[0]
+    return res
+
+
+def refresh_all(
+    views,
+    dsn: str | None = None,
+    workers: int | None = None,
+    force: bool = False,
+    fallback: bool = True,
+) -> list[Result]:
+    """Refresh views in dependency order, in parallel; returns one Result per view.
+
+    A view is refreshed when force is set, when an upstream view was refreshed
+    in this run, or when its source tables changed since its last refresh.
+    fallback=False records a failed CONCURRENTLY refresh instead of retrying it
+    under an exclusive lock.
+    """
+    views = list(dict.fromkeys(views))
+    run_id = uuid.uuid4().hex
+    with pg(dsn) as conn, conn.cursor() as cur:
+        graph = load_graph(cur, views)
+        cur.execute(CONCURRENT_OK_SQL, (views,))
+        concurrent_ok = dict(cur.fetchall())
+        tables = sorted({s for srcs in graph.values() for s in srcs if s not in graph})
+        cur.execute(SIG_SQL, (tables,))
+        counters = {rel: int(n or 0) for rel, n in cur.fetchall()}
+        cur.execute(LAST_SIG_SQL, (views,))
+        last = dict(cur.fetchall())
+
+    upstream = {v: {s for s in graph[v] if s in graph and s != v} for v in views}
+    results: dict[str, Result] = {}
+    running = {}
+    pending = list(views)
+
+    with ThreadPoolExecutor(max_workers=workers or default_workers()) as pool:
+        while pending or running:
+            # skips resolve immediately and may unblock views earlier in the list
+            ready = [v for v in pending if upstream[v] <= results.keys()]
+            while ready:
+                view = ready.pop(0)
+                ups = upstream[view]
+                pending.remove(view)
+                sig = signature({s for s in graph[view] if s not in graph}, counters)
+                failed = sorted(u for u in ups if results[u].status == "failed")
+                if failed:
+                    results[view] = Result(
+                        view,
+                        "failed",
+                        started=time.time(),
+                        error=f"upstream failed: {', '.join(failed)}",
+                    )
+                elif (
+                    not force
+                    and last.get(view) == sig
+                    and not any(results[u].refreshed for u in ups)
+                ):
+                    results[view] = Result(
+                        view, "skipped", started=time.time(), sig=sig
+                    )
+                else:
+                    fut = pool.submit(
+                        refresh_one, view, bool(concurrent_ok.get(view)), dsn, fallback
+                    )
+                    running[fut] = (view, sig)
+                if not ready:
+                    ready = [v for v in pending if upstream[v] <= results.keys()]
+            if not running:
+                # whatever is left waits on itself
+                for view in pending:
+                    results[view] = Result(
+                        view, "failed", started=time.time(), error="dependency cycle"
+                    )
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                view, sig = running.pop(fut)
+                try:
+                    res = fut.result()
+                except Exception as e:
+                    res = Result(view, "failed", started=time.time(), error=str(e))
+                res.sig = sig if res.refreshed else None
+                results[view] = res
+
+    out = [results[v] for v in views]
+    log(out, run_id, dsn)
+    return out
+
+
+def log(results, run_id: str, dsn: str | None = None) -> None:
+    with pg(dsn) as conn, conn.cursor() as cur:
+        cur.executemany(
+            LOG_SQL,
+            [
+                (
+                    run_id,
+                    r.view,
+                    r.status,
+                    r.started,
+                    r.duration_ms,
+                    r.row_count,
+                    r.sig,
+                    r.error,
+                )
+                for r in results
+            ],
+        )
+
+
+def regressions(views, dsn: str | None = None) -> list:
+    """(view, duration_ms, baseline_p50_ms) for views whose last refresh regressed."""
+    with pg(dsn) as conn:
+        return conn.execute(REGRESSED_SQL, (list(views),)).fetchall()
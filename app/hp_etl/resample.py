@@ -1,6 +1,12 @@
+import re
 from dataclasses import dataclass
-from datetime import datetime, timezone
-from typing import Callable, Iterable, Optional, List
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Callable, Iterable, Optional, List, Sequence
+
+try:
+    import numpy as np
+except Exception:  # optional
+    np = None
 
 
 def parse_isoz(s: str) -> datetime:
@@ -48,18 +54,223 @@ def agg_mean(xs: list[float]) -> Optional[float]:
     return sum(xs) / len(xs)
 
 
+# Columnar engine: timestamps are int64 epoch nanoseconds, values float64.
+# Buckets are multiples of the frequency since the epoch, in UTC or, with tz,
+# in local wall time (so "1d" is a local calendar day); bucket labels are the
+# UTC instant the bucket starts.
+
+NS = {
+    "ns": 1,
+    "us": 10**3,
+    "ms": 10**6,
+    "s": 10**9,
+    "min": 60 * 10**9,
+    "h": 3600 * 10**9,
+    "d": 86400 * 10**9,
+    "w": 7 * 86400 * 10**9,
+}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_FREQ_RE = re.compile(r"^(\d*)(ns|us|ms|s|min|h|d|w)$")
+_TZ_SUFFIX = re.compile(r"(Z|[+-]\d\d:?\d\d)$")
+
+AGGS = ("mean", "min", "max", "median", "count", "sum")
+
+
+def freq_ns(freq: str) -> int:
+    """Bucket width in ns for '1min', '15min', '2h', '1d', '1w', ..."""
+    m = _FREQ_RE.match(freq.strip())
+    if not m or m.group(1) == "0":
+        raise ValueError(f"Unsupported freq: {freq}")
+    return int(m.group(1) or 1) * NS[m.group(2)]
+
+
+def _quantile(agg: str) -> Optional[float]:
+    if agg == "median":
+        return 0.5
+    if re.fullmatch(r"p\d{1,2}(\.\d+)?", agg):
+        return float(agg[1:]) / 100.0
+    if agg not in AGGS:
+        raise ValueError(f"Unsupported agg: {agg}")
+    return None
+
+
+def _as_tz(tz) -> Optional[tzinfo]:
+    if tz is None or isinstance(tz, tzinfo):
+        return tz
+    from zoneinfo import ZoneInfo
+
+    return ZoneInfo(tz)
+
+
+def _offset_ns(t_ns: int, tz: tzinfo) -> int:
+    dt = datetime.fromtimestamp(t_ns // 10**9, tz)
+    return int(dt.utcoffset() / timedelta(microseconds=1)) * 1000
+
+
+def _tz_changes(lo: int, hi: int, tz: tzinfo):
+    """(starts, offsets): offsets[i] applies from starts[i] until starts[i + 1].
+
+    Offsets are probed once a day and each change is bisected to the second,
+    so a year of data costs a few hundred tzinfo calls.
+    """
+    day = NS["d"]
+    t = lo - day
+    off = _offset_ns(t, tz)
+    starts, offs = [t], [off]
+    while t < hi + day:
+        nxt = t + day
+        o = _offset_ns(nxt, tz)
+        if o != off:
+            a, b = t, nxt  # offset changes in (a, b]
+            while b - a > 10**9:
+                mid = a + (b - a) // 2
+                if _offset_ns(mid, tz) == off:
+                    a = mid
+                else:
+                    b = mid
+            starts.append(b - b % 10**9)
+            offs.append(o)
+            off = o
+        t = nxt
+    return np.array(starts, dtype=np.int64), np.array(offs, dtype=np.int64)
+
+
+def bucket_ns(ts_ns, freq: str, tz=None):
+    """Bucket start (UTC epoch ns) of each timestamp."""
+    if np is None:
+        raise RuntimeError("numpy is required for bucket_ns")
+    step = freq_ns(freq)
+    ts = np.asarray(ts_ns, dtype=np.int64)
+    tz = _as_tz(tz)
+    if tz is None or ts.size == 0:
+        return ts - ts % step
+    starts, offs = _tz_changes(int(ts.min()) - step, int(ts.max()), tz)
+
+    def offset_at(t):
+        return offs[np.maximum(np.searchsorted(starts, t, side="right") - 1, 0)]
+
+    local = ts + offset_at(ts)
+    local -= local % step
+    # the bucket's own start may sit on the other side of a DST change
+    return local - offset_at(local - offset_at(ts))
+
+
+def resample_arrays(
+    ts_ns,
+    values,
+    freq: str,
+    aggs: Sequence[str] = ("mean",),
+    tz=None,
+) -> dict:
+    """Bucket and aggregate in one pass.
+
+    Returns {"ts": bucket starts (epoch ns), agg: values, ...} for the buckets
+    that hold at least one non-NaN value, in time order. aggs are any of
+    mean, min, max, median, count, sum and pNN (p90, p99.9, ...); quantiles
+    interpolate linearly like numpy.percentile.
+    """
+    if np is None:
+        raise RuntimeError("numpy is required for resample_arrays")
+    qs = {a: _quantile(a) for a in aggs}
+    ts = np.asarray(ts_ns, dtype=np.int64)
+    v = np.asarray(values, dtype=float)
+    keep = ~np.isnan(v)
+    ts, v = ts[keep], v[keep]
+    keys = bucket_ns(ts, freq, tz)
+    if not keys.size:
+        empty = np.zeros(0)
+        return {"ts": keys, **{a: empty for a in aggs}}
+    # quantiles need each bucket's values sorted; the rest only need grouping
+    if any(q is not None for q in qs.values()):
+        order = np.lexsort((v, keys))
+    elif np.any(keys[1:] < keys[:-1]):
+        order = np.argsort(keys, kind="stable")
+    else:
+        order = None
+    if order is not None:
+        keys, v = keys[order], v[order]
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    counts = np.diff(np.r_[starts, keys.size])
+    out = {"ts": keys[starts]}
+    for agg, q in qs.items():
+        if agg == "sum":
+            out[agg] = np.add.reduceat(v, starts)
+        elif agg == "mean":
+            out[agg] = np.add.reduceat(v, starts) / counts
+        elif agg == "count":
+            out[agg] = counts
+        elif agg == "min":
+            out[agg] = np.minimum.reduceat(v, starts)
+        elif agg == "max":
+            out[agg] = np.maximum.reduceat(v, starts)
+        else:
+            pos = starts + q * (counts - 1)
+            lo = np.floor(pos).astype(np.int64)
+            hi = np.minimum(lo + 1, starts + counts - 1)
+            out[agg] = v[lo] + (pos - lo) * (v[hi] - v[lo])
+    return out
+
+
+def epoch_ns(timestamps: Sequence[str]):
+    """ISO strings to int64 epoch ns; UTC or naive strings are parsed by NumPy."""
+    if np is None:
+        raise RuntimeError("numpy is required for epoch_ns")
+    if not any(_TZ_SUFFIX.search(s[10:]) and not s.endswith("Z") for s in timestamps):
+        bare = [s[:-1] if s.endswith("Z") else s for s in timestamps]
+        return np.array(bare, dtype="datetime64[ns]").astype(np.int64)
+    return np.array(
+        [
+            (parse_isoz(s) - _EPOCH) // timedelta(microseconds=1) * 1000
+            for s in timestamps
+        ],
+        dtype=np.int64,
+    )
+
+
+def isoz_ns(ts_ns) -> List[str]:
+    secs = np.asarray(ts_ns, dtype=np.int64) // 10**9
+    return [s + "Z" for s in np.datetime_as_string(secs.astype("datetime64[s]"))]
+
+
+def _floor_py(dt: datetime, step: int, tz) -> datetime:
+    step_us = step // 1000
+    if tz is None:
+        us = (dt - _EPOCH) // timedelta(microseconds=1)
+        return _EPOCH + timedelta(microseconds=us - us % step_us)
+    local = dt.astimezone(tz).replace(tzinfo=None)
+    us = (local - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+    start = datetime(1970, 1, 1) + timedelta(microseconds=us - us % step_us)
+    return start.replace(tzinfo=tz).astimezone(timezone.utc)
+
+
 def resample(
     points: Iterable[Point],
     freq: str,
     agg: Callable[[list[float]], Optional[float]] = agg_mean,
+    tz=None,
 ) -> List[Point]:
-    """Bin by floored UTC time, aggregate values per bin."""
+    """Bin by floored UTC time (local time with tz), aggregate values per bin.
+
+    agg may be a callable over each bin's values or the name of a
+    resample_arrays aggregate ("max", "p90", ...). Named aggregates and
+    agg_mean run on the columnar engine when NumPy is installed.
+    """
+    points = [p for p in points if p.v is not None]
+    name = "mean" if agg is agg_mean else agg if isinstance(agg, str) else None
+    if np is not None and name is not None:
+        res = resample_arrays(
+            epoch_ns([p.ts for p in points]), [p.v for p in points], freq, [name], tz
+        )
+        return [Point(t, float(v)) for t, v in zip(isoz_ns(res["ts"]), res[name])]
+    if isinstance(agg, str):
+        raise RuntimeError("numpy is required for named aggregates")
+    step = freq_ns(freq)
+    tz = _as_tz(tz)
     buckets = {}
     for p in points:
-        if p.v is None:
-            continue
-        dt = parse_isoz(p.ts)
-        key = floor_dt(dt, freq)
+        key = _floor_py(parse_isoz(p.ts), step, tz)
         buckets.setdefault(key, []).append(p.v)
     out = [Point(isoz(k), agg(vs)) for k, vs in sorted(buckets.items())]
     return out
@@ -0,0 +1,61 @@
+"""Incremental vitals/liver rollups (see init/064_vitals_rollups.sql).
+
+Writers queue the (person, code, day) buckets they touched in
+analytics.rollup_dirty; process() recomputes just those buckets. The
+mv_daily_vitals, mv_spo2_daily_pct, mv_hr_hourly and mv_liver_daily views read
+the rollups, so they never need a full REFRESH.
+"""
+
+from .db import pg
+from . import generations
+
+MARK_SQL = """
+INSERT INTO analytics.rollup_dirty (person_id, code, day)
+SELECT DISTINCT p, c, (t AT TIME ZONE 'UTC')::date
+FROM unnest(%s::text[], %s::text[], %s::timestamptz[]) AS u(p, c, t)
+WHERE t IS NOT NULL AND c = ANY (analytics.rollup_codes())
+ON CONFLICT DO NOTHING
+"""
+
+# Buckets in a data_events_stage batch (app.hp_etl.events)
+MARK_STAGED_SQL = """
+INSERT INTO analytics.rollup_dirty (person_id, code, day)
+SELECT DISTINCT person_id, code, (effective_time AT TIME ZONE 'UTC')::date
+FROM data_events_stage
+WHERE effective_time IS NOT NULL AND code = ANY (analytics.rollup_codes())
+ON CONFLICT DO NOTHING
+"""
+
+PROCESS_SQL = "SELECT analytics.rollup_process_dirty(%s)"
+
+# Views whose cached responses go stale when buckets are recomputed
+VIEWS = (
+    generations.MV_DAILY_VITALS,
+    "analytics.mv_spo2_daily_pct",
+    "analytics.mv_hr_hourly",
+    "analytics.mv_liver_daily",
+)
+
+
+def mark_dirty(cur, buckets) -> None:
+    """Queue (person_id, code, effective_time) tuples for the next process()."""
+    persons, codes, times = [], [], []
+    for person_id, code, t in buckets:
+        if person_id and code and t:
+            persons.append(person_id)
+            codes.append(code)
+            times.append(t)
+    if persons:
+        cur.execute(MARK_SQL, (persons, codes, times))
+
+
+def process(dsn: str | None = None, limit: int | None = None) -> int:
+    """Recompute queued buckets; returns how many were claimed."""
+    with pg(dsn) as conn:
+        with conn.transaction():
+            with conn.cursor() as cur:
+                cur.execute(PROCESS_SQL, (limit,))
+                claimed = cur.fetchone()[0] or 0
+                if claimed:
+                    generations.bump(*VIEWS, cur=cur)
+    return claimed
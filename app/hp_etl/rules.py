@@ -1,5 +1,29 @@
+"""Threshold rules over metric series.
+
+A rule is a dict {"id", "when", "level", "message"}; "when" holds a metric, an
+op (== != < <= > >=) and a value, and is checked against the metric's latest
+point. Two optional forms look further back:
+
+  {"metric": "hr", "agg": "mean", "window": "7d", "op": ">", "value": 100}
+      aggregate (mean, min, max, sum, count) over the trailing window that
+      ends at the latest point
+  {"metric": "hr", "op": ">", "value": 100, "consecutive": 3}
+      the condition held on each of the last 3 calendar days (UTC), judged on
+      each day's last value; combined with agg, on the window aggregate at
+      each day's last point
+
+compile_rules() indexes rules by metric and turns each condition into a
+predicate once. RuleSet.evaluate() scores whole series; RuleSet.state()
+returns an incremental evaluator that takes points as they arrive.
+"""
+
+import operator
+from collections import deque
 from dataclasses import dataclass
-from typing import Optional, List
+from datetime import date, timezone
+from typing import Callable, Dict, Iterable, Optional, List
+
+from .resample import freq_ns, parse_isoz
 
 
 @dataclass
@@ -8,61 +32,285 @@ class MetricPoint:
     v: Optional[float]
 
 
-def evaluate_rules(
-    rules: List[dict], series_by_metric: dict[str, List[MetricPoint]]
-) -> List[dict]:
-    results = []
-    for rule in rules:
-        rid = rule["id"]
+OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+WINDOW_AGGS = ("mean", "min", "max", "sum", "count")
+
+
+@dataclass
+class CompiledRule:
+    index: int
+    id: str
+    metric: str
+    op: str
+    threshold: float
+    level: Optional[str]
+    message: str
+    test: Callable[[float], bool]
+    agg: Optional[str] = None
+    window: Optional[str] = None
+    window_s: float = 0.0
+    consecutive: int = 0
+
+    def result(self, ts: str, value: float) -> dict:
+        out = {
+            "rule_id": self.id,
+            "metric": self.metric,
+            "level": self.level,
+            "message": self.message,
+            "at": ts,
+            "value": value,
+            "op": self.op,
+            "threshold": self.threshold,
+        }
+        if self.agg:
+            out["agg"], out["window"] = self.agg, self.window
+        if self.consecutive:
+            out["consecutive"] = self.consecutive
+        return out
+
+
+def _predicate(op: str, threshold) -> Callable[[float], bool]:
+    fn = OPS[op]
+    return lambda v: fn(v, threshold)
+
+
+def compile_rules(rules: Iterable[dict]) -> "RuleSet":
+    """Compile rule dicts; rules with an unknown op, agg or window are dropped."""
+    compiled = []
+    for i, rule in enumerate(rules):
         cond = rule["when"]
-        metric = cond.get("metric")
         op = cond.get("op")
-        threshold = cond.get("value")
-        level = rule.get("level")
-        message = rule.get("message", "")
-
-        series = series_by_metric.get(metric, [])
-        # find latest non-null value by timestamp order descending
-        latest_point = None
-        for pt in reversed(series):
-            if pt.v is not None:
-                latest_point = pt
-                break
-        if latest_point is None:
+        agg = cond.get("agg")
+        if op not in OPS or (agg is not None and agg not in WINDOW_AGGS):
             continue
-
-        value = latest_point.v
-        ts = latest_point.ts
-
-        # Evaluate op
-        match op:
-            case "==":
-                passed = value == threshold
-            case "!=":
-                passed = value != threshold
-            case "<":
-                passed = value < threshold
-            case "<=":
-                passed = value <= threshold
-            case ">":
-                passed = value > threshold
-            case ">=":
-                passed = value >= threshold
-            case _:
+        window = cond.get("window") if agg else None
+        if agg:
+            try:
+                window_ns = freq_ns(window)
+            except (AttributeError, ValueError):
                 continue
+        compiled.append(
+            CompiledRule(
+                index=i,
+                id=rule["id"],
+                metric=cond.get("metric"),
+                op=op,
+                threshold=cond.get("value"),
+                level=rule.get("level"),
+                message=rule.get("message", ""),
+                test=_predicate(op, cond.get("value")),
+                agg=agg,
+                window=window,
+                window_s=window_ns / 1e9 if agg else 0.0,
+                consecutive=int(cond.get("consecutive") or 0),
+            )
+        )
+    return RuleSet(compiled)
 
-        if passed:
-            results.append(
-                {
-                    "rule_id": rid,
-                    "metric": metric,
-                    "level": level,
-                    "message": message,
-                    "at": ts,
-                    "value": value,
-                    "op": op,
-                    "threshold": threshold,
-                }
+
+class RuleSet:
+    def __init__(self, rules: List[CompiledRule]):
+        self.rules = rules
+        self.by_metric: Dict[str, List[CompiledRule]] = {}
+        for r in rules:
+            self.by_metric.setdefault(r.metric, []).append(r)
+        # metrics whose rules need more than the latest point
+        self.history = {
+            m
+            for m, rs in self.by_metric.items()
+            if any(r.agg or r.consecutive for r in rs)
+        }
+
+    @property
+    def lookback_s(self) -> float:
+        """How far back evaluating one new point needs to see."""
+        return max(
+            [r.window_s for r in self.rules]
+            + [r.consecutive * 86400.0 for r in self.rules],
+            default=0.0,
+        )
+
+    def state(self) -> "RuleState":
+        return RuleState(self)
+
+    def evaluate(self, series_by_metric: Dict[str, List[MetricPoint]]) -> List[dict]:
+        """Fired rules at each metric's latest point, in rule order.
+
+        Plain rules look at the last non-null point of the series as given;
+        windowed and consecutive-day rules replay the series in time order.
+        """
+        fired = []
+        for metric, rules in self.by_metric.items():
+            series = series_by_metric.get(metric) or []
+            latest = next((pt for pt in reversed(series) if pt.v is not None), None)
+            if latest is None:
+                continue
+            fired.extend(
+                (r.index, r.result(latest.ts, latest.v))
+                for r in rules
+                if not (r.agg or r.consecutive) and r.test(latest.v)
             )
+            if metric in self.history:
+                # RuleState drops points older than the newest it has seen
+                points = sorted(
+                    (pt for pt in series if pt.v is not None),
+                    key=lambda pt: _utc(pt.ts),
+                )
+                st = RuleState(self)
+                hits = []
+                for pt in points:
+                    hits = st.push(metric, pt.ts, pt.v)
+                plain = {r.index for r in rules if not (r.agg or r.consecutive)}
+                fired.extend(h for h in hits if h[0] not in plain)
+        fired.sort(key=lambda f: f[0])
+        return [res for _, res in fired]
 
-    return results
+
+def _utc(ts):
+    """ISO string or datetime (naive means UTC) as an aware datetime."""
+    dt = parse_isoz(ts) if isinstance(ts, str) else ts
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
+class _Window:
+    """Trailing time window with a running sum and monotonic min/max deques."""
+
+    def __init__(self, span_s: float):
+        self.span = span_s
+        self.pts: deque = deque()
+        self.total = 0.0
+        self.mins: deque = deque()
+        self.maxs: deque = deque()
+
+    def push(self, t: float, v: float) -> None:
+        self.pts.append((t, v))
+        self.total += v
+        while self.mins and self.mins[-1][1] >= v:
+            self.mins.pop()
+        self.mins.append((t, v))
+        while self.maxs and self.maxs[-1][1] <= v:
+            self.maxs.pop()
+        self.maxs.append((t, v))
+        edge = t - self.span
+        while self.pts[0][0] <= edge:
+            self.total -= self.pts.popleft()[1]
+        while self.mins[0][0] <= edge:
+            self.mins.popleft()
+        while self.maxs[0][0] <= edge:
+            self.maxs.popleft()
+        if len(self.pts) == 1:
+            self.total = v  # drop rounding carried over from evicted points
+
+    def value(self, agg: str) -> float:
+        n = len(self.pts)
+        if agg == "count":
+            return n
+        if agg == "min":
+            return self.mins[0][1]
+        if agg == "max":
+            return self.maxs[0][1]
+        return self.total if agg == "sum" else self.total / n
+
+
+class _Streak:
+    """Consecutive UTC days whose last value passes the rule's test.
+
+    For windowed rules the value pushed is the window aggregate.
+    """
+
+    def __init__(self, test):
+        self.test = test
+        self.day: Optional[date] = None
+        self.last = 0.0
+        self.before = 0
+
+    def push(self, day: date, v: float) -> int:
+        if self.day is not None and day != self.day:
+            gap = (day - self.day).days
+            self.before = self.before + 1 if gap == 1 and self.test(self.last) else 0
+        self.day, self.last = day, v
+        return self.before + 1 if self.test(v) else 0
+
+
+class RuleState:
+    """Incremental evaluator; push() points of a metric in time order.
+
+    Windows are shared by rules with the same metric and span. Points older
+    than the newest one already seen for their metric are ignored.
+    """
+
+    def __init__(self, ruleset: RuleSet):
+        self.ruleset = ruleset
+        self.windows: Dict[str, Dict[float, _Window]] = {}
+        self.streaks: Dict[int, _Streak] = {}
+        self.last_t: Dict[str, float] = {}
+
+    def push(self, metric: str, ts, v: Optional[float]) -> List[tuple]:
+        """(rule index, result) for the rules that fire at this point.
+
+        ts is an ISO string or a datetime (naive means UTC); results carry it
+        back as "at".
+        """
+        rules = self.ruleset.by_metric.get(metric)
+        if not rules or v is None:
+            return []
+        if metric not in self.ruleset.history:
+            return [(r.index, r.result(ts, v)) for r in rules if r.test(v)]
+        dt = _utc(ts)
+        t = dt.timestamp()
+        if t < self.last_t.get(metric, float("-inf")):
+            return []
+        self.last_t[metric] = t
+        windows = self.windows.get(metric)
+        if windows is None:
+            windows = self.windows[metric] = {
+                r.window_s: _Window(r.window_s) for r in rules if r.agg
+            }
+        for w in windows.values():
+            w.push(t, v)
+        fired = []
+        for r in rules:
+            value = windows[r.window_s].value(r.agg) if r.agg else v
+            if r.consecutive:
+                streak = self.streaks.setdefault(r.index, _Streak(r.test))
+                day = dt.astimezone(timezone.utc).date()
+                ok = streak.push(day, value) >= r.consecutive
+            else:
+                ok = r.test(value)
+            if ok:
+                fired.append((r.index, r.result(ts, value)))
+        return fired
+
+    def push_many(self, metric: str, points: Iterable[MetricPoint]) -> List[dict]:
+        return [res for pt in points for _, res in self.push(metric, pt.ts, pt.v)]
+
+
+def rules_from_thresholds(rows, level: str = "alert") -> List[dict]:
+    """Rules for analytics.anomaly_thresholds rows (code, min_val, max_val, reason)."""
+    out = []
+    for code, lo, hi, reason in rows:
+        for bound, op, val in (("min", "<", lo), ("max", ">", hi)):
+            if val is not None:
+                out.append(
+                    {
+                        "id": f"threshold:{code}:{bound}",
+                        "when": {"metric": code, "op": op, "value": float(val)},
+                        "level": level,
+                        "message": reason or "",
+                    }
+                )
+    return out
+
+
+def evaluate_rules(
+    rules: List[dict], series_by_metric: dict[str, List[MetricPoint]]
+) -> List[dict]:
+    return compile_rules(rules).evaluate(series_by_metric)
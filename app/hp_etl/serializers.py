@@ -0,0 +1,147 @@
+"""Binary serializers for the Redis cache backend.
+
+Every payload starts with a one-byte tag naming its format, so a reader can
+decode entries written by workers configured differently. datetime/date values
+round-trip in all formats; Decimal is stored as float.
+
+HP_CACHE_SERIALIZER picks the writer (msgpack, orjson or json); by default the
+fastest installed one is used.
+"""
+
+import datetime as dt
+import json
+import os
+from decimal import Decimal
+from typing import Any
+
+try:
+    import msgpack
+except Exception:  # optional
+    msgpack = None
+
+try:
+    import orjson
+except Exception:  # optional
+    orjson = None
+
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+_TAG_KEY = "__t__"
+
+
+def _tag(obj: Any):
+    if isinstance(obj, dt.datetime):
+        return {_TAG_KEY: "dt", "v": obj.isoformat()}
+    if isinstance(obj, dt.date):
+        return {_TAG_KEY: "d", "v": obj.isoformat()}
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"cannot serialize {type(obj).__name__}")
+
+
+def _untag(obj: dict):
+    t = obj.get(_TAG_KEY)
+    if t == "dt":
+        return dt.datetime.fromisoformat(obj["v"])
+    if t == "d":
+        return dt.date.fromisoformat(obj["v"])
+    return obj
+
+
+def _untag_tree(obj: Any):
+    # orjson.loads has no object_hook; restore tagged values in one walk
+    if isinstance(obj, dict):
+        if _TAG_KEY in obj:
+            return _untag(obj)
+        return {k: _untag_tree(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_untag_tree(v) for v in obj]
+    return obj
+
+
+def _msgpack_default(obj: Any):
+    if isinstance(obj, dt.datetime):
+        return msgpack.ExtType(_EXT_DATETIME, obj.isoformat().encode())
+    if isinstance(obj, dt.date):
+        return msgpack.ExtType(_EXT_DATE, obj.isoformat().encode())
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"cannot serialize {type(obj).__name__}")
+
+
+def _msgpack_ext(code: int, data: bytes):
+    if code == _EXT_DATETIME:
+        return dt.datetime.fromisoformat(data.decode())
+    if code == _EXT_DATE:
+        return dt.date.fromisoformat(data.decode())
+    return msgpack.ExtType(code, data)
+
+
+class Serializer:
+    name = "json"
+    tag = b"j"
+
+    def dumps(self, value: Any) -> bytes:
+        return self.tag + json.dumps(value, default=_tag).encode()
+
+    def loads(self, raw: bytes) -> Any:
+        return json.loads(raw[1:], object_hook=_untag)
+
+
+class MsgpackSerializer(Serializer):
+    name = "msgpack"
+    tag = b"m"
+
+    def dumps(self, value: Any) -> bytes:
+        return self.tag + msgpack.packb(value, default=_msgpack_default)
+
+    def loads(self, raw: bytes) -> Any:
+        return msgpack.unpackb(
+            raw[1:], ext_hook=_msgpack_ext, raw=False, strict_map_key=False
+        )
+
+
+class OrjsonSerializer(Serializer):
+    name = "orjson"
+    tag = b"o"
+
+    def dumps(self, value: Any) -> bytes:
+        return self.tag + orjson.dumps(
+            value, default=_tag, option=orjson.OPT_PASSTHROUGH_DATETIME
+        )
+
+    def loads(self, raw: bytes) -> Any:
+        return _untag_tree(orjson.loads(raw[1:]))
+
+
+def _available() -> dict:
+    out = {"json": Serializer()}
+    if orjson is not None:
+        out["orjson"] = OrjsonSerializer()
+    if msgpack is not None:
+        out["msgpack"] = MsgpackSerializer()
+    return out
+
+
+_BY_NAME = _available()
+_BY_TAG = {s.tag: s for s in _BY_NAME.values()}
+
+
+def get_serializer(name: str | None = None) -> Serializer:
+    name = (name or os.getenv("HP_CACHE_SERIALIZER", "")).strip().lower()
+    if name:
+        if name not in _BY_NAME:
+            raise ValueError(f"cache serializer not available: {name}")
+        return _BY_NAME[name]
+    for preferred in ("msgpack", "orjson", "json"):
+        if preferred in _BY_NAME:
+            return _BY_NAME[preferred]
+
+
+def loads(raw: bytes) -> Any:
+    """Decode a payload written by any serializer."""
+    ser = _BY_TAG.get(raw[:1])
+    if ser is None:
+        # untagged entries predate the tag byte and are plain JSON
+        return json.loads(raw)
+    return ser.loads(raw)
@@ -1,39 +1,144 @@
 """Simple process-local TTL cache used by dashboard queries.
 Note: this is an in-memory per-process cache suitable for low-volume dashboards.
 For multi-worker deployments consider an external cache (Redis).
+
+The cache is a bounded LRU: HP_CACHE_MAX_ENTRIES caps the number of keys and
+HP_CACHE_MAX_BYTES an approximate payload budget. Expired keys are dropped by a
+background sweeper every HP_CACHE_SWEEP_INTERVAL seconds (0 disables it).
 """
 
+import os
+import sys
 import time
 import threading
+from collections import OrderedDict
 from typing import Any, Optional
 
-_cache = {}
+MAX_ENTRIES = int(os.getenv("HP_CACHE_MAX_ENTRIES", "2048"))
+MAX_BYTES = int(os.getenv("HP_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SWEEP_INTERVAL = float(os.getenv("HP_CACHE_SWEEP_INTERVAL", "60"))
+
+# key -> (value, expires, nbytes); most recently used at the end
+_cache: OrderedDict = OrderedDict()
 _lock = threading.Lock()
+_bytes = 0
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+_sweeper_pid = None
+# bound before this module's own set() shadows the builtin
+_SEQUENCES = (list, tuple, set, frozenset)
+
+
+def sizeof(value: Any, _depth: int = 0) -> int:
+    """Approximate deep size of a cached payload (JSON-like values)."""
+    size = sys.getsizeof(value)
+    if _depth > 8:
+        return size
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += sizeof(k, _depth + 1) + sizeof(v, _depth + 1)
+    elif isinstance(value, _SEQUENCES):
+        for v in value:
+            size += sizeof(v, _depth + 1)
+    return size
+
+
+def _drop(key: str) -> None:
+    # caller holds _lock
+    global _bytes
+    _, _, nbytes = _cache.pop(key)
+    _bytes -= nbytes
 
 
 def get(key: str) -> Optional[Any]:
     with _lock:
         ent = _cache.get(key)
         if not ent:
+            _stats["misses"] += 1
             return None
-        val, expires = ent
+        val, expires, _ = ent
         if expires is not None and time.time() > expires:
-            del _cache[key]
+            _drop(key)
+            _stats["expirations"] += 1
+            _stats["misses"] += 1
             return None
+        _cache.move_to_end(key)
+        _stats["hits"] += 1
         return val
 
 
 def set(key: str, value: Any, ttl: Optional[int] = None) -> None:
+    global _bytes
     expires = time.time() + ttl if ttl else None
+    nbytes = sizeof(key) + sizeof(value)
+    _ensure_sweeper()
     with _lock:
-        _cache[key] = (value, expires)
+        if key in _cache:
+            _drop(key)
+        if nbytes > MAX_BYTES:
+            # would evict everything else and still not fit
+            return
+        _cache[key] = (value, expires, nbytes)
+        _bytes += nbytes
+        while len(_cache) > MAX_ENTRIES or _bytes > MAX_BYTES:
+            _drop(next(iter(_cache)))
+            _stats["evictions"] += 1
 
 
 def clear(key: str) -> None:
     with _lock:
-        _cache.pop(key, None)
+        if key in _cache:
+            _drop(key)
 
 
 def clear_all() -> None:
+    global _bytes
     with _lock:
         _cache.clear()
+        _bytes = 0
+
+
+def sweep() -> int:
+    """Remove expired entries; returns how many were dropped."""
+    now = time.time()
+    with _lock:
+        expired = [
+            k for k, (_, expires, _) in _cache.items() if expires and expires < now
+        ]
+        for k in expired:
+            _drop(k)
+        _stats["expirations"] += len(expired)
+    return len(expired)
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            **_stats,
+            "entries": len(_cache),
+            "bytes": _bytes,
+            "max_entries": MAX_ENTRIES,
+            "max_bytes": MAX_BYTES,
+        }
+
+
+def _sweep_forever() -> None:
+    while True:
+        time.sleep(SWEEP_INTERVAL)
+        try:
+            sweep()
+        except Exception:
+            pass
+
+
+def _ensure_sweeper() -> None:
+    # started lazily, and again in forked workers where the thread did not survive
+    global _sweeper_pid
+    if SWEEP_INTERVAL <= 0 or _sweeper_pid == os.getpid():
+        return
+    with _lock:
+        if _sweeper_pid == os.getpid():
+            return
+        _sweeper_pid = os.getpid()
+    threading.Thread(
+        target=_sweep_forever, name="hp-cache-sweeper", daemon=True
+    ).start()
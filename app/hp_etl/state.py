@@ -9,14 +9,18 @@ def get_state(key: str, dsn: str | None = None) -> str | None:
             return r[0] if r else None
 
 
-def set_state(key: str, value: str, dsn: str | None = None):
+SET_STATE_SQL = """
+INSERT INTO analytics.etl_state(key, value)
+VALUES (%s,%s)
+ON CONFLICT (key) DO UPDATE SET value=EXCLUDED.value
+"""
+
+
+def set_state(key: str, value: str, dsn: str | None = None, cur=None):
+    """Store key; with cur it joins the caller's transaction."""
+    if cur is not None:
+        cur.execute(SET_STATE_SQL, (key, value))
+        return
     with pg(dsn) as conn:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO analytics.etl_state(key, value)
-                VALUES (%s,%s)
-                ON CONFLICT (key) DO UPDATE SET value=EXCLUDED.value
-            """,
-                (key, value),
-            )
+            cur.execute(SET_STATE_SQL, (key, value))
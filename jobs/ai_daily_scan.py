@@ -1,86 +1,200 @@
 #!/usr/bin/env python3
+"""
+Nightly z-score scan of daily metric aggregates into analytics.ai_findings.
+
+Persons are split into chunks and scanned in a process pool. Each chunk reads
+the daily aggregates of every configured metric for its persons in one
+grouped query and scores all (person, metric) series in one batch. Each person
+gets one bulk INSERT ... ON CONFLICT DO NOTHING and their own watermark
+(etl_state key ai_last_day:<person_id>), committed together.
+
+Without --person-id every person with recent events for the metrics is scanned.
+"""
+
 import argparse
 import json
-import datetime as dt
-from typing import List, Tuple
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from hp_etl.db import pg, dsn_from_env
-from hp_etl.state import get_state, set_state
-from hp_etl.anom import rolling_zscore, level_from_score
+from hp_etl import generations
+from hp_etl import anom
+from hp_etl.anom import rolling_zscore_many, level_from_score
 
 METRICS = {
     "hr": ("8867-4", "median"),
     "spo2": ("59408-5", "min"),
 }
 
+WINDOW = 21
+LOOKBACK_DAYS = 60
+CHUNK_SIZE = 50
+
+# the old global watermark belonged to the default person
+LEGACY_KEY = "ai_last_day"
+LEGACY_PERSON = "me"
+
+PERSONS_SQL = """
+SELECT DISTINCT person_id FROM analytics.data_events
+WHERE code_system = 'LOINC' AND code = ANY (%s) AND value_num IS NOT NULL
+  AND effective_time >= now() - make_interval(days => %s)
+ORDER BY person_id
+"""
+
+# every aggregate a metric may ask for, per person, code and day
+DAYS_SQL = """
+SELECT person_id, code, effective_time::date AS d,
+       percentile_disc(0.5) WITHIN GROUP (ORDER BY value_num) AS median,
+       min(value_num), max(value_num), avg(value_num)
+FROM analytics.data_events
+WHERE person_id = ANY (%s) AND code_system = 'LOINC' AND code = ANY (%s)
+  AND value_num IS NOT NULL
+  AND effective_time >= now() - make_interval(days => %s)
+GROUP BY 1, 2, 3
+ORDER BY 1, 2, 3
+"""
+
+AGG_COLUMN = {"median": 0, "min": 1, "max": 2, "avg": 3}
+
+WATERMARKS_SQL = "SELECT key, value FROM analytics.etl_state WHERE key = ANY (%s)"
+
+INSERT_SQL = """
+INSERT INTO analytics.ai_findings
+  (person_id, finding_time, metric, method, score, level, "window", context)
+SELECT %s, t, m, 'zscore', s, l, w, c
+FROM unnest(%s::timestamptz[], %s::text[], %s::float8[], %s::text[],
+            %s::jsonb[], %s::jsonb[]) AS f(t, m, s, l, w, c)
+ON CONFLICT (person_id, finding_time, metric) DO NOTHING
+"""
+
+SET_STATE_SQL = """
+INSERT INTO analytics.etl_state(key, value) VALUES (%s, %s)
+ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+"""
+
+
+def state_key(person_id: str) -> str:
+    return f"{LEGACY_KEY}:{person_id}"
+
+
+def fetch_days(cur, persons, metrics=METRICS, days: int = LOOKBACK_DAYS) -> dict:
+    """{(person_id, metric): [(iso_day, value), ...]} in one grouped query."""
+    codes = sorted({code for code, _ in metrics.values()})
+    by_code = {}
+    for metric, (code, agg) in metrics.items():
+        by_code.setdefault(code, []).append((metric, AGG_COLUMN[agg]))
+    out = {}
+    cur.execute(DAYS_SQL, (list(persons), codes, days))
+    for person_id, code, d, *aggs in cur.fetchall():
+        iso = d.strftime("%Y-%m-%dT00:00:00Z")
+        for metric, col in by_code[code]:
+            if aggs[col] is not None:
+                out.setdefault((person_id, metric), []).append((iso, float(aggs[col])))
+    return out
 
-def fetch_days(code: str, agg: str, dsn: str) -> List[Tuple[str, float]]:
-    sql = f"""
-      with src as (
-        select effective_time::date as d, value_num
-        from analytics.data_events
-        where code_system='LOINC' and code=%s and value_num is not null
-          and effective_time >= now() - interval '60 days'
-      )
-      select d::text, {"percentile_disc(0.5) within group (order by value_num)" if agg == "median" else "min(value_num)"}
-      from src group by 1 order by 1;
-    """
-    out = []
+
+def load_watermarks(cur, persons) -> dict:
+    keys = [state_key(p) for p in persons]
+    if LEGACY_PERSON in persons:
+        keys.append(LEGACY_KEY)
+    cur.execute(WATERMARKS_SQL, (keys,))
+    state = dict(cur.fetchall())
+    marks = {p: state.get(state_key(p)) for p in persons}
+    if LEGACY_PERSON in marks and marks[LEGACY_PERSON] is None:
+        marks[LEGACY_PERSON] = state.get(LEGACY_KEY)
+    return marks
+
+
+def findings(series: dict, scores: dict, metrics=METRICS, last=None) -> list:
+    """Rows (finding_time, metric, score, level, window, context) past `last`."""
+    rows = []
+    for key, days in series.items():
+        metric = key[1]
+        code, agg = metrics[metric]
+        window = json.dumps({"n": min(WINDOW, len(days)), "metric": metric, "agg": agg})
+        for (ts, val), (_, z) in zip(days, scores[key]):
+            if last and ts <= last:
+                continue
+            ctx = json.dumps({"value": val, "code": code})
+            rows.append((ts, metric, float(z), level_from_score(z), window, ctx))
+    return rows
+
+
+def scan_persons(persons, dsn: str, metrics=METRICS) -> dict:
+    """Scan one chunk of persons; returns {person_id: (inserts, newest)}."""
+    out = {}
     with pg(dsn) as conn, conn.cursor() as cur:
-        cur.execute(sql, (code,))
-        for d, v in cur.fetchall():
-            if v is not None:
-                iso = dt.date.fromisoformat(d).strftime("%Y-%m-%dT00:00:00Z")
-                out.append((iso, float(v)))
+        series = fetch_days(cur, persons, metrics)
+        marks = load_watermarks(cur, persons)
+        scores = rolling_zscore_many(series, window=WINDOW)
+        for person_id in persons:
+            mine = {k: v for k, v in series.items() if k[0] == person_id}
+            rows = findings(mine, scores, metrics, marks[person_id])
+            if not rows:
+                out[person_id] = (0, marks[person_id])
+                continue
+            newest = max(r[0] for r in rows)
+            with conn.transaction():
+                cur.execute(INSERT_SQL, (person_id, *map(list, zip(*rows))))
+                inserts = cur.rowcount
+                cur.execute(SET_STATE_SQL, (state_key(person_id), newest))
+            out[person_id] = (inserts, newest)
     return out
 
 
+def chunked(items, size: int):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--dsn", default=dsn_from_env())
-    ap.add_argument("--person-id", default="me")
+    ap.add_argument(
+        "--person-id",
+        action="append",
+        default=[],
+        help="repeatable; default: every person with recent events",
+    )
+    ap.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1))
+    ap.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
     args = ap.parse_args()
 
-    last = get_state("ai_last_day", args.dsn)
-    newest = last
-    inserts = 0
+    persons = sorted(set(args.person_id))
+    if not persons:
+        codes = sorted({code for code, _ in METRICS.values()})
+        with pg(args.dsn) as conn:
+            rows = conn.execute(PERSONS_SQL, (codes, LOOKBACK_DAYS)).fetchall()
+        persons = [r[0] for r in rows]
+    chunks = list(chunked(persons, max(1, args.chunk_size)))
+    # numpy is a requirement; the pure-Python fallback is much slower
+    print(f"zscore backend: {anom.backend()}")
 
-    for metric, (code, agg) in METRICS.items():
-        days = fetch_days(code, agg, args.dsn)
-        zs = rolling_zscore(days, window=21)
-        for (ts, val), (_, z) in zip(days, zs):
-            if z is None:
-                continue
-            if last and ts <= last:
-                continue
-            lvl = level_from_score(z)
-            window = {"n": min(21, len(days)), "metric": metric, "agg": agg}
-            ctx = {"value": val, "code": code}
-            with pg(args.dsn) as conn, conn.cursor() as cur:
-                cur.execute(
-                    """
-                    INSERT INTO analytics.ai_findings
-                      (person_id, finding_time, metric, method, score, level, "window", context)
-                    VALUES (%s,%s,%s,%s,%s,%s,%s::jsonb,%s::jsonb)
-                    ON CONFLICT (person_id, finding_time, metric) DO NOTHING
-                """,
-                    (
-                        args.person_id,
-                        ts,
-                        metric,
-                        "zscore",
-                        float(z),
-                        lvl,
-                        json.dumps(window),
-                        json.dumps(ctx),
-                    ),
-                )
-                inserts += cur.rowcount
-            if newest is None or ts > newest:
-                newest = ts
-
-    if newest:
-        set_state("ai_last_day", newest, args.dsn)
-        print(f"ai_last_day -> {newest} | inserts: {inserts}")
+    results = {}
+    failed = 0
+    workers = max(1, min(args.workers, len(chunks)))
+    if workers == 1:
+        for chunk in chunks:
+            results.update(scan_persons(chunk, args.dsn))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            futures = {ex.submit(scan_persons, c, args.dsn): c for c in chunks}
+            for fut, chunk in futures.items():
+                try:
+                    results.update(fut.result())
+                except Exception as e:
+                    failed += 1
+                    print(f"{chunk[0]}..{chunk[-1]}: failed: {e}", file=sys.stderr)
+
+    inserts = sum(n for n, _ in results.values())
+    if inserts:
+        generations.bump(generations.AI_FINDINGS, dsn=args.dsn)
+    for person_id, (n, newest) in sorted(results.items()):
+        if n:
+            print(f"{person_id}: ai_last_day -> {newest} | inserts: {n}")
+    print(f"persons: {len(results)} | inserts: {inserts} | failed chunks: {failed}")
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Evaluate the (person, code) pairs queued in analytics.eval_pending by ingest
+writers against analytics.anomaly_thresholds (and --rules) into
+analytics.ai_findings.
+
+Without --listen the queue is drained once. With --listen the job stays up and
+wakes on NOTIFY hp_eval, so findings follow an ingest commit within seconds;
+cron starts it under flock and restarts it if it exits.
+"""
+
+import argparse
+import json
+import logging
+from hp_etl.db import dsn_from_env
+from hp_etl import ingest_eval
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dsn", default=dsn_from_env())
+    ap.add_argument("--rules", help="JSON file with extra rules (app.hp_etl.rules)")
+    ap.add_argument("--limit", type=int, default=1000, help="pairs per pass")
+    ap.add_argument("--listen", action="store_true")
+    ap.add_argument("--poll", type=float, default=60.0, help="seconds between polls")
+    args = ap.parse_args()
+
+    rules = []
+    if args.rules:
+        with open(args.rules) as fh:
+            rules = json.load(fh)
+
+    if args.listen:
+        logging.basicConfig(
+            level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+        )
+        ingest_eval.listen(args.dsn, rules, args.limit, args.poll)
+        return
+    pairs = findings = 0
+    while True:
+        claimed, written = ingest_eval.process(args.dsn, rules, args.limit)
+        pairs += claimed
+        findings += written
+        if claimed < args.limit:
+            break
+    print(f"eval pairs={pairs} findings={findings}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,12 @@ Usage: python jobs/import_apple_health.py --zip /path/to/export.zip --person-id
 - Streams export.xml from the zip (handles large files).
 - Inserts rows into analytics.data_events.
 - Uses analytics.etl_state['apple_last_ts'] to only import new samples.
+- --workers N maps records in N processes between the XML producer and a
+  single COPY writer (bounded queues between the stages).
+- Checkpoints the number of records written in
+  analytics.etl_state['apple_import_checkpoint'], in the transaction that
+  writes them; a crashed import of the same export resumes after that record
+  (--restart ignores it).
 - Optionally writes output as CSV and/or NDJSON.
 """
 
@@ -13,10 +19,15 @@ import zipfile
 import os
 import json
 import datetime as dt
-import xml.etree.ElementTree as ET
 import csv
-from hp_etl.events import bulk_insert
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from hp_etl.apple_xml import BACKENDS, iter_records
+from hp_etl.events import EventLoader
 from hp_etl.state import get_state, set_state
+from hp_etl import generations
 
 # LOINC codes for mapping
 LOINC = {
@@ -40,17 +51,17 @@ def to_utc(s: str) -> str:
 
 
 def parse_record(elem):
-    t = elem.attrib.get("type", "").split(":")[
-        -1
-    ]  # e.g., HKQuantityTypeIdentifierHeartRate
+    # accepts an Element or its attribute dict (what pipeline workers receive)
+    attrib = getattr(elem, "attrib", elem)
+    t = attrib.get("type", "").split(":")[-1]  # e.g., HKQuantityTypeIdentifierHeartRate
     t = t.replace("HKQuantityTypeIdentifier", "").replace(
         "HKCategoryTypeIdentifier", ""
     )
-    start = elem.attrib.get("startDate")
-    end = elem.attrib.get("endDate")
-    val = elem.attrib.get("value")
-    unit = elem.attrib.get("unit")
-    device = elem.attrib.get("sourceName") or elem.attrib.get("device")
+    start = attrib.get("startDate")
+    end = attrib.get("endDate")
+    val = attrib.get("value")
+    unit = attrib.get("unit")
+    device = attrib.get("sourceName") or attrib.get("device")
     start_utc = to_utc(start) if start else None
     end_utc = to_utc(end) if end else None
 
@@ -65,7 +76,7 @@ def parse_record(elem):
             "effective_start": start_utc,
             "effective_end": end_utc,
             "value_num": None,
-            "value_text": elem.attrib.get("value"),
+            "value_text": attrib.get("value"),
             "unit": None,
             "device_id": device,
             "status": "final",
@@ -103,6 +114,160 @@ def parse_record(elem):
     return None
 
 
+CHECKPOINT_KEY = "apple_import_checkpoint"
+CHUNK_SIZE = 2000
+
+# These are the columns in table, minus the id
+CSV_COLUMNS = [
+    "person_id",
+    "source",
+    "raw",
+    "meta",
+    "kind",
+    "code_system",
+    "code",
+    "display",
+    "effective_time",
+    "effective_start",
+    "effective_end",
+    "value_num",
+    "value_text",
+    "unit",
+    "device_id",
+    "status",
+]
+
+
+def chunked(records, size, skip=0):
+    """Group records into (records_consumed, chunk); the first skip are dropped."""
+    chunk = []
+    n = 0
+    for attrs in records:
+        n += 1
+        if n <= skip:
+            continue
+        chunk.append(attrs)
+        if len(chunk) >= size:
+            yield n, chunk
+            chunk = []
+    if chunk or n <= skip:
+        yield n, chunk
+
+
+def map_chunk(attrs_list, person_id, file_name, last):
+    """Worker stage: Record attributes -> data_events rows (runs in a pool)."""
+    rows = []
+    meta = json.dumps({"file": file_name})
+    for attrs in attrs_list:
+        rec = parse_record(attrs)
+        if not rec:
+            continue
+        eff = rec["effective_time"] or rec["effective_end"]
+        if eff and last and eff <= last:
+            continue
+        rows.append(
+            dict(
+                person_id=person_id,
+                source="apple_health",
+                raw=json.dumps(attrs),
+                meta=meta,
+                **rec,
+            )
+        )
+    return rows
+
+
+class Writer(threading.Thread):
+    """Writer stage: COPYs mapped chunks and checkpoints what is durable."""
+
+    def __init__(self, dsn, export_id, maxsize, checkpoint_every=10):
+        super().__init__(name="apple-writer", daemon=True)
+        self.dsn = dsn
+        self.export_id = export_id
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.checkpoint_every = checkpoint_every
+        self.error = None
+        self.inserted = 0
+
+    def put(self, item):
+        # bounded queue: blocks the producer while the database catches up
+        while True:
+            if self.error is not None:
+                raise self.error
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def run(self):
+        try:
+            # flush only at checkpoints, so every commit carries its checkpoint
+            with EventLoader(self.dsn, batch_size=None) as loader:
+                pending = 0
+                done = None
+                while True:
+                    item = self.queue.get()
+                    if item is None:
+                        break
+                    done, rows, max_ts = item
+                    loader.extend(rows)
+                    pending += 1
+                    if pending >= self.checkpoint_every:
+                        loader.flush(self._checkpoint(done, max_ts))
+                        pending = 0
+                if done is not None:
+                    loader.flush(self._checkpoint(done, max_ts))
+                self.inserted = loader.inserted
+        except BaseException as e:
+            self.error = e
+            # unblock a producer waiting on a full queue
+            while not self.queue.empty():
+                self.queue.get_nowait()
+
+    def _checkpoint(self, done, max_ts):
+        return lambda cur: save_checkpoint(cur, self.export_id, done, max_ts)
+
+    def stop(self):
+        """Write what is queued and end the thread; its error is kept in .error."""
+        try:
+            self.put(None)
+        except BaseException:
+            pass  # the writer already failed and stopped
+        self.join()
+
+    def close(self):
+        self.stop()
+        if self.error is not None:
+            raise self.error
+
+
+def export_identity(info) -> dict:
+    return {"file": info.filename, "size": info.file_size, "crc": info.CRC}
+
+
+def load_checkpoint(dsn, export_id) -> dict | None:
+    raw = get_state(CHECKPOINT_KEY, dsn)
+    if not raw:
+        return None
+    try:
+        ckpt = json.loads(raw)
+    except ValueError:
+        return None
+    # only resume the same export.xml; a new export starts over
+    if ckpt.get("export") != export_id:
+        return None
+    return ckpt
+
+
+def save_checkpoint(cur, export_id, records, max_ts):
+    set_state(
+        CHECKPOINT_KEY,
+        json.dumps({"export": export_id, "records": records, "max_ts": max_ts}),
+        cur=cur,
+    )
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--zip", required=True)
@@ -110,6 +275,23 @@ def main():
     ap.add_argument("--dsn", default=None)
     ap.add_argument("--csv-out", default=None)
     ap.add_argument("--ndjson-out", default=None)
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="processes mapping records; 1 maps inline in the producer",
+    )
+    ap.add_argument(
+        "--xml-backend",
+        choices=sorted(BACKENDS),
+        default=None,
+        help="streaming XML parser (default: lxml if installed, else expat)",
+    )
+    ap.add_argument(
+        "--restart",
+        action="store_true",
+        help="ignore a saved checkpoint and import from the first record",
+    )
     args = ap.parse_args()
 
     # Ensure staging dirs for outputs, if present
@@ -120,81 +302,93 @@ def main():
     last = get_state("apple_last_ts", args.dsn)
     max_ts_seen = last
 
-    # These are the columns in table, minus the id
-    csv_columns = [
-        "person_id",
-        "source",
-        "raw",
-        "meta",
-        "kind",
-        "code_system",
-        "code",
-        "display",
-        "effective_time",
-        "effective_start",
-        "effective_end",
-        "value_num",
-        "value_text",
-        "unit",
-        "device_id",
-        "status",
-    ]
-    csv_file = open(args.csv_out, "w", newline="") if args.csv_out else None
-    ndjson_file = open(args.ndjson_out, "w") if args.ndjson_out else None
-    csv_writer = csv.DictWriter(csv_file, fieldnames=csv_columns) if csv_file else None
-    if csv_writer:
-        csv_writer.writeheader()
-
     with zipfile.ZipFile(args.zip) as z:
         # find export.xml
         name = next((n for n in z.namelist() if n.endswith("export.xml")), None)
         if not name:
             raise SystemExit("export.xml not found in zip")
-        with z.open(name) as f:
-            it = ET.iterparse(f, events=("start", "end"))
-            _, root = next(it)  # get root
-            batch = []
-            for ev, el in it:
-                if ev == "end" and el.tag == "Record":
-                    rec = parse_record(el)
-                    if rec:
-                        eff = rec["effective_time"] or rec["effective_end"]
-                        if eff and last and eff <= last:
-                            pass
-                        else:
-                            row = dict(
-                                person_id=args.person_id,
-                                source="apple_health",
-                                raw=json.dumps(el.attrib),
-                                meta=json.dumps({"file": name}),
-                                **rec,
-                            )
-                            batch.append(row)
-
-                            # Write to CSV/NDJSON if requested
-                            if csv_writer:
-                                csv_writer.writerow(row)
-                            if ndjson_file:
-                                ndjson_file.write(json.dumps(row) + "\n")
-
-                            if eff and (max_ts_seen is None or eff > max_ts_seen):
-                                max_ts_seen = eff
-                        if len(batch) >= 1000:
-                            bulk_insert(batch, args.dsn)
-                            batch.clear()
-                    el.clear()
-                    root.clear()
-            if batch:
-                bulk_insert(batch, args.dsn)
-
-    if csv_file:
-        csv_file.close()
-    if ndjson_file:
-        ndjson_file.close()
+        export_id = export_identity(z.getinfo(name))
+        ckpt = None if args.restart else load_checkpoint(args.dsn, export_id)
+        skip = 0
+        if ckpt:
+            skip = ckpt["records"]
+            max_ts_seen = max(
+                filter(None, [max_ts_seen, ckpt.get("max_ts")]), default=None
+            )
+            print(f"Resuming {name} after {skip} records")
+
+        mode = "a" if ckpt else "w"
+        csv_file = open(args.csv_out, mode, newline="") if args.csv_out else None
+        ndjson_file = open(args.ndjson_out, mode) if args.ndjson_out else None
+        csv_writer = (
+            csv.DictWriter(csv_file, fieldnames=CSV_COLUMNS) if csv_file else None
+        )
+        if csv_writer and not ckpt:
+            csv_writer.writeheader()
+
+        workers = max(1, args.workers)
+        writer = Writer(args.dsn, export_id, maxsize=workers * 2)
+        writer.start()
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+        def emit(done, rows):
+            nonlocal max_ts_seen
+            for row in rows:
+                # Write to CSV/NDJSON if requested
+                if csv_writer:
+                    csv_writer.writerow(row)
+                if ndjson_file:
+                    ndjson_file.write(json.dumps(row) + "\n")
+                eff = row["effective_time"] or row["effective_end"]
+                if eff and (max_ts_seen is None or eff > max_ts_seen):
+                    max_ts_seen = eff
+            writer.put((done, rows, max_ts_seen))
+
+        try:
+            with z.open(name) as f:
+                chunks = chunked(
+                    iter_records(f, args.xml_backend), CHUNK_SIZE, skip=skip
+                )
+                # futures complete out of order but are emitted in order, so a
+                # checkpoint never covers a chunk that has not been written
+                pending = deque()
+                for done, chunk in chunks:
+                    if pool is None:
+                        emit(done, map_chunk(chunk, args.person_id, name, last))
+                        continue
+                    pending.append(
+                        (
+                            done,
+                            pool.submit(map_chunk, chunk, args.person_id, name, last),
+                        )
+                    )
+                    while len(pending) >= workers * 2:
+                        done_, fut = pending.popleft()
+                        emit(done_, fut.result())
+                while pending:
+                    done_, fut = pending.popleft()
+                    emit(done_, fut.result())
+        except BaseException:
+            # the writer still commits what it was handed, with its checkpoint
+            writer.stop()
+            raise
+        else:
+            writer.close()
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            if csv_file:
+                csv_file.close()
+            if ndjson_file:
+                ndjson_file.close()
 
+    print(f"inserted={writer.inserted}")
     if max_ts_seen:
+        generations.bump(generations.DATA_EVENTS, dsn=args.dsn)
         set_state("apple_last_ts", max_ts_seen, args.dsn)
         print("Updated apple_last_ts ->", max_ts_seen)
+    # finished: the next export starts from the top
+    set_state(CHECKPOINT_KEY, "", args.dsn)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,30 @@
 #!/usr/bin/env python3
+"""
+Load FHIR NDJSON exports into fhir_raw.resources.
+
+Default (copy) mode streams the raw bytes of each file into a temp table with
+COPY, without parsing lines in Python, then moves them with one set-based
+INSERT ... SELECT ... ON CONFLICT DO NOTHING per chunk. Lines are cast to
+jsonb directly; only a chunk that holds a line which is not JSON is merged
+again with fhir_raw.try_jsonb (init/068), which drops the bad lines. Several
+files or globs are loaded in parallel, one connection per worker.
+--mode rows keeps the line-by-line path.
+
+Usage: python jobs/import_fhir_ndjson.py [--workers 4] FILE_OR_GLOB [...]
+"""
+
 import argparse
-import json
+import glob
 import gzip
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import IO
-from hp_etl.db import pg, dsn_from_env
+
+import psycopg
+
+from hp_etl.db import pg, dsn_from_env, pool_settings, pooling_enabled
 
 
 def opener(path: str) -> IO[bytes]:
@@ -11,35 +32,113 @@ def opener(path: str) -> IO[bytes]:
 
 
 INSERT_SQL = """
-INSERT INTO fhir_raw.resources (resource_type, resource)
-VALUES (%(rt)s, %(res)s::jsonb)
+INSERT INTO fhir_raw.resources (resource_type, resource_id, resource)
+VALUES (%(rt)s, %(rid)s, %(res)s::jsonb)
 ON CONFLICT (resource_type, (resource->>'id')) DO NOTHING
 """
 
+STAGE_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS ndjson_stage (line text) ON COMMIT DELETE ROWS
+"""
+
+# JSON text never contains raw \x01/\x02, so CSV with those as quote and
+# delimiter passes every line through byte for byte, one row per line.
+COPY_SQL = (
+    "COPY ndjson_stage (line) FROM STDIN "
+    "WITH (FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02')"
+)
+
+_MERGE = """
+WITH parsed AS (
+  SELECT {parse} AS j
+  FROM ndjson_stage
+  WHERE line IS NOT NULL AND btrim(line) <> ''
+), valid AS (
+  SELECT COALESCE(%(rt)s, j->>'resourceType') AS rt, j->>'id' AS rid, j
+  FROM parsed
+  WHERE jsonb_typeof(j) = 'object'
+), ins AS (
+  INSERT INTO fhir_raw.resources (resource_type, resource_id, resource)
+  SELECT rt, rid, j FROM valid
+  WHERE rt IS NOT NULL AND rid IS NOT NULL
+  ON CONFLICT (resource_type, (resource->>'id')) DO NOTHING
+  RETURNING 1
+)
+SELECT (SELECT count(*) FROM ins),
+       (SELECT count(*) FROM valid WHERE rt IS NOT NULL AND rid IS NOT NULL),
+       (SELECT count(*) FROM parsed)
+"""
+
+# fails on the first line that is not JSON, without a per-line subtransaction
+MERGE_CAST_SQL = _MERGE.format(parse="line::jsonb")
+MERGE_SQL = _MERGE.format(parse="fhir_raw.try_jsonb(line)")
+
+CHUNK_MB = 64
+READ_SIZE = 1 << 20
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--dsn", default=dsn_from_env())
-    ap.add_argument("--file", required=True)
-    ap.add_argument(
-        "--type", help="optional resourceType override (auto-detect if absent)"
-    )
-    args = ap.parse_args()
 
+def chunks(fh, chunk_bytes: int):
+    """Yield lists of byte blocks of about chunk_bytes, split on line ends."""
+    blocks, size, carry = [], 0, b""
+    while True:
+        data = fh.read(READ_SIZE)
+        if not data:
+            break
+        data = carry + data
+        cut = data.rfind(b"\n") + 1
+        carry = data[cut:]
+        if cut:
+            blocks.append(data[:cut])
+            size += cut
+        if size >= chunk_bytes:
+            yield blocks
+            blocks, size = [], 0
+    if carry:
+        blocks.append(carry + b"\n")
+    if blocks:
+        yield blocks
+
+
+def load_file(path: str, dsn: str, rtype: str | None, chunk_mb: int) -> dict:
+    """COPY one file in chunks; one transaction per chunk."""
+    out = {"file": path, "inserted": 0, "skipped": 0, "bad": 0}
+    t0 = time.monotonic()
+    with opener(path) as fh, pg(dsn) as conn:
+        conn.execute(STAGE_SQL)
+        for blocks in chunks(fh, chunk_mb << 20):
+            with conn.transaction():
+                with conn.cursor() as cur:
+                    with cur.copy(COPY_SQL) as copy:
+                        for b in blocks:
+                            copy.write(b)
+                    try:
+                        with conn.transaction():
+                            cur.execute(MERGE_CAST_SQL, {"rt": rtype})
+                    except psycopg.errors.DataException:
+                        cur.execute(MERGE_SQL, {"rt": rtype})
+                    inserted, valid, lines = cur.fetchone()
+            out["inserted"] += inserted
+            out["skipped"] += valid - inserted
+            out["bad"] += lines - valid
+    out["seconds"] = time.monotonic() - t0
+    return out
+
+
+def load_rows(path: str, dsn: str, rtype: str | None) -> dict:
     inserted = skipped = bad = 0
-    with opener(args.file) as fh, pg(args.dsn) as conn, conn.cursor() as cur:
+    with opener(path) as fh, pg(dsn) as conn, conn.cursor() as cur:
         for i, raw in enumerate(fh, start=1):
             try:
                 obj = json.loads(raw.decode("utf-8"))
             except Exception:
                 bad += 1
                 continue
-            rt = args.type or obj.get("resourceType")
+            rt = rtype or obj.get("resourceType")
             rid = obj.get("id")
             if not rt or not rid:
                 bad += 1
                 continue
-            cur.execute(INSERT_SQL, {"rt": rt, "res": json.dumps(obj)})
+            cur.execute(INSERT_SQL, {"rt": rt, "rid": rid, "res": json.dumps(obj)})
             if cur.rowcount == 1:
                 inserted += 1
             else:
@@ -47,7 +146,73 @@ def main():
             if i % 1000 == 0:
                 conn.commit()
         conn.commit()
-    print(f"Inserted {inserted}; Skipped {skipped}; Bad {bad}")
+    return {"file": path, "inserted": inserted, "skipped": skipped, "bad": bad}
+
+
+def expand(patterns) -> list[str]:
+    files = []
+    for p in patterns:
+        matched = sorted(glob.glob(p))
+        files.extend(matched or [p])
+    return list(dict.fromkeys(files))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dsn", default=dsn_from_env())
+    ap.add_argument("paths", nargs="*", help="NDJSON files or globs (.gz ok)")
+    ap.add_argument("--file", action="append", default=[], help="same as a path")
+    ap.add_argument(
+        "--type", help="optional resourceType override (auto-detect if absent)"
+    )
+    ap.add_argument("--mode", choices=("copy", "rows"), default="copy")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--chunk-mb", type=int, default=CHUNK_MB)
+    args = ap.parse_args()
+
+    files = expand(args.paths + args.file)
+    if not files:
+        ap.error("no input files")
+
+    def run(path):
+        if args.mode == "rows":
+            return load_rows(path, args.dsn, args.type)
+        return load_file(path, args.dsn, args.type, args.chunk_mb)
+
+    workers = max(1, min(args.workers, len(files)))
+    if pooling_enabled():
+        # each worker holds a pooled connection for a whole file; more workers
+        # than connections would time out waiting for one
+        cap = max(1, pool_settings()["max_size"])
+        if workers > cap:
+            print(f"--workers capped at HP_DB_POOL_MAX={cap}", file=sys.stderr)
+            workers = cap
+
+    t0 = time.monotonic()
+    totals = {"inserted": 0, "skipped": 0, "bad": 0}
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = {ex.submit(run, f): f for f in files}
+        for fut, path in futures.items():
+            try:
+                res = fut.result()
+            except Exception as e:
+                failed += 1
+                print(f"{path}: failed: {e}", file=sys.stderr)
+                continue
+            for k in totals:
+                totals[k] += res[k]
+            print(
+                f"{path}: Inserted {res['inserted']}; Skipped {res['skipped']}; "
+                f"Bad {res['bad']}"
+            )
+    elapsed = time.monotonic() - t0
+    print(
+        f"Inserted {totals['inserted']}; Skipped {totals['skipped']}; "
+        f"Bad {totals['bad']}; files={len(files)} elapsed={elapsed:.1f}s"
+    )
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Maintain the monthly partitions of analytics.data_events (init/066).
+- Pre-creates partitions for the coming months so inserts never fall into the
+  default partition.
+- With --retain-months N, detaches months older than N months and moves them
+  to the archive schema (nothing is dropped).
+Safe to run daily from cron.
+"""
+
+import argparse
+import datetime as dt
+from hp_etl.db import pg, dsn_from_env
+
+ENSURE_SQL = "SELECT analytics.data_events_ensure_partitions(%s, %s)"
+ARCHIVE_SQL = "SELECT * FROM analytics.data_events_archive_before(%s, %s)"
+DEFAULT_ROWS_SQL = "SELECT count(*) FROM analytics.data_events_default"
+
+
+def add_months(day: dt.date, months: int) -> dt.date:
+    m = day.year * 12 + day.month - 1 + months
+    return dt.date(m // 12, m % 12 + 1, 1)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dsn", default=dsn_from_env())
+    ap.add_argument("--premake-months", type=int, default=3)
+    ap.add_argument(
+        "--retain-months",
+        type=int,
+        default=0,
+        help="archive months older than this (0 keeps everything attached)",
+    )
+    ap.add_argument("--archive-schema", default="archive")
+    args = ap.parse_args()
+
+    today = dt.date.today()
+    with pg(args.dsn) as conn:
+        with conn.transaction():
+            made = conn.execute(
+                ENSURE_SQL, (today, add_months(today, args.premake_months))
+            ).fetchone()[0]
+        archived = []
+        if args.retain_months > 0:
+            cutoff = add_months(today, -args.retain_months)
+            with conn.transaction():
+                archived = [
+                    r[0]
+                    for r in conn.execute(
+                        ARCHIVE_SQL, (cutoff, args.archive_schema)
+                    ).fetchall()
+                ]
+        parked = conn.execute(DEFAULT_ROWS_SQL).fetchone()[0]
+
+    print(f"partitions created={made} archived={len(archived)} default_rows={parked}")
+    for name in archived:
+        print(f"archived {name}")
+
+
+if __name__ == "__main__":
+    main()
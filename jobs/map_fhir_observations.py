@@ -1,17 +1,32 @@
 #!/usr/bin/env python3
+"""
+Map numeric vitals Observations (HR, SpO2, weight, BMI, blood pressure incl.
+the 85354-9 panel components) from fhir_raw.resources into analytics.data_events.
+
+Runs as one server-side INSERT ... SELECT over the resources imported since the
+last run (watermark map_fhir_observations_imported_at); see app/hp_etl/fhir_events_sql.py.
+--mode rows walks rows in Python and upserts them in savepointed chunks,
+isolating and logging bad rows.
+"""
+
 import argparse
 import json
+import sys
+import time
 from hp_etl.db import pg, dsn_from_env
+from hp_etl import generations, ingest_eval, rollups
+from hp_etl.fhir_events_sql import Mapping, Rule, run
 
 UPSERT_SQL = """
 INSERT INTO analytics.data_events
-(person_id, source, kind, code_system, code, value_num, unit, effective_time, meta)
-VALUES (%(person_id)s, %(source)s, %(kind)s, %(code_system)s, %(code)s, %(value_num)s, %(unit)s, %(effective_time)s, %(meta)s::jsonb)
-ON CONFLICT ON CONSTRAINT uq_events_person_metric_time
+(person_id, source, kind, code_system, code, value_num, unit, effective_time, raw, meta)
+VALUES (%(person_id)s, %(source)s, %(kind)s, %(code_system)s, %(code)s, %(value_num)s, %(unit)s, %(effective_time)s, %(raw)s::jsonb, %(meta)s::jsonb)
+ON CONFLICT (person_id, code_system, code, effective_time) WHERE value_num IS NOT NULL
 DO UPDATE SET
   value_num = EXCLUDED.value_num,
   unit      = EXCLUDED.unit,
-  meta      = COALESCE(analytics.data_events.meta, '{}'::jsonb) || EXCLUDED.meta;
+  meta      = COALESCE(analytics.data_events.meta, '{}'::jsonb) || EXCLUDED.meta
+RETURNING (xmax = 0)
 """
 
 LOINC_NUMERIC = {
@@ -22,19 +37,104 @@ LOINC_NUMERIC = {
     "8480-6": "mm[Hg]",  # Systolic
     "8462-4": "mm[Hg]",  # Diastolic
 }
+BP_PANEL = "85354-9"
 
+MAPPING = Mapping(
+    name="map_fhir_observations",
+    source="fhir",
+    rules=tuple(
+        Rule(code, unit, keep_unit=True, percent_to_ratio=code == "59408-5")
+        for code, unit in LOINC_NUMERIC.items()
+    )
+    + (
+        Rule("8480-6", "mm[Hg]", keep_unit=True, panel=BP_PANEL),
+        Rule("8462-4", "mm[Hg]", keep_unit=True, panel=BP_PANEL),
+    ),
+)
 
-def _emit(cur, dsn_rec):
-    cur.execute(UPSERT_SQL, dsn_rec)
 
+BATCH_SIZE = 500
+
+
+def _upsert(cur, recs) -> tuple[int, int]:
+    """executemany one chunk; returns (inserted, updated)."""
+    cur.executemany(UPSERT_SQL, recs, returning=True)
+    inserted = updated = 0
+    while True:
+        row = cur.fetchone()
+        if row is not None:
+            if row[0]:
+                inserted += 1
+            else:
+                updated += 1
+        if not cur.nextset():
+            break
+    return inserted, updated
+
+
+def write_batch(conn, cur, recs) -> tuple[int, int, list]:
+    """Upsert recs in one transaction; returns (inserted, updated, failed recs).
+
+    The chunk runs under a savepoint; if any row fails the chunk is replayed
+    row by row, each under its own savepoint, so only bad rows are dropped.
+    The rollup buckets and rule-evaluation pairs of the rows written are
+    queued in the same transaction.
+    """
+    with conn.transaction():
+        failed = []
+        try:
+            with conn.transaction():
+                ins, upd = _upsert(cur, recs)
+        except Exception:
+            ins = upd = 0
+            for rec in recs:
+                try:
+                    with conn.transaction():
+                        i, u = _upsert(cur, [rec])
+                    ins += i
+                    upd += u
+                except Exception as e:
+                    failed.append((rec, e))
+        if ins or upd:
+            bad_ids = {id(rec) for rec, _ in failed}
+            touched = [
+                (r["person_id"], r["code"], r["effective_time"])
+                for r in recs
+                if id(r) not in bad_ids
+            ]
+            rollups.mark_dirty(cur, touched)
+            ingest_eval.mark_touched(cur, touched)
+        return ins, upd, failed
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--dsn", default=dsn_from_env())
-    ap.add_argument("--person-id", default="me")
-    ap.add_argument("--limit", type=int, default=0)
-    args = ap.parse_args()
 
+def _normalize(code, val, unit, resource):
+    """(code, value, unit) tuples to write for one Observation, or None to skip."""
+    try:
+        if code == "59408-5" and val is not None:
+            v = float(val)
+            return [("59408-5", v / (100.0 if v > 1.5 else 1.0), unit or "ratio")]
+        if code == "85354-9":
+            # BP panel: look into components in raw resource
+            out = []
+            for c in resource.get("component") or []:
+                loinc = (((c.get("code") or {}).get("coding") or [{}])[0]).get("code")
+                if loinc in ("8480-6", "8462-4"):
+                    q = c.get("valueQuantity") or {}
+                    v = q.get("value")
+                    if v is None:
+                        continue
+                    out.append((loinc, float(v), q.get("unit") or LOINC_NUMERIC[loinc]))
+            return out
+        if val is None:
+            # might be a component-only observation; skip
+            return None
+        return [(code, float(val), unit or LOINC_NUMERIC.get(code, ""))]
+    except Exception:
+        return None
+
+
+def map_rows(args):
+    """Python path: walks each Observation and upserts in savepointed chunks."""
     # Pull observations that are either a direct numeric value or a BP panel with components
     sql = f"""
       SELECT id, effective_time, code_system, code, value_num, unit, resource
@@ -48,77 +148,83 @@ def main():
     """
     params = [args.limit] if args.limit else []
 
-    inserted = updated = skipped = 0
+    inserted = updated = skipped = failed = 0
+    t0 = time.monotonic()
     with pg(args.dsn) as conn, conn.cursor() as cur:
         cur.execute(sql, params)
-        for rid, ts, cs, code, val, unit, resource in cur.fetchall():
-            if ts is None:
+        rows = cur.fetchall()
+        recs = []
+        for rid, ts, cs, code, val, unit, resource in rows:
+            emitted = _normalize(code, val, unit, resource)
+            if ts is None or emitted is None:
                 skipped += 1
                 continue
-
-            # Normalize/expand
-            to_emit = []
-            if code == "59408-5" and val is not None:
-                try:
-                    v = float(val)
-                    val = v / (100.0 if v > 1.5 else 1.0)
-                except Exception:
-                    skipped += 1
-                    continue
-                to_emit.append(
-                    ("59408-5", float(val), unit or LOINC_NUMERIC["59408-5"])
+            for ccode, cval, cunit in emitted:
+                recs.append(
+                    dict(
+                        person_id=args.person_id,
+                        source="fhir",
+                        kind="Observation",
+                        code_system="LOINC",
+                        code=ccode,
+                        value_num=cval,
+                        unit=cunit,
+                        effective_time=ts,
+                        raw=json.dumps(resource),
+                        meta=json.dumps({"fhir_id": rid}),
+                    )
                 )
-            elif code == "85354-9":
-                # BP panel: look into components in raw resource
-                try:
-                    comps = resource.get("component") or []
-                    for c in comps:
-                        loinc = (((c.get("code") or {}).get("coding") or [{}])[0]).get(
-                            "code"
-                        )
-                        if loinc in ("8480-6", "8462-4"):
-                            q = c.get("valueQuantity") or {}
-                            v = q.get("value")
-                            if v is None:
-                                continue
-                            to_emit.append(
-                                (loinc, float(v), q.get("unit") or LOINC_NUMERIC[loinc])
-                            )
-                except Exception:
-                    skipped += 1
-                    continue
-            else:
-                if val is None:
-                    # might be a component-only observation; skip
-                    skipped += 1
-                    continue
-                to_emit.append((code, float(val), unit or LOINC_NUMERIC.get(code, "")))
-
-            for ccode, cval, cunit in to_emit:
-                meta = json.dumps({"fhir_id": rid})
-                rec = dict(
-                    person_id=args.person_id,
-                    source="fhir",
-                    kind="Observation",
-                    code_system="LOINC",
-                    code=ccode,
-                    value_num=cval,
-                    unit=cunit,
-                    effective_time=ts,
-                    meta=meta,
+
+        for i in range(0, len(recs), args.batch_size):
+            chunk = recs[i : i + args.batch_size]
+            ins, upd, bad = write_batch(conn, cur, chunk)
+            inserted += ins
+            updated += upd
+            failed += len(bad)
+            for rec, e in bad:
+                print(
+                    f"failed fhir_id={json.loads(rec['meta'])['fhir_id']} "
+                    f"code={rec['code']} effective_time={rec['effective_time']}: {e}",
+                    file=sys.stderr,
                 )
-                try:
-                    _emit(cur, rec)
-                    if cur.rowcount == 1:
-                        inserted += 1
-                    else:
-                        updated += 1
-                except Exception:
-                    conn.rollback()
-                    skipped += 1
-                else:
-                    conn.commit()
-    print(f"inserted={inserted} updated={updated} skipped={skipped}")
+        elapsed = time.monotonic() - t0
+    if inserted or updated:
+        generations.bump(generations.DATA_EVENTS, dsn=args.dsn)
+    rate = (inserted + updated) / elapsed if elapsed > 0 else 0.0
+    print(
+        f"inserted={inserted} updated={updated} skipped={skipped} failed={failed} "
+        f"elapsed={elapsed:.1f}s rows_per_s={rate:.0f}"
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dsn", default=dsn_from_env())
+    ap.add_argument("--person-id", default="me")
+    ap.add_argument(
+        "--since", default=None, help="re-map resources imported after this"
+    )
+    ap.add_argument("--limit", type=int, default=0, help="max resources per run")
+    ap.add_argument(
+        "--mode",
+        choices=("sql", "rows"),
+        default="sql",
+        help="sql: one server-side statement; rows: walk rows in Python",
+    )
+    ap.add_argument(
+        "--batch-size", type=int, default=BATCH_SIZE, help="rows per chunk (rows mode)"
+    )
+    args = ap.parse_args()
+
+    if args.mode == "rows":
+        map_rows(args)
+        return
+
+    res = run(MAPPING, args.person_id, args.dsn, since=args.since, limit=args.limit)
+    print(
+        f"inserted={res['inserted']} updated={res['updated']} "
+        f"watermark={res['watermark']}"
+    )
 
 
 if __name__ == "__main__":
@@ -1,89 +1,128 @@
 #!/usr/bin/env python3
 """
 Mirror FHIR Observation resources in fhir_raw.resources into analytics.data_events.
-Idempotent; can run daily. Only processes Observations newer than state 'mirror_fhir_obs_last'.
+Idempotent; can run daily. Only processes Observations imported after state
+'mirror_fhir_obs_imported_at', streamed through a server-side cursor and
+written with the COPY loader, so a run costs the size of the delta.
+Each run re-reads OVERLAP_S before the watermark: imported_at is the import
+transaction's start time, and a long import may commit rows older than the
+watermark of a run that finished meanwhile. The loader skips rows it already
+has, value-less observations included, so the overlap is cheap.
 """
 
 import argparse
 import json
+from datetime import datetime
 from hp_etl.db import pg
-from hp_etl.events import bulk_insert
+from hp_etl.events import EventLoader
 from hp_etl.state import get_state, set_state
+from hp_etl import generations
 from app.hp_etl.coding import normalize_system, normalize_unit
 
+WATERMARK_KEY = "mirror_fhir_obs_imported_at"
+# effectiveDateTime watermark used before imported_at; honoured until the first
+# run under the new key so already-mirrored observations are not copied again
+LEGACY_KEY = "mirror_fhir_obs_last"
+CHUNK_SIZE = 2000
+OVERLAP_S = 3600
+
+SELECT_SQL = """
+SELECT resource_id, resource, imported_at
+FROM fhir_raw.resources
+WHERE resource_type = 'Observation'
+  AND imported_at > %(since)s::timestamptz - make_interval(secs => %(overlap_s)s)
+  AND ((resource ? 'effectiveDateTime') OR (resource ? 'effectiveInstant'))
+  AND (%(legacy)s::text IS NULL
+       OR COALESCE(resource->>'effectiveDateTime', resource->>'effectiveInstant') > %(legacy)s)
+ORDER BY imported_at
+"""
+
+
+def to_event(r: dict, person_id: str) -> dict | None:
+    eff = r.get("effectiveDateTime") or r.get("effectiveInstant")
+    if not eff:
+        return None
+    try:
+        # partial or impossible dates would abort the whole COPY batch
+        datetime.fromisoformat(eff)
+    except (TypeError, ValueError):
+        return None
+    code = None
+    system = None
+    display = None
+    coding = (r.get("code") or {}).get("coding") or []
+    if coding:
+        system = coding[0].get("system")
+        code = coding[0].get("code")
+        display = coding[0].get("display")
+    val = None
+    unit = None
+    if "valueQuantity" in r:
+        val = r["valueQuantity"].get("value")
+        unit = r["valueQuantity"].get("unit")
+    return dict(
+        person_id=person_id,
+        source="ehr_fhir",
+        kind="Observation",
+        code_system=normalize_system(system) if system else None,
+        code=code,
+        display=display,
+        effective_time=eff,
+        effective_start=None,
+        effective_end=None,
+        value_num=val,
+        value_text=None,
+        unit=normalize_unit(unit) if unit else None,
+        device_id=None,
+        status=r.get("status"),
+        raw=json.dumps(r),
+        meta="{}",
+    )
+
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--dsn", default=None)
     ap.add_argument("--person-id", default="me")
+    ap.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
     args = ap.parse_args()
 
-    last = get_state("mirror_fhir_obs_last", args.dsn)
-    with pg(args.dsn) as conn:
-        q = """
-        SELECT resource_id, resource
-        FROM fhir_raw.resources
-        WHERE resource_type='Observation'
-          AND (
-            (resource ? 'effectiveDateTime') OR (resource ? 'effectiveInstant')
-          )
-        """
-        with conn.cursor() as cur:
-            cur.execute(q)
-            rows = cur.fetchall()
-
-    out = []
-    max_ts = last
-    for rid, res in rows:
-        r = res
-        eff = r.get("effectiveDateTime") or r.get("effectiveInstant")
-        if not eff:
-            continue
-        # e.g. '2025-09-09T12:00:00Z'
-        if last and eff <= last:
-            continue
-        code = None
-        system = None
-        display = None
-        coding = (r.get("code") or {}).get("coding") or []
-        if coding:
-            system = coding[0].get("system")
-            code = coding[0].get("code")
-            display = coding[0].get("display")
-        val = None
-        unit = None
-        if "valueQuantity" in r:
-            val = r["valueQuantity"].get("value")
-            unit = r["valueQuantity"].get("unit")
-
-        out.append(
-            dict(
-                person_id=args.person_id,
-                source="ehr_fhir",
-                kind="Observation",
-                code_system=normalize_system(system) if system else None,
-                code=code,
-                display=display,
-                effective_time=eff,
-                effective_start=None,
-                effective_end=None,
-                value_num=val,
-                value_text=None,
-                unit=normalize_unit(unit) if unit else None,
-                device_id=None,
-                status=r.get("status"),
-                raw=json.dumps(r),
-                meta="{}",
-            )
-        )
-        if (max_ts is None) or (eff > max_ts):
-            max_ts = eff
+    since = get_state(WATERMARK_KEY, args.dsn)
+    legacy = None if since else get_state(LEGACY_KEY, args.dsn)
+    max_ts = None
+    scanned = 0
+    with EventLoader(args.dsn, batch_size=args.chunk_size) as loader:
+        with pg(args.dsn) as conn:
+            # named cursor: rows stay on the server and arrive chunk by chunk
+            with conn.transaction():
+                with conn.cursor(name="mirror_fhir_obs") as cur:
+                    cur.itersize = args.chunk_size
+                    cur.execute(
+                        SELECT_SQL,
+                        {
+                            "since": since or "-infinity",
+                            "overlap_s": OVERLAP_S,
+                            "legacy": legacy,
+                        },
+                    )
+                    while True:
+                        rows = cur.fetchmany(args.chunk_size)
+                        if not rows:
+                            break
+                        scanned += len(rows)
+                        for _rid, res, imported_at in rows:
+                            ev = to_event(res, args.person_id)
+                            if ev is not None:
+                                loader.add(ev)
+                        max_ts = rows[-1][2]
 
-    if out:
-        bulk_insert(out, args.dsn)
-    if max_ts:
-        set_state("mirror_fhir_obs_last", max_ts, args.dsn)
-        print("mirror_fhir_obs_last ->", max_ts)
+    if loader.inserted:
+        generations.bump(generations.DATA_EVENTS, dsn=args.dsn)
+    # a run that only re-read the overlap leaves the watermark where it was
+    if max_ts and not (since and max_ts <= datetime.fromisoformat(since)):
+        set_state(WATERMARK_KEY, max_ts.isoformat(), args.dsn)
+        print(WATERMARK_KEY, "->", max_ts.isoformat())
+    print(f"scanned={scanned} staged={loader.staged} inserted={loader.inserted}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Recompute the vitals/liver rollup buckets queued in analytics.rollup_dirty.
+Safe to run often from cron; a run with an empty queue does nothing.
+"""
+
+import argparse
+from hp_etl.db import dsn_from_env
+from hp_etl import rollups
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dsn", default=dsn_from_env())
+    ap.add_argument("--limit", type=int, default=None, help="max buckets per run")
+    args = ap.parse_args()
+    claimed = rollups.process(args.dsn, args.limit)
+    print(f"rollup buckets={claimed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Rebuild analytics.labs_daily from analytics.data_events.
+Ingest keeps the rollup current incrementally; run this after editing
+analytics.labs_metric_catalog or loading events outside the ingest jobs.
+"""
+
+import argparse
+from hp_etl.db import dsn_from_env
+from hp_etl.labs_rollup import rebuild
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dsn", default=dsn_from_env())
+    args = ap.parse_args()
+    rows = rebuild(args.dsn)
+    print(f"labs_daily rows={rows}")
+
+
+if __name__ == "__main__":
+    main()
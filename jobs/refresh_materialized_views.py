@@ -1,52 +1,64 @@
 #!/usr/bin/env python3
 """
 Refresh materialized views used by the dashboard.
-- Attempts REFRESH MATERIALIZED VIEW CONCURRENTLY where possible, falls back to non-concurrent.
+- Refreshes views in dependency order, independent views in parallel on
+  separate connections (app/hp_etl/mv_refresh.py).
+- Skips views whose source tables have not changed since their last refresh.
+- Uses CONCURRENTLY when the view has a unique index; an exclusive fallback is
+  logged as exclusive_fallback in analytics.mv_refresh_runs.
+- Daily vitals, SpO2 percentiles, HR hourly and the HR z-score are views over
+  incremental rollups (init/064); their queued buckets are processed first.
 - Safe to run from cron with flock locking.
 """
 
 import argparse
 import sys
-from hp_etl.db import pg
+from hp_etl import generations, mv_refresh, rollups
 
 VIEWS = [
-    "analytics.mv_daily_vitals",
     "analytics.mv_vitals_daily_wide",
     "analytics.mv_events_daily",
-    "analytics.mv_hr_hourly",
-    "analytics.mv_spo2_daily_pct",
-    "analytics.mv_hr_daily_zscore",
+    "analytics.mv_weight_daily",
 ]
 
 
-def refresh_view(cur, view):
-    try:
-        cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
-        return True, "concurrent"
-    except Exception:
-        # fallback
-        cur.execute(f"REFRESH MATERIALIZED VIEW {view}")
-        return True, "non-concurrent"
-
-
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--dsn", default=None)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--force", action="store_true", help="refresh unchanged views too")
+    ap.add_argument(
+        "--no-fallback",
+        action="store_true",
+        help="fail instead of refreshing under an exclusive lock",
+    )
     args = ap.parse_args()
 
-    results = []
-    with pg(args.dsn) as conn:
-        cur = conn.cursor()
-        for v in VIEWS:
-            try:
-                ok, mode = refresh_view(cur, v)
-                results.append((v, True, mode))
-            except Exception as e:
-                results.append((v, False, str(e)))
+    ok = True
+    try:
+        print(("rollups", True, f"buckets={rollups.process(args.dsn)}"))
+    except Exception as e:
+        print(("rollups", False, str(e)))
+        ok = False
+
+    results = mv_refresh.refresh_all(
+        VIEWS,
+        args.dsn,
+        workers=args.workers,
+        force=args.force,
+        fallback=not args.no_fallback,
+    )
     for r in results:
-        print(r)
+        ms = f"{r.duration_ms:.0f}ms" if r.duration_ms is not None else "-"
+        print((r.view, r.status, ms, r.row_count, r.error))
+    # retire cached responses built from the views that changed
+    refreshed = [r.view for r in results if r.refreshed]
+    if refreshed:
+        generations.bump(*refreshed, dsn=args.dsn)
+    for view, ms, p50 in mv_refresh.regressions(refreshed, args.dsn):
+        print(f"WARNING: {view} refresh took {ms:.0f}ms (median {p50:.0f}ms)")
     # exit with non-zero if any failed
-    if any(not ok for _, ok, _ in results):
+    if not ok or any(r.status == "failed" for r in results):
         sys.exit(1)
 
 
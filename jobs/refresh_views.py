@@ -1,24 +1,29 @@
 #!/usr/bin/env python3
-from hp_etl.db import pg, dsn_from_env
+from hp_etl.db import dsn_from_env
+from hp_etl import generations, mv_refresh, rollups
 
-SQLS = [
-    "REFRESH MATERIALIZED VIEW CONCURRENTLY analytics.mv_events_daily",
-    "REFRESH MATERIALIZED VIEW CONCURRENTLY analytics.mv_vitals_daily_wide",
-    "REFRESH MATERIALIZED VIEW CONCURRENTLY analytics.mv_daily_vitals",
-    "REFRESH MATERIALIZED VIEW analytics.mv_weight_daily",
+VIEWS = [
+    "analytics.mv_events_daily",
+    "analytics.mv_vitals_daily_wide",
+    "analytics.mv_weight_daily",
 ]
 
 
 def main():
     dsn = dsn_from_env()
-    with pg(dsn) as conn, conn.cursor() as cur:
-        for stmt in SQLS:
-            try:
-                cur.execute(stmt)
-            except Exception:
-                # fallback non-concurrent if needed
-                cur.execute(stmt.replace(" CONCURRENTLY", ""))
-    print("Views refreshed.")
+    # mv_daily_vitals is a view over incremental rollups (init/064)
+    rollups.process(dsn)
+    results = mv_refresh.refresh_all(VIEWS, dsn)
+    refreshed = [r.view for r in results if r.refreshed]
+    if refreshed:
+        generations.bump(*refreshed, dsn=dsn)
+    failed = [r for r in results if r.status == "failed"]
+    for r in failed:
+        print(f"{r.view}: {r.error}")
+    print(
+        f"Views refreshed: {len(refreshed)}, unchanged: "
+        f"{sum(r.status == 'skipped' for r in results)}, failed: {len(failed)}"
+    )
 
 
 if __name__ == "__main__":
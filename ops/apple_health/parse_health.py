@@ -1,5 +1,10 @@
 #!/usr/bin/env python3
-import sys, json, uuid, xml.etree.ElementTree as ET
+import sys, json, uuid
+from pathlib import Path
+
+# shared streaming Record reader lives in app/hp_etl
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "app"))
+from hp_etl.apple_xml import iter_records
 
 HK_MAP = {
     "HKQuantityTypeIdentifierHeartRate": ("8867-4", "Heart rate", "{beats}/min", "Quantity"),
@@ -77,13 +82,21 @@ def main():
     if len(sys.argv) >= 4 and sys.argv[3].startswith("--subject="):
         subject = sys.argv[3].split("=",1)[1] or subject
 
-    root = ET.parse(export_path).getroot()
-    recs = root.findall(".//Record")
-    entries = []
+    # Records are streamed and entries written as they are made, so memory stays
+    # flat; only blood-pressure halves are held until their pair is known.
+    out = open(out_path, "w", encoding="utf-8")
+    out.write('{"resourceType": "Bundle", "type": "transaction", "entry": [\n')
     made = skipped = 0
 
+    def emit(o):
+        nonlocal made
+        rid = f"urn:uuid:{uuid.uuid4()}"
+        entry = {"request":{"method":"PUT","url":f"Observation/{rid}"},"fullUrl":rid,"resource":o}
+        out.write((",\n" if made else "") + json.dumps(entry))
+        made += 1
+
     bp = {}
-    for r in recs:
+    for r in iter_records(export_path):
         t = r.get("type")
         if t in ("HKQuantityTypeIdentifierBloodPressureSystolic","HKQuantityTypeIdentifierBloodPressureDiastolic"):
             key = (r.get("startDate"), r.get("endDate"))
@@ -91,9 +104,7 @@ def main():
             continue
         o = obs_from_record(r, subject)
         if o is not None:
-            rid = f"urn:uuid:{uuid.uuid4()}"
-            entries.append({"request":{"method":"PUT","url":f"Observation/{rid}"},"fullUrl":rid,"resource":o})
-            made += 1
+            emit(o)
         else:
             skipped += 1
 
@@ -121,22 +132,17 @@ def main():
                     {"code":{"coding":[{"system":"http://loinc.org","code":"8462-4","display":"Diastolic"}]},"valueQuantity":comp_d}
                 ]
             }
-            rid = f"urn:uuid:{uuid.uuid4()}"
-            entries.append({"request":{"method":"PUT","url":f"Observation/{rid}"},"fullUrl":rid,"resource":o})
-            made += 1
+            emit(o)
         else:
             for r in (s, d):
                 if r is not None:
                     o = obs_from_record(r, subject)
                     if o is not None:
-                        rid = f"urn:uuid:{uuid.uuid4()}"
-                        entries.append({"request":{"method":"PUT","url":f"Observation/{rid}"},"fullUrl":rid,"resource":o})
-                        made += 1
+                        emit(o)
 
-    bundle = {"resourceType":"Bundle","type":"transaction","entry":entries}
-    with open(out_path,"w",encoding="utf-8") as f:
-        json.dump(bundle, f, indent=2)
-    print(json.dumps({"made":made,"skipped":skipped,"entries":len(entries)}, indent=2))
+    out.write("\n]}\n")
+    out.close()
+    print(json.dumps({"made":made,"skipped":skipped,"entries":made}, indent=2))
 
 if __name__ == "__main__":
     main()
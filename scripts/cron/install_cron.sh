@@ -10,6 +10,8 @@ crontab -l 2>/dev/null | awk -v b="$BEGIN" -v e="$END" '
 ' > "$TMP"
 cat >> "$TMP" <<'CRON'
 # BEGIN health_portal
+* * * * * . /mnt/nas_storage/repos/health_portal/scripts/cron/env.sh && flock -n /tmp/hp_eval.lock python /mnt/nas_storage/repos/health_portal/jobs/eval_findings.py --dsn "$HP_DSN" --listen >> /mnt/nas_storage/repos/health_portal/cron.log 2>&1
+50 1 * * * . /mnt/nas_storage/repos/health_portal/scripts/cron/env.sh && flock -n /tmp/hp_partitions.lock python /mnt/nas_storage/repos/health_portal/jobs/maintain_event_partitions.py --dsn "$HP_DSN" >> /mnt/nas_storage/repos/health_portal/cron.log 2>&1
 8  2 * * * . /mnt/nas_storage/repos/health_portal/scripts/cron/env.sh && flock -n /tmp/hp_nightly.lock bash /mnt/nas_storage/repos/health_portal/scripts/cron/nightly.sh >> /mnt/nas_storage/repos/health_portal/cron.log 2>&1
 20 2 * * * . /mnt/nas_storage/repos/health_portal/scripts/cron/env.sh && flock -n /tmp/hp_ai.lock python /mnt/nas_storage/repos/health_portal/jobs/ai_daily_scan.py --dsn "$HP_DSN" >> /mnt/nas_storage/repos/health_portal/cron.log 2>&1
 0  3 * * * . /mnt/nas_storage/repos/health_portal/scripts/cron/env.sh && flock -n /tmp/hp_refresh_views.lock python /mnt/nas_storage/repos/health_portal/jobs/refresh_materialized_views.py --dsn "$HP_DSN" >> /mnt/nas_storage/repos/health_portal/cron.log 2>&1
@@ -6,9 +6,11 @@ DSN="${2:-${HP_DSN:-}}"
 [[ -n "$DSN" ]] || { echo "Set HP_DSN or pass DSN as 2nd arg"; exit 1; }
 
 shopt -s nullglob
-for f in "$DIR"/*.ndjson "$DIR"/*.ndjson.gz; do
-  echo "[import] $f"
+FILES=("$DIR"/*.ndjson "$DIR"/*.ndjson.gz)
+for f in "${FILES[@]}"; do
+  echo "[validate] $f"
   python jobs/validate_ndjson.py --file "$f" || true
-  python jobs/import_fhir_ndjson.py --file "$f" --dsn "$DSN"
 done
+# one run loads the files in parallel (--workers, default 4)
+[[ ${#FILES[@]} -gt 0 ]] && python jobs/import_fhir_ndjson.py --dsn "$DSN" "${FILES[@]}"
 echo "Done."
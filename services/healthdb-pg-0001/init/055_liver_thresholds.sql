@@ -1,4 +1,12 @@
 -- services/healthdb-pg-0001/init/055_liver_thresholds.sql
+CREATE TABLE IF NOT EXISTS analytics.anomaly_thresholds (
+  code    text PRIMARY KEY,
+  min_val double precision,
+  max_val double precision,
+  reason  text,
+  enabled boolean NOT NULL DEFAULT true
+);
+
 INSERT INTO analytics.anomaly_thresholds (code, min_val, max_val, reason, enabled)
 VALUES
   ('1742-6', 0, 55,  'ALT high', TRUE),
@@ -0,0 +1,15 @@
+-- Natural key for measurements, used by app.hp_etl.events COPY merges
+-- (ON CONFLICT ... DO NOTHING). 048_dedupe_events.sql removes existing duplicates.
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_indexes
+    WHERE schemaname='analytics' AND indexname='uq_events_person_metric_time'
+  ) THEN
+    EXECUTE $DDL$
+      CREATE UNIQUE INDEX uq_events_person_metric_time
+        ON analytics.data_events(person_id, code_system, code, effective_time)
+        WHERE value_num IS NOT NULL;
+    $DDL$;
+  END IF;
+END $$;
@@ -0,0 +1,116 @@
+-- 063_labs_daily.sql
+-- Persisted per-person/label/day lab rollup replacing the on-the-fly aggregation
+-- behind analytics.v_labs_all / v_labs_all_grouped.
+-- - analytics.labs_daily: median (percentile_disc 0.5) and count per person, label, UTC day
+-- - analytics.labs_daily_refresh(person, times): recompute the days touched by an ingest
+-- - analytics.labs_daily_rebuild(): full rebuild (catalog edits, backfills); see jobs/rebuild_labs_daily.py
+-- The v_labs_all* views keep their shape and now read from the rollup.
+
+CREATE TABLE IF NOT EXISTS analytics.labs_daily (
+  person_id      text    NOT NULL,
+  label_key_norm text    NOT NULL,
+  day            date    NOT NULL,
+  label          text    NOT NULL,
+  group_name     text    NOT NULL DEFAULT 'Other',
+  sensitive      boolean NOT NULL DEFAULT false,
+  value_num      double precision,
+  n              integer NOT NULL,
+  updated_at     timestamptz NOT NULL DEFAULT now(),
+  CONSTRAINT labs_daily_pk PRIMARY KEY (person_id, label_key_norm, day, label)
+);
+
+CREATE OR REPLACE FUNCTION analytics.labs_daily_refresh(p_person_id text, p_times timestamptz[])
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_days date[];
+  v_rows integer;
+BEGIN
+  SELECT array_agg(DISTINCT (t AT TIME ZONE 'UTC')::date)
+    INTO v_days
+  FROM unnest(p_times) AS t
+  WHERE t IS NOT NULL;
+  IF v_days IS NULL THEN
+    RETURN 0;
+  END IF;
+
+  DELETE FROM analytics.labs_daily
+  WHERE person_id = p_person_id AND day = ANY (v_days);
+
+  -- one time-range probe per day so de_person_time serves the scan
+  INSERT INTO analytics.labs_daily
+    (person_id, label_key_norm, day, label, group_name, sensitive, value_num, n)
+  SELECT
+    e.person_id,
+    c.label_key_norm,
+    d.day,
+    c.label,
+    min(c.group_name),
+    bool_or(c.sensitive),
+    percentile_disc(0.5) WITHIN GROUP (ORDER BY e.value_num),
+    count(*)
+  FROM unnest(v_days) AS d(day)
+  JOIN analytics.data_events e
+    ON e.person_id = p_person_id
+   AND e.effective_time >= (d.day::timestamp AT TIME ZONE 'UTC')
+   AND e.effective_time <  ((d.day + 1)::timestamp AT TIME ZONE 'UTC')
+  JOIN analytics.labs_metric_catalog c
+    ON e.code_system ILIKE c.code_system
+   AND e.code = c.code
+  WHERE e.value_num IS NOT NULL
+    AND c.enabled IS TRUE
+  GROUP BY e.person_id, c.label_key_norm, d.day, c.label;
+
+  GET DIAGNOSTICS v_rows = ROW_COUNT;
+  RETURN v_rows;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION analytics.labs_daily_rebuild()
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_rows integer;
+BEGIN
+  DELETE FROM analytics.labs_daily;
+
+  INSERT INTO analytics.labs_daily
+    (person_id, label_key_norm, day, label, group_name, sensitive, value_num, n)
+  SELECT
+    e.person_id,
+    c.label_key_norm,
+    (e.effective_time AT TIME ZONE 'UTC')::date,
+    c.label,
+    min(c.group_name),
+    bool_or(c.sensitive),
+    percentile_disc(0.5) WITHIN GROUP (ORDER BY e.value_num),
+    count(*)
+  FROM analytics.data_events e
+  JOIN analytics.labs_metric_catalog c
+    ON e.code_system ILIKE c.code_system
+   AND e.code = c.code
+  WHERE e.value_num IS NOT NULL
+    AND e.effective_time IS NOT NULL
+    AND c.enabled IS TRUE
+  GROUP BY e.person_id, c.label_key_norm, (e.effective_time AT TIME ZONE 'UTC')::date, c.label;
+
+  GET DIAGNOSTICS v_rows = ROW_COUNT;
+  RETURN v_rows;
+END
+$$;
+
+SELECT analytics.labs_daily_rebuild();
+
+-- Views keep their columns for existing callers (debug endpoints, scripts)
+DROP VIEW IF EXISTS analytics.v_labs_metadata_person CASCADE;
+DROP VIEW IF EXISTS analytics.v_labs_all_grouped CASCADE;
+DROP VIEW IF EXISTS analytics.v_labs_all CASCADE;
+
+CREATE OR REPLACE VIEW analytics.v_labs_all AS
+SELECT person_id, label, label_key_norm, day, value_num
+FROM analytics.labs_daily
+ORDER BY person_id, label, day;
+
+CREATE OR REPLACE VIEW analytics.v_labs_all_grouped AS
+SELECT DISTINCT person_id, label, label_key_norm, group_name, sensitive
+FROM analytics.labs_daily;
@@ -0,0 +1,251 @@
+-- 064_vitals_rollups.sql
+-- Incremental rollups replacing full rebuilds of mv_daily_vitals, mv_spo2_daily_pct,
+-- mv_hr_hourly and mv_liver_daily.
+-- - analytics.rollup_dirty: (person_id, code, day) buckets written since the last run;
+--   filled by app.hp_etl.events (COPY loads) and the FHIR mapping jobs
+-- - analytics.rollup_*: per-bucket aggregates, recomputed only for dirty buckets
+-- - analytics.rollup_process_dirty(limit): claims dirty buckets and recomputes them
+--   (jobs/process_rollups.py, jobs/refresh_materialized_views.py)
+-- The mv_* names become plain views over the rollups with the same columns, so
+-- readers are unchanged and nothing needs REFRESH anymore.
+
+CREATE TABLE IF NOT EXISTS analytics.rollup_dirty (
+  person_id text NOT NULL,
+  code      text NOT NULL,
+  day       date NOT NULL,
+  queued_at timestamptz NOT NULL DEFAULT now(),
+  CONSTRAINT rollup_dirty_pk PRIMARY KEY (person_id, code, day)
+);
+
+-- codes that feed a rollup; other buckets are dropped from the log unprocessed
+CREATE OR REPLACE FUNCTION analytics.rollup_codes()
+RETURNS text[] LANGUAGE sql IMMUTABLE AS $$
+  SELECT ARRAY['8867-4','59408-5',
+               '1742-6','1920-8','6768-6','2324-2','1975-2','1968-7','1751-7']
+$$;
+
+CREATE TABLE IF NOT EXISTS analytics.rollup_vitals_daily (
+  person_id text NOT NULL,
+  day       date NOT NULL,
+  hr_median double precision,
+  spo2_min  double precision,
+  CONSTRAINT rollup_vitals_daily_pk PRIMARY KEY (person_id, day)
+);
+CREATE INDEX IF NOT EXISTS idx_rollup_vitals_daily_day ON analytics.rollup_vitals_daily(day);
+
+CREATE TABLE IF NOT EXISTS analytics.rollup_spo2_daily (
+  person_id text NOT NULL,
+  day       date NOT NULL,
+  p10       double precision,
+  p50       double precision,
+  p90       double precision,
+  n         bigint NOT NULL,
+  CONSTRAINT rollup_spo2_daily_pk PRIMARY KEY (person_id, day)
+);
+
+-- Hour-of-day percentiles over a trailing window cannot be merged from partial
+-- aggregates, so each (day, hour) bucket keeps its sorted HR values.
+CREATE TABLE IF NOT EXISTS analytics.rollup_hr_hour (
+  person_id text NOT NULL,
+  day       date NOT NULL,
+  hour      int  NOT NULL,
+  vals      double precision[] NOT NULL,
+  CONSTRAINT rollup_hr_hour_pk PRIMARY KEY (person_id, day, hour)
+);
+
+CREATE TABLE IF NOT EXISTS analytics.rollup_liver_daily (
+  person_id        text NOT NULL,
+  day              date NOT NULL,
+  alt_p50          double precision,
+  ast_p50          double precision,
+  alp_p50          double precision,
+  ggt_p50          double precision,
+  bili_total_max   double precision,
+  bili_direct_max  double precision,
+  albumin_p50      double precision,
+  CONSTRAINT rollup_liver_daily_pk PRIMARY KEY (person_id, day)
+);
+CREATE INDEX IF NOT EXISTS idx_rollup_liver_daily_day ON analytics.rollup_liver_daily(day);
+
+CREATE OR REPLACE FUNCTION analytics.rollup_process_dirty(p_limit integer DEFAULT NULL)
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_claimed integer;
+BEGIN
+  DROP TABLE IF EXISTS pg_temp.rollup_claim;
+  CREATE TEMP TABLE rollup_claim (person_id text, code text, day date) ON COMMIT DROP;
+
+  -- claim: rows queued after this point stay in the log for the next run
+  WITH picked AS (
+    SELECT person_id, code, day FROM analytics.rollup_dirty
+    ORDER BY day
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  ), claimed AS (
+    DELETE FROM analytics.rollup_dirty d
+    USING picked p
+    WHERE d.person_id = p.person_id AND d.code = p.code AND d.day = p.day
+    RETURNING d.person_id, d.code, d.day
+  )
+  INSERT INTO rollup_claim SELECT * FROM claimed;
+  GET DIAGNOSTICS v_claimed = ROW_COUNT;
+  IF v_claimed = 0 THEN
+    RETURN 0;
+  END IF;
+
+  DROP TABLE IF EXISTS pg_temp.rollup_bucket;
+  CREATE TEMP TABLE rollup_bucket ON COMMIT DROP AS
+  SELECT DISTINCT person_id, day,
+         (day::timestamp AT TIME ZONE 'UTC') AS t0,
+         ((day + 1)::timestamp AT TIME ZONE 'UTC') AS t1,
+         bool_or(code IN ('8867-4','59408-5')) OVER w AS vitals,
+         bool_or(code = '8867-4') OVER w AS hr,
+         bool_or(code = '59408-5') OVER w AS spo2,
+         bool_or(code IN ('1742-6','1920-8','6768-6','2324-2','1975-2','1968-7','1751-7')) OVER w AS liver
+  FROM rollup_claim
+  WINDOW w AS (PARTITION BY person_id, day);
+
+  -- daily vitals (mv_daily_vitals)
+  DELETE FROM analytics.rollup_vitals_daily r
+  USING rollup_bucket b
+  WHERE b.vitals AND r.person_id = b.person_id AND r.day = b.day;
+
+  INSERT INTO analytics.rollup_vitals_daily (person_id, day, hr_median, spo2_min)
+  SELECT b.person_id, b.day,
+         percentile_disc(0.5) WITHIN GROUP (ORDER BY e.value_num) FILTER (WHERE e.code = '8867-4'),
+         min(e.value_num) FILTER (WHERE e.code = '59408-5')
+  FROM rollup_bucket b
+  JOIN analytics.data_events e
+    ON e.person_id = b.person_id
+   AND e.effective_time >= b.t0 AND e.effective_time < b.t1
+   AND e.code_system = 'LOINC' AND e.code IN ('8867-4','59408-5')
+  WHERE b.vitals
+  GROUP BY b.person_id, b.day;
+
+  -- SpO2 percentiles (mv_spo2_daily_pct)
+  DELETE FROM analytics.rollup_spo2_daily r
+  USING rollup_bucket b
+  WHERE b.spo2 AND r.person_id = b.person_id AND r.day = b.day;
+
+  INSERT INTO analytics.rollup_spo2_daily (person_id, day, p10, p50, p90, n)
+  SELECT b.person_id, b.day,
+         percentile_disc(0.1) WITHIN GROUP (ORDER BY e.value_num),
+         percentile_disc(0.5) WITHIN GROUP (ORDER BY e.value_num),
+         percentile_disc(0.9) WITHIN GROUP (ORDER BY e.value_num),
+         count(*)
+  FROM rollup_bucket b
+  JOIN analytics.data_events e
+    ON e.person_id = b.person_id
+   AND e.effective_time >= b.t0 AND e.effective_time < b.t1
+   AND e.code_system = 'LOINC' AND e.code = '59408-5'
+  WHERE b.spo2
+  GROUP BY b.person_id, b.day;
+
+  -- HR hour buckets (mv_hr_hourly)
+  DELETE FROM analytics.rollup_hr_hour r
+  USING rollup_bucket b
+  WHERE b.hr AND r.person_id = b.person_id AND r.day = b.day;
+
+  INSERT INTO analytics.rollup_hr_hour (person_id, day, hour, vals)
+  SELECT b.person_id, b.day,
+         EXTRACT(hour FROM e.effective_time AT TIME ZONE 'UTC')::int,
+         array_agg(e.value_num ORDER BY e.value_num)
+  FROM rollup_bucket b
+  JOIN analytics.data_events e
+    ON e.person_id = b.person_id
+   AND e.effective_time >= b.t0 AND e.effective_time < b.t1
+   AND e.code_system = 'LOINC' AND e.code = '8867-4'
+  WHERE b.hr AND e.value_num IS NOT NULL
+  GROUP BY b.person_id, b.day, 3;
+
+  -- liver labs (mv_liver_daily)
+  DELETE FROM analytics.rollup_liver_daily r
+  USING rollup_bucket b
+  WHERE b.liver AND r.person_id = b.person_id AND r.day = b.day;
+
+  INSERT INTO analytics.rollup_liver_daily
+    (person_id, day, alt_p50, ast_p50, alp_p50, ggt_p50, bili_total_max, bili_direct_max, albumin_p50)
+  SELECT b.person_id, b.day,
+         PERCENTILE_DISC(0.5) WITHIN GROUP (ORDER BY CASE WHEN e.code='1742-6' THEN e.value_num END),
+         PERCENTILE_DISC(0.5) WITHIN GROUP (ORDER BY CASE WHEN e.code='1920-8' THEN e.value_num END),
+         PERCENTILE_DISC(0.5) WITHIN GROUP (ORDER BY CASE WHEN e.code='6768-6' THEN e.value_num END),
+         PERCENTILE_DISC(0.5) WITHIN GROUP (ORDER BY CASE WHEN e.code='2324-2' THEN e.value_num END),
+         MAX(CASE WHEN e.code='1975-2' THEN e.value_num END),
+         MAX(CASE WHEN e.code='1968-7' THEN e.value_num END),
+         PERCENTILE_DISC(0.5) WITHIN GROUP (ORDER BY CASE WHEN e.code='1751-7' THEN e.value_num END)
+  FROM rollup_bucket b
+  JOIN analytics.data_events e
+    ON e.person_id = b.person_id
+   AND e.effective_time >= b.t0 AND e.effective_time < b.t1
+   AND e.code_system = 'LOINC'
+   AND e.code IN ('1742-6','1920-8','6768-6','2324-2','1975-2','1968-7','1751-7')
+  WHERE b.liver AND e.value_num IS NOT NULL
+  GROUP BY b.person_id, b.day;
+
+  RETURN v_claimed;
+END
+$$;
+
+-- First run only (the materialized views still exist): queue every existing
+-- bucket, build the rollups, then drop the materialized views.
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM pg_matviews
+    WHERE schemaname = 'analytics'
+      AND matviewname IN ('mv_daily_vitals','mv_spo2_daily_pct','mv_hr_hourly','mv_liver_daily')
+  ) THEN
+    INSERT INTO analytics.rollup_dirty (person_id, code, day)
+    SELECT DISTINCT person_id, code, (effective_time AT TIME ZONE 'UTC')::date
+    FROM analytics.data_events
+    WHERE code = ANY (analytics.rollup_codes()) AND effective_time IS NOT NULL
+    ON CONFLICT DO NOTHING;
+
+    PERFORM analytics.rollup_process_dirty();
+
+    DROP MATERIALIZED VIEW IF EXISTS analytics.mv_hr_daily_zscore;
+    DROP MATERIALIZED VIEW IF EXISTS analytics.mv_daily_vitals CASCADE;
+    DROP MATERIALIZED VIEW IF EXISTS analytics.mv_spo2_daily_pct CASCADE;
+    DROP MATERIALIZED VIEW IF EXISTS analytics.mv_hr_hourly CASCADE;
+    DROP MATERIALIZED VIEW IF EXISTS analytics.mv_liver_daily CASCADE;
+  END IF;
+END
+$$;
+
+-- Views over the rollups with the materialized views' columns
+CREATE OR REPLACE VIEW analytics.mv_daily_vitals AS
+SELECT person_id, day, hr_median, spo2_min
+FROM analytics.rollup_vitals_daily
+WHERE day >= current_date - 120;
+
+CREATE OR REPLACE VIEW analytics.mv_spo2_daily_pct AS
+SELECT person_id, day, p10, p50, p90, n
+FROM analytics.rollup_spo2_daily
+WHERE day >= current_date - 120;
+
+CREATE OR REPLACE VIEW analytics.mv_hr_hourly AS
+SELECT r.person_id, r.hour,
+       percentile_disc(0.5) WITHIN GROUP (ORDER BY v.hr) AS hr_median,
+       percentile_disc(0.9) WITHIN GROUP (ORDER BY v.hr) AS hr_p90,
+       count(*) AS n
+FROM analytics.rollup_hr_hour r
+CROSS JOIN LATERAL unnest(r.vals) AS v(hr)
+WHERE r.day >= current_date - 60
+GROUP BY r.person_id, r.hour;
+
+CREATE OR REPLACE VIEW analytics.mv_liver_daily AS
+SELECT person_id, day, alt_p50, ast_p50, alp_p50, ggt_p50,
+       bili_total_max, bili_direct_max, albumin_p50
+FROM analytics.rollup_liver_daily;
+
+CREATE OR REPLACE VIEW analytics.mv_hr_daily_zscore AS
+WITH daily AS (
+  SELECT person_id, day, hr_median
+  FROM analytics.mv_daily_vitals
+)
+SELECT person_id, day,
+       hr_median,
+       (hr_median - avg(hr_median) OVER w) / NULLIF(stddev_pop(hr_median) OVER w, 0) AS zscore
+FROM daily
+WINDOW w AS (PARTITION BY person_id ORDER BY day ROWS BETWEEN 20 PRECEDING AND CURRENT ROW);
@@ -0,0 +1,43 @@
+-- 065_mv_refresh_runs.sql
+-- Per-view log of materialized-view refreshes (app.hp_etl.mv_refresh).
+-- - status: concurrent | exclusive | exclusive_fallback | skipped | failed
+--   exclusive_fallback = CONCURRENTLY failed and the view was refreshed under
+--   an exclusive lock (error holds the reason)
+-- - sources_sig: change counters of the view's source tables when it was
+--   refreshed; a run whose counters match is skipped
+-- analytics.v_mv_refresh_latest flags views whose last refresh took more than
+-- twice the median of their previous runs.
+
+CREATE TABLE IF NOT EXISTS analytics.mv_refresh_runs (
+  id          bigserial PRIMARY KEY,
+  run_id      text        NOT NULL,
+  view_name   text        NOT NULL,
+  status      text        NOT NULL,
+  started_at  timestamptz NOT NULL,
+  duration_ms double precision,
+  row_count   bigint,
+  sources_sig text,
+  error       text
+);
+CREATE INDEX IF NOT EXISTS idx_mv_refresh_runs_view_started
+  ON analytics.mv_refresh_runs(view_name, started_at DESC);
+
+CREATE OR REPLACE VIEW analytics.v_mv_refresh_latest AS
+WITH ranked AS (
+  SELECT r.*,
+         row_number() OVER (PARTITION BY view_name ORDER BY started_at DESC) AS rn
+  FROM analytics.mv_refresh_runs r
+  WHERE status IN ('concurrent','exclusive','exclusive_fallback')
+)
+SELECT l.view_name, l.run_id, l.started_at, l.status, l.duration_ms, l.row_count,
+       b.p50_ms AS baseline_p50_ms,
+       b.runs   AS baseline_runs,
+       COALESCE(l.duration_ms > 2 * b.p50_ms AND l.duration_ms - b.p50_ms > 1000, false) AS regressed
+FROM ranked l
+LEFT JOIN LATERAL (
+  SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY p.duration_ms) AS p50_ms,
+         count(*) AS runs
+  FROM ranked p
+  WHERE p.view_name = l.view_name AND p.rn BETWEEN 2 AND 15
+) b ON true
+WHERE l.rn = 1;
@@ -0,0 +1,155 @@
+-- 066_data_events_partitioned.sql
+-- Monthly range partitioning of analytics.data_events on effective_time.
+-- - partitions are analytics.data_events_pYYYYMM covering one UTC month;
+--   rows without effective_time (or outside every partition) land in
+--   analytics.data_events_default
+-- - analytics.data_events_ensure_partitions(from, to): create missing months,
+--   moving matching rows out of the default partition first
+-- - analytics.data_events_archive_before(before, schema): detach whole months
+--   older than `before` and move them to an archive schema
+--   (jobs/maintain_event_partitions.py runs both)
+-- Migration (first run only): the heap is renamed to data_events_legacy, rows
+-- are copied into the partitioned table, its indexes are recreated on the
+-- parent and views / materialized views reading it are re-pointed. The id
+-- sequence is kept; id is indexed but no longer a primary key, since unique
+-- keys on a partitioned table must include effective_time.
+
+CREATE OR REPLACE FUNCTION analytics.data_events_ensure_partitions(p_from date, p_to date)
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_month date := date_trunc('month', p_from)::date;
+  v_name  text;
+  v_lo    timestamptz;
+  v_hi    timestamptz;
+  v_made  integer := 0;
+BEGIN
+  WHILE v_month <= p_to LOOP
+    v_name := 'data_events_p' || to_char(v_month, 'YYYYMM');
+    v_lo := v_month::timestamp AT TIME ZONE 'UTC';
+    v_hi := (v_month + interval '1 month')::timestamp AT TIME ZONE 'UTC';
+    IF to_regclass('analytics.' || v_name) IS NULL THEN
+      -- rows for this month parked in the default partition would block the
+      -- new bound; build the month standalone, move them, then attach
+      EXECUTE format(
+        'CREATE TABLE analytics.%I (LIKE analytics.data_events INCLUDING DEFAULTS)', v_name);
+      IF to_regclass('analytics.data_events_default') IS NOT NULL THEN
+        EXECUTE format(
+          'WITH moved AS (DELETE FROM analytics.data_events_default
+                           WHERE effective_time >= %L AND effective_time < %L
+                           RETURNING *)
+           INSERT INTO analytics.%I SELECT * FROM moved', v_lo, v_hi, v_name);
+      END IF;
+      EXECUTE format(
+        'ALTER TABLE analytics.data_events ATTACH PARTITION analytics.%I
+           FOR VALUES FROM (%L) TO (%L)', v_name, v_lo, v_hi);
+      v_made := v_made + 1;
+    END IF;
+    v_month := (v_month + interval '1 month')::date;
+  END LOOP;
+  RETURN v_made;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION analytics.data_events_archive_before(
+  p_before date, p_schema text DEFAULT 'archive')
+RETURNS SETOF text
+LANGUAGE plpgsql AS $$
+DECLARE
+  v_name text;
+BEGIN
+  EXECUTE format('CREATE SCHEMA IF NOT EXISTS %I', p_schema);
+  FOR v_name IN
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'analytics.data_events'::regclass
+      AND c.relname ~ '^data_events_p[0-9]{6}$'
+      -- whole month ends on or before the cutoff
+      AND (to_date(substr(c.relname, 14), 'YYYYMM') + interval '1 month')::date <= p_before
+    ORDER BY c.relname
+  LOOP
+    EXECUTE format('ALTER TABLE analytics.data_events DETACH PARTITION analytics.%I', v_name);
+    EXECUTE format('ALTER TABLE analytics.%I SET SCHEMA %I', v_name, p_schema);
+    RETURN NEXT p_schema || '.' || v_name;
+  END LOOP;
+END
+$$;
+
+DO $$
+DECLARE
+  v_idx  record;
+  v_dep  record;
+  v_defs text[] := '{}';
+  v_def  text;
+  v_min  date;
+  v_max  date;
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = 'analytics.data_events'::regclass) <> 'r' THEN
+    RETURN;
+  END IF;
+
+  -- index definitions to recreate on the parent (the PK is replaced by a plain id index)
+  FOR v_idx IN
+    SELECT i.indexname, i.indexdef
+    FROM pg_indexes i
+    WHERE i.schemaname = 'analytics' AND i.tablename = 'data_events'
+      AND i.indexname <> 'data_events_pkey'
+  LOOP
+    v_defs := v_defs || v_idx.indexdef;
+    EXECUTE format('ALTER INDEX analytics.%I RENAME TO %I',
+                   v_idx.indexname, left(v_idx.indexname, 55) || '_legacy');
+  END LOOP;
+
+  ALTER TABLE analytics.data_events RENAME TO data_events_legacy;
+  ALTER INDEX IF EXISTS analytics.data_events_pkey RENAME TO data_events_legacy_pkey;
+
+  CREATE TABLE analytics.data_events
+    (LIKE analytics.data_events_legacy INCLUDING DEFAULTS INCLUDING STORAGE INCLUDING COMMENTS)
+    PARTITION BY RANGE (effective_time);
+  ALTER SEQUENCE analytics.data_events_id_seq OWNED BY analytics.data_events.id;
+
+  CREATE TABLE analytics.data_events_default PARTITION OF analytics.data_events DEFAULT;
+
+  SELECT min(effective_time AT TIME ZONE 'UTC')::date, max(effective_time AT TIME ZONE 'UTC')::date
+    INTO v_min, v_max
+  FROM analytics.data_events_legacy;
+  PERFORM analytics.data_events_ensure_partitions(
+    COALESCE(v_min, current_date),
+    greatest(COALESCE(v_max, current_date), current_date + 90));
+
+  CREATE INDEX data_events_id_idx ON analytics.data_events (id);
+  FOREACH v_def IN ARRAY v_defs LOOP
+    EXECUTE v_def;
+  END LOOP;
+
+  INSERT INTO analytics.data_events SELECT * FROM analytics.data_events_legacy;
+
+  -- views follow the renamed heap by OID; point them back at data_events
+  FOR v_dep IN
+    SELECT DISTINCT c.oid, c.relkind, n.nspname, c.relname
+    FROM pg_depend d
+    JOIN pg_rewrite r ON r.oid = d.objid
+    JOIN pg_class c ON c.oid = r.ev_class
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE d.classid = 'pg_rewrite'::regclass
+      AND d.refobjid = 'analytics.data_events_legacy'::regclass
+      AND c.oid <> d.refobjid
+  LOOP
+    v_def := replace(pg_get_viewdef(v_dep.oid), 'data_events_legacy', 'data_events');
+    IF v_dep.relkind = 'v' THEN
+      EXECUTE format('CREATE OR REPLACE VIEW %I.%I AS %s', v_dep.nspname, v_dep.relname, v_def);
+    ELSE
+      SELECT coalesce(array_agg(indexdef), '{}') INTO v_defs
+      FROM pg_indexes WHERE schemaname = v_dep.nspname AND tablename = v_dep.relname;
+      EXECUTE format('DROP MATERIALIZED VIEW %I.%I', v_dep.nspname, v_dep.relname);
+      EXECUTE format('CREATE MATERIALIZED VIEW %I.%I AS %s', v_dep.nspname, v_dep.relname, v_def);
+      FOREACH v_def IN ARRAY v_defs LOOP
+        EXECUTE v_def;
+      END LOOP;
+    END IF;
+  END LOOP;
+
+  DROP TABLE analytics.data_events_legacy;
+END
+$$;
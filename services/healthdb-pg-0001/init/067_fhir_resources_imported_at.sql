@@ -0,0 +1,5 @@
+-- Watermark scans over fhir_raw.resources (jobs/mirror_fhir_observations.py,
+-- app/hp_etl/fhir_events_sql.py): resource_type = ... AND imported_at > ...
+-- ORDER BY imported_at
+CREATE INDEX IF NOT EXISTS fhir_raw_resources_type_imported
+  ON fhir_raw.resources (resource_type, imported_at);
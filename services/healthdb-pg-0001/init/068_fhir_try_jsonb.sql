@@ -0,0 +1,26 @@
+-- NULL instead of an error for lines that are not valid JSON, so a bulk
+-- NDJSON load (jobs/import_fhir_ndjson.py) can count bad lines set-based.
+-- The loader only uses it for chunks where a plain ::jsonb cast failed.
+-- PostgreSQL 16+ checks the input without raising; older servers fall back
+-- to an exception block, which costs a subtransaction per call.
+DO $$
+BEGIN
+  IF current_setting('server_version_num')::int >= 160000 THEN
+    CREATE OR REPLACE FUNCTION fhir_raw.try_jsonb(p text)
+    RETURNS jsonb
+    LANGUAGE sql IMMUTABLE AS $f$
+      SELECT CASE WHEN pg_input_is_valid(p, 'jsonb') THEN p::jsonb END
+    $f$;
+  ELSE
+    CREATE OR REPLACE FUNCTION fhir_raw.try_jsonb(p text)
+    RETURNS jsonb
+    LANGUAGE plpgsql IMMUTABLE AS $f$
+    BEGIN
+      RETURN p::jsonb;
+    EXCEPTION WHEN others THEN
+      RETURN NULL;
+    END
+    $f$;
+  END IF;
+END
+$$;
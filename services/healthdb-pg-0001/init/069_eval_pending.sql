@@ -0,0 +1,49 @@
+-- 069_eval_pending.sql
+-- Ingest-time rule evaluation (app.hp_etl.ingest_eval).
+-- Writers queue the (person, code) pairs they touched with the earliest
+-- effective_time written; one row per pair, so re-queueing only lowers `since`.
+-- Every write to the queue sends NOTIFY hp_eval, which wakes
+-- `jobs/eval_findings.py --listen`. The evaluator claims pairs, checks the
+-- points at or after `since` against analytics.anomaly_thresholds and the
+-- rules engine, and writes analytics.ai_findings. anomaly_thresholds itself is
+-- created by 055, which seeds it.
+
+CREATE TABLE IF NOT EXISTS analytics.eval_pending (
+  person_id text        NOT NULL,
+  code      text        NOT NULL,
+  since     timestamptz NOT NULL,
+  queued_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (person_id, code)
+);
+
+-- The one way writers queue pairs: parallel arrays of person, code and
+-- effective_time; NULLs are skipped and each pair keeps its earliest time.
+CREATE OR REPLACE FUNCTION analytics.queue_eval(
+  p_person text[], p_code text[], p_time timestamptz[]
+)
+RETURNS void
+LANGUAGE sql AS $$
+  INSERT INTO analytics.eval_pending (person_id, code, since)
+  SELECT p, c, min(t)
+  FROM unnest(p_person, p_code, p_time) AS u(p, c, t)
+  WHERE p IS NOT NULL AND c IS NOT NULL AND t IS NOT NULL
+  GROUP BY p, c
+  ON CONFLICT (person_id, code) DO UPDATE
+    SET since = LEAST(analytics.eval_pending.since, EXCLUDED.since),
+        queued_at = now()
+$$;
+
+CREATE OR REPLACE FUNCTION analytics.eval_pending_notify()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  -- delivered at commit; identical notifications in one transaction fold into one
+  PERFORM pg_notify('hp_eval', '');
+  RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_eval_pending_notify ON analytics.eval_pending;
+CREATE TRIGGER trg_eval_pending_notify
+  AFTER INSERT OR UPDATE ON analytics.eval_pending
+  FOR EACH STATEMENT EXECUTE FUNCTION analytics.eval_pending_notify();
@@ -0,0 +1,35 @@
+-- 070_try_timestamptz.sql
+-- NULL instead of an error for a source timestamp that does not parse
+-- (2024-13-45, "2024", ...), so one bad effectiveDateTime cannot abort a
+-- set-based mapping run (app/hp_etl/fhir_events_sql.py). Only strings that
+-- start with a calendar date are considered; 'now' or 'epoch' are not
+-- timestamps from a source system.
+-- PostgreSQL 16+ checks the input without raising; older servers fall back
+-- to an exception block, which costs a subtransaction per call.
+DO $$
+BEGIN
+  IF current_setting('server_version_num')::int >= 160000 THEN
+    CREATE OR REPLACE FUNCTION analytics.try_timestamptz(p text)
+    RETURNS timestamptz
+    LANGUAGE sql STABLE AS $f$
+      SELECT CASE
+        WHEN p ~ '^\d{4}-\d{2}-\d{2}' AND pg_input_is_valid(p, 'timestamptz')
+        THEN p::timestamptz
+      END
+    $f$;
+  ELSE
+    CREATE OR REPLACE FUNCTION analytics.try_timestamptz(p text)
+    RETURNS timestamptz
+    LANGUAGE plpgsql STABLE AS $f$
+    BEGIN
+      IF p !~ '^\d{4}-\d{2}-\d{2}' THEN
+        RETURN NULL;
+      END IF;
+      RETURN p::timestamptz;
+    EXCEPTION WHEN others THEN
+      RETURN NULL;
+    END
+    $f$;
+  END IF;
+END
+$$;
@@ -1,7 +1,11 @@
 #!/usr/bin/env bash
 set -euo pipefail
 cd "$(dirname "$0")/.."
-./scripts/psql.sh < init/040_views.sql
-./scripts/psql.sh -c 'REFRESH MATERIALIZED VIEW CONCURRENTLY analytics.mv_daily_vitals;' || \
-./scripts/psql.sh -c 'REFRESH MATERIALIZED VIEW analytics.mv_daily_vitals;'
+# mv_daily_vitals is a view over incremental rollups; apply them and process the queue
+./scripts/psql.sh < init/064_vitals_rollups.sql
+./scripts/psql.sh -c 'SELECT analytics.rollup_process_dirty();'
+# bump the cache generation so API responses built on the old data are retired
+./scripts/psql.sh -c "INSERT INTO analytics.etl_state(key, value) VALUES ('mv_daily_vitals_version', '1')
+  ON CONFLICT (key) DO UPDATE SET value = (CASE WHEN analytics.etl_state.value ~ '^[0-9]+\$'
+  THEN analytics.etl_state.value::bigint + 1 ELSE 1 END)::text;"
 echo "Views applied/refreshed."
@@ -3,8 +3,14 @@ set -euo pipefail
 cd "$(dirname "$0")/.."
 ./scripts/psql.sh < init/041_events_views.sql
 ./scripts/psql.sh < init/042_fhir_flat_views.sql
-for mv in analytics.mv_events_daily analytics.mv_vitals_daily_wide analytics.mv_daily_vitals; do
+for mv in analytics.mv_events_daily analytics.mv_vitals_daily_wide; do
   ./scripts/psql.sh -c "REFRESH MATERIALIZED VIEW CONCURRENTLY $mv;" \
   || ./scripts/psql.sh -c "REFRESH MATERIALIZED VIEW $mv;"
+  # bump the cache generation so API responses built on the old data are retired
+  ./scripts/psql.sh -c "INSERT INTO analytics.etl_state(key, value) VALUES ('${mv#analytics.}_version', '1')
+    ON CONFLICT (key) DO UPDATE SET value = (CASE WHEN analytics.etl_state.value ~ '^[0-9]+\$'
+    THEN analytics.etl_state.value::bigint + 1 ELSE 1 END)::text;"
 done
+# daily vitals/SpO2/HR hourly/liver are views over incremental rollups (init/064)
+./scripts/psql.sh -c 'SELECT analytics.rollup_process_dirty();'
 echo "Views applied & MVs refreshed."
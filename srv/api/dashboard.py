@@ -10,7 +10,9 @@ from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Resp
 from fastapi.templating import Jinja2Templates
 
 import app.hp_etl.db as db
-from app.hp_etl.cache import get as cache_get, set as cache_set
+from app.hp_etl import cache
+from app.hp_etl import generations
+from app.hp_etl import meds
 from .auth import require_api_key
 
 logger = logging.getLogger(__name__)
@@ -83,49 +85,63 @@ async def dashboard(
     since = (
         (dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=days)).date().isoformat()
     )
-    cache_key = f"dashboard:{person_id}:{days}"
-    cached = cache_get(cache_key)
-    if cached is not None:
-        return templates.TemplateResponse(
-            "dashboard.html", {**cached, "request": request}
+    try:
+        gens = await generations.acurrent(
+            generations.MV_DAILY_VITALS, generations.AI_FINDINGS
         )
+    except Exception:
+        gens = None
+    # without generations fall back to a short-lived, unversioned entry
+    gen_key = generations.key_fragment(gens) if gens else "gen=none"
+    cache_key = f"dashboard:{person_id}:{days}:{since}:{gen_key}"
+
+    def _context(vitals, findings):
+        labels = [r[0].isoformat() for r in vitals]
+        hr_values = [r[1] for r in vitals]
+        spo2_values = [r[2] for r in vitals]
+        findings_list = [
+            dict(metric=r[0], level=r[1], score=r[2], context=r[3], finding_time=r[4])
+            for r in findings
+        ]
 
-    with db.pg() as conn:
-        cur = conn.cursor()
-        try:
-            cur.execute(
+        ctx = {
+            "person_id": person_id,
+            "days": days,
+            "labels": labels,
+            "hr_values": hr_values,
+            "spo2_values": spo2_values,
+            "findings": findings_list,
+        }
+        return ctx
+
+    async def _load():
+        # errors propagate so a failed query is never cached
+        async with db.apg() as conn:
+            cur = conn.cursor()
+            await cur.execute(
                 "SELECT day, hr_median, spo2_min FROM analytics.mv_daily_vitals WHERE person_id = %s AND day >= %s::date ORDER BY day ASC",
                 (person_id, since),
             )
-            vitals = cur.fetchall()
-        except Exception:
-            vitals = []
-        try:
-            cur.execute(
+            vitals = await cur.fetchall()
+            await cur.execute(
                 "SELECT metric, level, score, context, finding_time FROM analytics.ai_findings WHERE person_id = %s AND finding_time >= %s ORDER BY finding_time DESC LIMIT 50",
                 (person_id, since),
             )
-            findings = cur.fetchall()
-        except Exception:
-            findings = []
-
-    labels = [r[0].isoformat() for r in vitals]
-    hr_values = [r[1] for r in vitals]
-    spo2_values = [r[2] for r in vitals]
-    findings_list = [
-        dict(metric=r[0], level=r[1], score=r[2], context=r[3], finding_time=r[4])
-        for r in findings
-    ]
-
-    ctx = {
-        "person_id": person_id,
-        "days": days,
-        "labels": labels,
-        "hr_values": hr_values,
-        "spo2_values": spo2_values,
-        "findings": findings_list,
-    }
-    cache_set(cache_key, ctx, ttl=30)
+            findings = await cur.fetchall()
+        return _context(vitals, findings)
+
+    # one tab recomputes an expired dashboard; the others wait for it or get
+    # the previous context while it refreshes
+    try:
+        ctx = await cache.aget_or_compute(
+            cache_key,
+            _load,
+            ttl=generations.response_ttl() if gens else 30,
+            stale_ttl=cache.stale_ttl_default(),
+        )
+    except Exception:
+        logger.exception("dashboard query failed")
+        ctx = _context([], [])
     return templates.TemplateResponse("dashboard.html", {**ctx, "request": request})
 
 
@@ -177,10 +193,10 @@ async def labs_liver_series(
     """
 
     try:
-        with db.pg() as conn:
+        async with db.apg() as conn:
             cur = conn.cursor()
-            cur.execute(sql, params)
-            rows = cur.fetchall()
+            await cur.execute(sql, params)
+            rows = await cur.fetchall()
             logger.debug(
                 "Liver series query returned %d rows for person_id=%s",
                 len(rows),
@@ -367,10 +383,10 @@ async def labs_critical_series(
             status_code=400, content={"error": "Invalid metrics specified"}
         )
 
-    with db.pg() as conn:
+    async with db.apg() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT 1 FROM person WHERE id = %s", (person_id,))
-        if cur.fetchone() is None:
+        await cur.execute("SELECT 1 FROM person WHERE id = %s", (person_id,))
+        if await cur.fetchone() is None:
             return JSONResponse(status_code=404, content={"error": "Person not found"})
 
     where_clauses = ["person_id = %s"]
@@ -392,10 +408,10 @@ async def labs_critical_series(
     """
 
     try:
-        with db.pg() as conn:
+        async with db.apg() as conn:
             cur = conn.cursor()
-            cur.execute(sql, params)
-            rows = cur.fetchall()
+            await cur.execute(sql, params)
+            rows = await cur.fetchall()
             print(
                 f"Critical series query returned {len(rows)} rows for person_id={person_id}"
             )
@@ -447,9 +463,9 @@ async def labs_critical_series(
 @router.get("/medications/{person_id}/events")
 async def medications_events(person_id: str, auth=Depends(require_api_key)):
     try:
-        with db.pg() as conn:
+        async with db.apg() as conn:
             cur = conn.cursor()
-            cur.execute(
+            await cur.execute(
                 """
                 SELECT effective_time, code
                 FROM medications.events
@@ -459,7 +475,7 @@ async def medications_events(person_id: str, auth=Depends(require_api_key)):
                 """,
                 (person_id,),
             )
-            rows = cur.fetchall()
+            rows = await cur.fetchall()
 
         events = []
         for r in rows:
@@ -473,6 +489,79 @@ async def medications_events(person_id: str, auth=Depends(require_api_key)):
         return JSONResponse(content=[])
 
 
+MED_ADHERENCE_SQL = """
+SELECT code, effective_time
+FROM medications.events
+WHERE person_id = %s AND code = ANY (%s)
+  AND effective_time >= %s AND effective_time <= %s
+"""
+
+
+@router.post("/medications/{person_id}/adherence")
+async def medications_adherence(
+    person_id: str, request: Request, auth=Depends(require_api_key)
+):
+    """Score dose plans against medications.events.
+
+    Body: {"plans": [{med_id, name, start, end, interval_h, window_min}],
+    "detail": false}; med_id is matched against medications.events.code and
+    open-ended plans run until now. Invalid plans, or plans expanding to more
+    than meds.MAX_DOSES doses, are a 400; a failed events query is a 503.
+    """
+    try:
+        body = await request.json()
+        if not isinstance(body, dict):
+            raise ValueError("body must be an object")
+        plans = [meds.plan_from_dict(p) for p in body.get("plans") or []]
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)[:500]})
+    if not plans:
+        return JSONResponse(content={})
+    now = dt.datetime.now(dt.timezone.utc)
+    lo = min(meds.epoch_s(p.start) - p.window_min * 60 for p in plans)
+    hi = (
+        max(
+            (meds.epoch_s(p.end) if p.end else now.timestamp()) + p.window_min * 60
+            for p in plans
+        )
+        + meds.LATE_H * 3600
+    )
+    try:
+        async with db.apg() as conn:
+            cur = conn.cursor()
+            await cur.execute(
+                MED_ADHERENCE_SQL,
+                (
+                    person_id,
+                    sorted({p.med_id for p in plans}),
+                    dt.datetime.fromtimestamp(lo, dt.timezone.utc),
+                    dt.datetime.fromtimestamp(hi, dt.timezone.utc),
+                ),
+            )
+            rows = await cur.fetchall()
+    except Exception as e:
+        # no events is not the same as no doses taken; never score an outage
+        logger.warning("medications_adherence error for %s: %s", person_id, e)
+        return JSONResponse(
+            status_code=503, content={"error": "medication events unavailable"}
+        )
+    events = [meds.MedEvent(code, t) for code, t in rows]
+    try:
+        scored = meds.score_plans(plans, events, until=now)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)[:500]})
+    detail = bool(body.get("detail"))
+    out = {}
+    for med_id, scores in scored.items():
+        out[med_id] = {"summary": meds.summarize(scores)}
+        if detail:
+            out[med_id]["doses"] = [
+                {"due_at": s.due_at, "status": s.status, "taken_at": s.taken_at}
+                for s in scores
+            ]
+    return JSONResponse(content=out)
+
+
 def _no_store_headers(resp: Response) -> Response:
     resp.headers["Cache-Control"] = "no-store"
     resp.headers["X-Frame-Options"] = "DENY"
@@ -484,12 +573,12 @@ async def labs_metrics_catalog():
     try:
         observed = []
         try:
-            with db.pg() as conn:
+            async with db.apg() as conn:
                 cur = conn.cursor()
-                cur.execute(
+                await cur.execute(
                     "SELECT DISTINCT LOWER(metric) FROM analytics.mv_labs_all ORDER BY 1"
                 )
-                observed = [r[0] for r in cur.fetchall()]
+                observed = [r[0] for r in await cur.fetchall()]
         except Exception:
             observed = []
 
@@ -4,7 +4,8 @@ from fastapi.templating import Jinja2Templates
 from fastapi.responses import JSONResponse
 import app.hp_etl.db as db
 from srv.api.auth import require_api_key
-from app.hp_etl.simple_cache import get as cache_get, set as cache_set
+from app.hp_etl import cache
+from app.hp_etl import generations
 import sys
 
 router = APIRouter()
@@ -34,51 +35,62 @@ async def dashboard_events_json(
     limit: int = Query(100),
     auth=Depends(require_api_key),
 ):
-    """Return JSON list of events with optional caching (ttl=30s)."""
-    cache_key = f"events:{person_id}:{metric}:{day}:{limit}"
-    cached = cache_get(cache_key)
-    if cached is not None:
-        return JSONResponse(cached)
+    """Return JSON list of events, cached until the next data_events generation."""
+    try:
+        gens = await generations.acurrent(generations.DATA_EVENTS)
+    except Exception:
+        gens = None
+    gen_key = generations.key_fragment(gens) if gens else "gen=none"
+    cache_key = f"events:{person_id}:{metric}:{day}:{limit}:{gen_key}"
 
-    where = ["person_id = %s"]
-    params = [person_id]
-    if metric:
-        if metric == "hr":
-            where.append("code = %s")
-            params.append("8867-4")
-        elif metric == "spo2":
-            where.append("code = %s")
-            params.append("59408-5")
-        else:
-            where.append("code = %s")
-            params.append(metric)
-    if day:
-        where.append("(effective_time::date) = %s::date")
-        params.append(day)
-    q = f"SELECT person_id, source, kind, code_system, code, display, effective_time, value_num, unit, meta FROM analytics.data_events WHERE {' AND '.join(where)} ORDER BY effective_time DESC LIMIT %s"
-    params.append(limit)
-    with db.pg() as conn:
-        cur = conn.cursor()
-        try:
-            cur.execute(q, tuple(params))
-            rows = cur.fetchall()
-        except Exception as e:
-            print(f"dashboard_events DB error: {e}", file=sys.stderr)
-            rows = []
-    events = [
-        dict(
-            person_id=r[0],
-            source=r[1],
-            kind=r[2],
-            code_system=r[3],
-            code=r[4],
-            display=r[5],
-            effective_time=r[6].isoformat() if r[6] else None,
-            value_num=r[7],
-            unit=r[8],
-            meta=r[9],
+    async def _load():
+        where = ["person_id = %s"]
+        params = [person_id]
+        if metric:
+            if metric == "hr":
+                where.append("code = %s")
+                params.append("8867-4")
+            elif metric == "spo2":
+                where.append("code = %s")
+                params.append("59408-5")
+            else:
+                where.append("code = %s")
+                params.append(metric)
+        if day:
+            where.append("(effective_time::date) = %s::date")
+            params.append(day)
+        q = f"SELECT person_id, source, kind, code_system, code, display, effective_time, value_num, unit, meta FROM analytics.data_events WHERE {' AND '.join(where)} ORDER BY effective_time DESC LIMIT %s"
+        params.append(limit)
+        # errors propagate so a failed query is never cached
+        async with db.apg() as conn:
+            cur = conn.cursor()
+            await cur.execute(q, tuple(params))
+            rows = await cur.fetchall()
+        events = [
+            dict(
+                person_id=r[0],
+                source=r[1],
+                kind=r[2],
+                code_system=r[3],
+                code=r[4],
+                display=r[5],
+                effective_time=r[6].isoformat() if r[6] else None,
+                value_num=r[7],
+                unit=r[8],
+                meta=r[9],
+            )
+            for r in rows
+        ]
+        return events
+
+    try:
+        events = await cache.aget_or_compute(
+            cache_key,
+            _load,
+            ttl=generations.response_ttl() if gens else 30,
+            stale_ttl=cache.stale_ttl_default(),
         )
-        for r in rows
-    ]
-    cache_set(cache_key, events, ttl=30)
+    except Exception as e:
+        print(f"dashboard_events DB error: {e}", file=sys.stderr)
+        events = []
     return JSONResponse(events)
@@ -3,6 +3,7 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 
+import app.hp_etl.db as db
 from . import dashboard, dashboard_events, genomics
 from .reports import router as reports_router
 from srv.api.routers import labs  # Import moved labs router
@@ -40,6 +41,12 @@ async def favicon():
 def healthz():
     return {"ok": True}
 
+# release pooled DB connections when the worker stops
+@app.on_event("shutdown")
+async def close_db_pools():
+    await db.aclose_pools()
+    db.close_pools()
+
 # optional labs router
 try:
     from .labs_api import router as labs_router
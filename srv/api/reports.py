@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import JSONResponse
 import app.hp_etl.db as db
+from app.hp_etl import cache
 from app.hp_etl.cache import get as cache_get, set as cache_set
+from app.hp_etl import generations
 import uuid
 
 router = APIRouter()
@@ -92,6 +94,9 @@ def critical_series(
         "hemoglobin": {"code": "HGB", "unit": "g/dL"},
     }
 
+    # data_events LOINC codes behind the hourly vitals path
+    EVENT_CODES = {"hr": "8867-4", "spo2": "59408-5"}
+
     unknown = [m for m in requested if m not in METRICS and m not in LAB_METRICS]
     if unknown:
         # Unknown metrics are not supported
@@ -142,291 +147,165 @@ def critical_series(
             status_code=400, detail="invalid date format; use ISO date or datetime"
         )
 
-    # Read ETL state to derive cache key / ttl
-    etl_ver = None
-    ttl_from_etl = None
-    try:
-        with db.pg() as conn:
-            cur = conn.cursor()
+    # hourly buckets come from analytics.data_events and need datetime bounds
+    since_dt = None
+    until_dt = None
+    if agg == "hourly":
+
+        def _parse_to_dt_utc(s: str):
             try:
-                cur.execute(
-                    "SELECT value FROM analytics.etl_state WHERE key = %s",
-                    ("mv_daily_vitals_version",),
-                )
-                r = cur.fetchone()
-                etl_ver = r[0] if r else None
+                dts = datetime.fromisoformat(s)
             except Exception:
-                etl_ver = None
-            try:
-                cur.execute(
-                    "SELECT value FROM analytics.etl_state WHERE key = %s",
-                    ("critical_series_ttl",),
+                raise HTTPException(
+                    status_code=400,
+                    detail="invalid datetime format; use ISO datetime",
                 )
-                r2 = cur.fetchone()
-                ttl_from_etl = int(r2[0]) if r2 and r2[0] else None
-            except Exception:
-                ttl_from_etl = None
-    except Exception:
-        etl_ver = None
-        ttl_from_etl = None
-
-    cache_key = f"critical_series:{person_id}:{','.join(requested)}:{since or ''}:{until or ''}:{agg}:ver={etl_ver}"
-    cached = cache_get(cache_key)
-    if cached is not None:
-        return JSONResponse(content=cached, headers={"Cache-Control": "no-store"})
+            if dts.tzinfo is None:
+                dts = dts.replace(tzinfo=timezone.utc)
+            return dts.astimezone(timezone.utc)
 
-    # Check person existence (analytics.person) and fetch data
-    with db.pg() as conn:
-        cur = conn.cursor()
-        try:
-            cur.execute(
-                "SELECT tz FROM analytics.person WHERE person_id = %s LIMIT 1",
-                (person_id,),
-            )
-            prow = cur.fetchone()
-        except Exception:
-            prow = None
-        if not prow:
-            raise HTTPException(status_code=404, detail="person not found")
-        person_tz = prow[0] if prow and prow[0] else None
-
-        # Hourly aggregation path (resample from analytics.data_events)
-        hourly_results = {}
-        if agg == "hourly":
-            # parse since/until as datetimes (UTC)
-            def _parse_to_dt_utc(s: str):
-                try:
-                    dts = datetime.fromisoformat(s)
-                except Exception:
+        if since:
+            since_dt = _parse_to_dt_utc(since)
+        if until:
+            until_dt = _parse_to_dt_utc(until)
+
+    lab_requested = [m for m in requested if m in LAB_METRICS]
+
+    def _cache_key(ver):
+        return f"critical_series:{person_id}:{','.join(requested)}:{since or ''}:{until or ''}:{agg}:ver={ver}"
+
+    gen_source = _generation_source(agg)
+
+    # The generation seen by the last batched fetch lets a warm cache answer
+    # without touching Postgres; a stale memo falls through to the single query.
+    gens = generations.peek(gen_source)
+    if gens is not None:
+        cached = cache_get(_cache_key(gens[gen_source]))
+        if cached is not None:
+            return JSONResponse(content=cached, headers={"Cache-Control": "no-store"})
+
+    def _load():
+        sql, params = _critical_series_sql(
+            person_id,
+            requested,
+            agg,
+            since_date,
+            until_date,
+            since_dt,
+            until_dt,
+            METRICS,
+            LAB_METRICS,
+            EVENT_CODES,
+        )
+        degraded = False
+        with db.pg() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+            except Exception:
+                degraded = True
+                if lab_requested:
+                    # lab table missing or query failed: mark unavailable
                     raise HTTPException(
-                        status_code=400,
-                        detail="invalid datetime format; use ISO datetime",
+                        status_code=501,
+                        detail=f"lab metric not available: {lab_requested[0]}",
+                    )
+                # vitals source unavailable: still resolve the person, serve empty
+                # series; a lookup that does not depend on etl_state either
+                try:
+                    cur.execute(
+                        "SELECT tz FROM analytics.person WHERE person_id = %s",
+                        (person_id,),
                     )
-                if dts.tzinfo is None:
-                    dts = dts.replace(tzinfo=timezone.utc)
-                return dts.astimezone(timezone.utc)
+                    person = cur.fetchall()
+                except Exception:
+                    person = []
+                rows = [
+                    ("meta", None, None, None, None, None, tz, True) for (tz,) in person
+                ]
+
+        # the 'meta' row carries etl_state + person lookup, the rest are series points
+        etl_ver = ttl_from_etl = person_tz = None
+        found = False
+        points = {}
+        for src, key, t, v, ver, ttl, tz, person_found in rows:
+            if src == "meta":
+                etl_ver = ver
+                try:
+                    ttl_from_etl = int(ttl) if ttl else None
+                except (TypeError, ValueError):
+                    ttl_from_etl = None
+                person_tz = tz or None
+                found = bool(person_found)
+            else:
+                points.setdefault((src, key), []).append((t, v))
+
+        if rows and not degraded:
+            generations.remember({gen_source: etl_ver})
+
+        if not found:
+            raise HTTPException(status_code=404, detail="person not found")
 
-            since_dt = None
-            until_dt = None
-            try:
-                if since:
-                    since_dt = _parse_to_dt_utc(since)
-                if until:
-                    until_dt = _parse_to_dt_utc(until)
-            except HTTPException:
-                raise
-
-            # mapping metrics to data_events code/system
-            EVENT_CODES = {
-                "hr": ("8867-4",),
-                "spo2": ("59408-5",),
-            }
+        def _series_for(m):
+            if m in LAB_METRICS:
+                return points.get(("lab", LAB_METRICS[m]["code"]), [])
+            if agg == "hourly":
+                return points.get(("event", EVENT_CODES[m]), [])
+            return points.get(("vital", m), [])
 
-            for m in requested:
-                # prefer data_events for vitals (hr/spo2)
-                if m in EVENT_CODES:
-                    code = EVENT_CODES[m][0]
-                    q = "SELECT date_trunc('hour', effective_time) as bucket, AVG(value_num) as avg_v FROM analytics.data_events WHERE person_id = %s AND code = %s"
-                    params = [person_id, code]
-                    if since_dt:
-                        q += " AND effective_time >= %s"
-                        params.append(since_dt)
-                    if until_dt:
-                        q += " AND effective_time <= %s"
-                        params.append(until_dt)
-                    q += " GROUP BY bucket ORDER BY bucket"
-                    try:
-                        cur.execute(q, tuple(params))
-                        hourly_rows = cur.fetchall()
-                    except Exception:
-                        hourly_rows = []
-                    hourly_results[m] = hourly_rows
-                elif m in LAB_METRICS:
-                    # try lab results table if present
-                    lab_code = LAB_METRICS[m]["code"]
-                    q = "SELECT date_trunc('hour', result_time) as bucket, AVG(result_value) as avg_v FROM analytics.lab_results WHERE person_id = %s AND code = %s"
-                    params = [person_id, lab_code]
-                    if since_dt:
-                        q += " AND result_time >= %s"
-                        params.append(since_dt)
-                    if until_dt:
-                        q += " AND result_time <= %s"
-                        params.append(until_dt)
-                    q += " GROUP BY bucket ORDER BY bucket"
-                    try:
-                        cur.execute(q, tuple(params))
-                        hourly_rows = cur.fetchall()
-                    except Exception:
-                        # lab table not present or query failed -> 501 for this metric
-                        raise HTTPException(
-                            status_code=501, detail=f"lab metric not available: {m}"
-                        )
-                    hourly_results[m] = hourly_rows
-                else:
-                    hourly_results[m] = []
-            # done; we'll process hourly_results below
-            rows = None
-        else:
-            # fetch vitals fallback from analytics.mv_daily_vitals
-            q = "SELECT day, hr_median, spo2_min FROM analytics.mv_daily_vitals WHERE person_id = %s"
-            params = [person_id]
-            if since_date:
-                q += " AND day >= %s::date"
-                params.append(str(since_date))
-            if until_date:
-                q += " AND day <= %s::date"
-                params.append(str(until_date))
-            q += " ORDER BY day ASC"
+        def _utc_z(t):
+            if t is None:
+                return None
+            if t.tzinfo is None:
+                t = t.replace(tzinfo=timezone.utc)
+            return t.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+        # transform rows into per-metric series
+        from zoneinfo import ZoneInfo
+
+        out = []
 
+        if agg == "hourly":
+            # person_tz may be None
             try:
-                cur.execute(q, tuple(params))
-                rows = cur.fetchall()
+                local_tz = ZoneInfo(person_tz) if person_tz else ZoneInfo("UTC")
             except Exception:
-                rows = []
+                local_tz = ZoneInfo("UTC")
 
-            # also try to fetch lab daily aggregates for requested lab metrics
-            lab_daily = {}
             for m in requested:
-                if m in LAB_METRICS:
-                    lab_code = LAB_METRICS[m]["code"]
-                    ql = "SELECT date_trunc('day', result_time)::date as day, AVG(result_value) as avg_v FROM analytics.lab_results WHERE person_id = %s AND code = %s"
-                    pl = [person_id, lab_code]
-                    if since_date:
-                        ql += " AND result_time::date >= %s::date"
-                        pl.append(str(since_date))
-                    if until_date:
-                        ql += " AND result_time::date <= %s::date"
-                        pl.append(str(until_date))
-                    ql += " GROUP BY day ORDER BY day ASC"
+                meta = METRICS.get(m) or LAB_METRICS[m]
+                series = []
+                for bucket, avgv in _series_for(m):
+                    if bucket is None:
+                        continue
                     try:
-                        cur.execute(ql, tuple(pl))
-                        lab_rows = cur.fetchall()
+                        t_local = bucket.astimezone(local_tz).isoformat()
                     except Exception:
-                        # lab table missing or query failed: mark unavailable
-                        raise HTTPException(
-                            status_code=501, detail=f"lab metric not available: {m}"
-                        )
-                    lab_daily[m] = lab_rows
-
-    # transform rows into per-metric series
-    from zoneinfo import ZoneInfo
-
-    out = []
-
-    if agg == "hourly":
-        # person_tz may be None
-        try:
-            local_tz = ZoneInfo(person_tz) if person_tz else ZoneInfo("UTC")
-        except Exception:
-            local_tz = ZoneInfo("UTC")
-
-        for m in requested:
-            meta = METRICS[m]
-            series = []
-            rows_h = hourly_results.get(m, [])
-            for r in rows_h:
-                # r[0]=bucket (datetime), r[1]=avg_v
-                bucket = r[0]
-                avgv = r[1]
-                if bucket is None:
-                    continue
-                # ensure tz-aware
-                if bucket.tzinfo is None:
-                    bucket = bucket.replace(tzinfo=timezone.utc)
-                t_utc = (
-                    bucket.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
-                )
-                try:
-                    t_local = bucket.astimezone(local_tz).isoformat()
-                except Exception:
-                    t_local = None
-                series.append(
+                        t_local = None
+                    series.append(
+                        {
+                            "t_utc": _utc_z(bucket),
+                            "t_local": t_local,
+                            "v": float(avgv) if avgv is not None else None,
+                        }
+                    )
+                out.append(
                     {
-                        "t_utc": t_utc,
-                        "t_local": t_local,
-                        "v": float(avgv) if avgv is not None else None,
+                        "metric": m,
+                        "unit": meta["unit"],
+                        "tz": person_tz or "UTC",
+                        "series": series,
                     }
                 )
-            out.append(
-                {
-                    "metric": m,
-                    "unit": meta["unit"],
-                    "tz": person_tz or "UTC",
-                    "series": series,
-                }
-            )
-    else:
-        for m in requested:
-            if m in METRICS:
-                meta = METRICS[m]
-                series = []
-                for r in rows:
-                    # r[0]=day, r[1]=hr_median, r[2]=spo2_min
-                    dt_obj = None
-                    if isinstance(r[0], str):
-                        # try to parse
-                        try:
-                            dt_obj = datetime.fromisoformat(r[0])
-                        except Exception:
-                            dt_obj = None
-                    else:
-                        # assume date/datetime
-                        try:
-                            if hasattr(r[0], "isoformat") and not hasattr(
-                                r[0], "tzinfo"
-                            ):
-                                # date object
-                                dt_obj = datetime.combine(
-                                    r[0], datetime.min.time(), tzinfo=timezone.utc
-                                )
-                            elif hasattr(r[0], "tzinfo"):
-                                dt_obj = r[0].astimezone(timezone.utc)
-                            else:
-                                dt_obj = datetime.fromisoformat(str(r[0]))
-                        except Exception:
-                            dt_obj = None
-
-                    if dt_obj is None:
-                        ts = None
-                    else:
-                        # ensure UTC
-                        if dt_obj.tzinfo is None:
-                            dt_obj = dt_obj.replace(tzinfo=timezone.utc)
-                        dt_utc = dt_obj.astimezone(timezone.utc)
-                        ts = dt_utc.isoformat().replace("+00:00", "Z")
-
-                    if m == "hr":
-                        val = r[1]
-                    elif m == "spo2":
-                        val = r[2]
-                    else:
-                        val = None
-                    series.append({"t": ts, "v": val})
-                out.append(
-                    {"metric": m, "unit": meta["unit"], "tz": "UTC", "series": series}
-                )
-            elif m in LAB_METRICS:
-                meta = LAB_METRICS[m]
+        else:
+            for m in requested:
+                meta = METRICS.get(m) or LAB_METRICS[m]
                 series = []
-                lab_rows = lab_daily.get(m, [])
-                for r in lab_rows:
-                    # r[0]=day (date), r[1]=avg_v
-                    day = r[0]
-                    avgv = r[1]
-                    try:
-                        dt_obj = datetime.combine(
-                            day, datetime.min.time(), tzinfo=timezone.utc
-                        )
-                        t_utc = (
-                            dt_obj.astimezone(timezone.utc)
-                            .isoformat()
-                            .replace("+00:00", "Z")
-                        )
-                    except Exception:
-                        t_utc = None
-                    series.append(
-                        {"t": t_utc, "v": float(avgv) if avgv is not None else None}
-                    )
+                for day_start, val in _series_for(m):
+                    if m in LAB_METRICS and val is not None:
+                        val = float(val)
+                    series.append({"t": _utc_z(day_start), "v": val})
                 out.append(
                     {
                         "metric": m,
@@ -436,11 +315,138 @@ def critical_series(
                     }
                 )
 
-    # store in process cache (ttl may be controlled via analytics.etl_state key "critical_series_ttl")
-    ttl = ttl_from_etl if ttl_from_etl is not None else 30
-    try:
-        cache_set(cache_key, out, ttl=ttl)
-    except Exception:
-        pass
+        # store in cache (ttl may be controlled via analytics.etl_state key "critical_series_ttl");
+        # entries keyed on a real generation are retired by the next bump, not by expiry
+        if ttl_from_etl is not None:
+            ttl = ttl_from_etl
+        elif etl_ver is not None:
+            ttl = generations.response_ttl()
+        else:
+            ttl = 30
+        try:
+            cache_set(_cache_key(etl_ver), out, ttl=ttl)
+        except Exception:
+            pass
+        return out
 
+    # concurrent misses for the same request share one database round trip
+    out = cache.single_flight(_cache_key("*"), _load)
     return JSONResponse(content=out, headers={"Cache-Control": "no-store"})
+
+
+def _generation_source(agg):
+    # daily vitals are served from mv_daily_vitals, hourly ones from data_events
+    return generations.DATA_EVENTS if agg == "hourly" else generations.MV_DAILY_VITALS
+
+
+def _critical_series_sql(
+    person_id,
+    requested,
+    agg,
+    since_date,
+    until_date,
+    since_dt,
+    until_dt,
+    metrics,
+    lab_metrics,
+    event_codes,
+):
+    """Build the single round trip behind critical_series.
+
+    Rows are (src, key, t, v, ver, ttl, tz, found): one 'meta' row with the
+    etl_state version/ttl and the person lookup, then one row per point keyed
+    by vital metric ('vital'), LOINC code ('event') or lab code ('lab').
+    Series branches are skipped by the planner when the person is unknown.
+    """
+    params = {
+        "person_id": person_id,
+        "gen_key": generations.state_key(_generation_source(agg)),
+    }
+    parts = ["""
+    SELECT 'meta' AS src, NULL::text AS key, NULL::timestamptz AS t, NULL::float8 AS v,
+           st.ver, st.ttl, p.tz, EXISTS (SELECT 1 FROM p) AS found
+    FROM st LEFT JOIN p ON true"""]
+    tail = ", NULL::text, NULL::text, NULL::text, NULL::boolean"
+
+    vitals = [m for m in requested if m in metrics]
+    labs = sorted({lab_metrics[m]["code"] for m in requested if m in lab_metrics})
+
+    if vitals and agg == "hourly":
+        params["event_codes"] = sorted({event_codes[m] for m in vitals})
+        q = f"""
+    SELECT 'event', code, date_trunc('hour', effective_time), AVG(value_num)::float8{tail}
+    FROM analytics.data_events
+    WHERE person_id = %(person_id)s AND code = ANY(%(event_codes)s)
+      AND EXISTS (SELECT 1 FROM p)"""
+        if since_dt:
+            q += " AND effective_time >= %(since_dt)s"
+            params["since_dt"] = since_dt
+        if until_dt:
+            q += " AND effective_time <= %(until_dt)s"
+            params["until_dt"] = until_dt
+        q += " GROUP BY code, date_trunc('hour', effective_time)"
+        parts.append(q)
+    elif vitals:
+        # one scan of mv_daily_vitals, unpivoted into one row per metric
+        params["vitals"] = sorted(set(vitals))
+        q = f"""
+    SELECT 'vital', u.metric, (d.day::timestamp AT TIME ZONE 'UTC'), u.v{tail}
+    FROM analytics.mv_daily_vitals d
+    CROSS JOIN LATERAL (
+      VALUES ('hr', d.hr_median::float8), ('spo2', d.spo2_min::float8)
+    ) AS u(metric, v)
+    WHERE d.person_id = %(person_id)s AND u.metric = ANY(%(vitals)s)
+      AND EXISTS (SELECT 1 FROM p)"""
+        if since_date:
+            q += " AND d.day >= %(since_date)s::date"
+            params["since_date"] = str(since_date)
+        if until_date:
+            q += " AND d.day <= %(until_date)s::date"
+            params["until_date"] = str(until_date)
+        parts.append(q)
+
+    if labs and agg == "hourly":
+        params["lab_codes"] = labs
+        q = f"""
+    SELECT 'lab', code, date_trunc('hour', result_time)::timestamptz, AVG(result_value)::float8{tail}
+    FROM analytics.lab_results
+    WHERE person_id = %(person_id)s AND code = ANY(%(lab_codes)s)
+      AND EXISTS (SELECT 1 FROM p)"""
+        if since_dt:
+            q += " AND result_time >= %(since_dt)s"
+            params["since_dt"] = since_dt
+        if until_dt:
+            q += " AND result_time <= %(until_dt)s"
+            params["until_dt"] = until_dt
+        q += " GROUP BY code, date_trunc('hour', result_time)"
+        parts.append(q)
+    elif labs:
+        params["lab_codes"] = labs
+        q = f"""
+    SELECT 'lab', code, (date_trunc('day', result_time)::date::timestamp AT TIME ZONE 'UTC'),
+           AVG(result_value)::float8{tail}
+    FROM analytics.lab_results
+    WHERE person_id = %(person_id)s AND code = ANY(%(lab_codes)s)
+      AND EXISTS (SELECT 1 FROM p)"""
+        if since_date:
+            q += " AND result_time::date >= %(since_date)s::date"
+            params["since_date"] = str(since_date)
+        if until_date:
+            q += " AND result_time::date <= %(until_date)s::date"
+            params["until_date"] = str(until_date)
+        q += " GROUP BY code, date_trunc('day', result_time)::date"
+        parts.append(q)
+
+    sql = f"""
+    WITH st AS (
+      SELECT max(value) FILTER (WHERE key = %(gen_key)s) AS ver,
+             max(value) FILTER (WHERE key = 'critical_series_ttl') AS ttl
+      FROM analytics.etl_state
+      WHERE key IN (%(gen_key)s, 'critical_series_ttl')
+    ), p AS (
+      SELECT tz FROM analytics.person WHERE person_id = %(person_id)s LIMIT 1
+    )
+    {" UNION ALL ".join(parts)}
+    ORDER BY 1 DESC, 2, 3
+    """
+    return sql, params
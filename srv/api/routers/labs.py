@@ -52,60 +52,29 @@ def labs_metadata(
 ) -> List[Dict[str, Any]]:
     try:
         with hp_db.pg(_conninfo()) as conn:
-            if include_sensitive:
-                sql = """
-                    WITH base AS (
-                      SELECT
-                        g.label_key_norm AS metric,
-                        g.label,
-                        COALESCE(g.group_name, 'Other') AS group_name,
-                        g.sensitive,
-                        COALESCE(cnt.series_count, 0) AS series_count
-                      FROM analytics.v_labs_all_grouped g
-                      LEFT JOIN (
-                        SELECT label, COUNT(*) AS series_count
-                        FROM analytics.v_labs_all
-                        WHERE person_id = %s AND value_num IS NOT NULL
-                        GROUP BY label
-                      ) cnt ON cnt.label = g.label
-                      WHERE g.person_id = %s
-                    ), ranked AS (
-                      SELECT *, ROW_NUMBER() OVER (PARTITION BY metric ORDER BY series_count DESC, label) AS rn
-                      FROM base
-                    )
-                    SELECT metric, label, group_name, sensitive, series_count
-                    FROM ranked
-                    WHERE rn = 1
-                    ORDER BY group_name, label
-                """
-                params = (person_id, person_id)
-            else:
-                sql = """
-                    WITH base AS (
-                      SELECT
-                        g.label_key_norm AS metric,
-                        g.label,
-                        COALESCE(g.group_name, 'Other') AS group_name,
-                        g.sensitive,
-                        COALESCE(cnt.series_count, 0) AS series_count
-                      FROM analytics.v_labs_all_grouped g
-                      LEFT JOIN (
-                        SELECT label, COUNT(*) AS series_count
-                        FROM analytics.v_labs_all
-                        WHERE person_id = %s AND value_num IS NOT NULL
-                        GROUP BY label
-                      ) cnt ON cnt.label = g.label
-                      WHERE g.person_id = %s AND NOT g.sensitive
-                    ), ranked AS (
-                      SELECT *, ROW_NUMBER() OVER (PARTITION BY metric ORDER BY series_count DESC, label) AS rn
-                      FROM base
-                    )
-                    SELECT metric, label, group_name, sensitive, series_count
-                    FROM ranked
-                    WHERE rn = 1
-                    ORDER BY group_name, label
-                """
-                params = (person_id, person_id)
+            # analytics.labs_daily holds one row per person/label/day (init/063),
+            # so series_count is the number of days with a value
+            sql = """
+                WITH base AS (
+                  SELECT
+                    d.label_key_norm AS metric,
+                    d.label,
+                    COALESCE(d.group_name, 'Other') AS group_name,
+                    d.sensitive,
+                    COUNT(*) FILTER (WHERE d.value_num IS NOT NULL) AS series_count
+                  FROM analytics.labs_daily d
+                  WHERE d.person_id = %s {sensitive_filter}
+                  GROUP BY d.label_key_norm, d.label, d.group_name, d.sensitive
+                ), ranked AS (
+                  SELECT *, ROW_NUMBER() OVER (PARTITION BY metric ORDER BY series_count DESC, label) AS rn
+                  FROM base
+                )
+                SELECT metric, label, group_name, sensitive, series_count
+                FROM ranked
+                WHERE rn = 1
+                ORDER BY group_name, label
+            """.format(sensitive_filter="" if include_sensitive else "AND NOT d.sensitive")
+            params = (person_id,)
             with conn.cursor(row_factory=dict_row) as cur:
                 cur.execute(sql, params)
                 rows = cur.fetchall()
@@ -123,8 +92,8 @@ def all_series(
     try:
         with hp_db.pg(_conninfo()) as conn:
             sql = (
-                "SELECT v.label, v.day AS t_utc, v.value_num "
-                "FROM analytics.v_labs_all v "
+                "SELECT v.label, v.label_key_norm, v.day AS t_utc, v.value_num "
+                "FROM analytics.labs_daily v "
                 "WHERE v.person_id = %s AND v.value_num IS NOT NULL"
             )
             params: list[Any] = [person_id]
@@ -139,23 +108,10 @@ def all_series(
                 cur.execute(sql, params)
                 rows = cur.fetchall()
 
-                # Build label -> metric key map (normalized) for this person
-                cur.execute(
-                    """
-                    SELECT DISTINCT label, label_key_norm
-                    FROM analytics.v_labs_all_grouped
-                    WHERE person_id = %s
-                    """,
-                    (person_id,)
-                )
-                map_rows = cur.fetchall()
-
-        label_to_metric = {r["label"]: (r["label_key_norm"] or (r["label"] or "").strip().lower()) for r in map_rows}
-
         series_by_metric: dict[str, list[dict[str, Any]]] = {}
         for r in rows:
             label = r["label"]
-            metric = label_to_metric.get(label, (label or "").strip().lower())
+            metric = r["label_key_norm"] or (label or "").strip().lower()
             t_utc = r["t_utc"]
             v = r["value_num"]
             point = {"t_utc": t_utc.isoformat() if hasattr(t_utc, "isoformat") else str(t_utc), "v": v}
@@ -0,0 +1,21 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture
+def load_job(monkeypatch):
+    """Import jobs/<name>.py the way it runs: with app/ on sys.path."""
+    monkeypatch.syspath_prepend(str(ROOT / "app"))
+
+    def load(name):
+        path = ROOT / "jobs" / f"{name}.py"
+        spec = importlib.util.spec_from_file_location(f"job_{name}", path)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        return mod
+
+    return load
@@ -0,0 +1,75 @@
+import json
+from datetime import date
+
+import pytest
+
+
+class FakeCur:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.calls = []
+
+    def execute(self, sql, params=None):
+        self.calls.append((sql, params))
+
+    def fetchall(self):
+        return self.rows
+
+
+@pytest.fixture
+def scan(load_job):
+    return load_job("ai_daily_scan")
+
+
+def test_fetch_days_picks_each_metrics_aggregate(scan):
+    metrics = {"hr": ("8867-4", "median"), "hr_max": ("8867-4", "max")}
+    cur = FakeCur(
+        [
+            ("a", "8867-4", date(2025, 1, 1), 60, 50, 90, 61.5),
+            ("a", "8867-4", date(2025, 1, 2), None, 55, 95, 70.0),
+            ("b", "8867-4", date(2025, 1, 1), 70, 65, 80, 71.0),
+        ]
+    )
+    out = scan.fetch_days(cur, ["a", "b"], metrics, days=30)
+    assert cur.calls[0][1] == (["a", "b"], ["8867-4"], 30)
+    assert out == {
+        ("a", "hr"): [("2025-01-01T00:00:00Z", 60.0)],
+        ("a", "hr_max"): [
+            ("2025-01-01T00:00:00Z", 90.0),
+            ("2025-01-02T00:00:00Z", 95.0),
+        ],
+        ("b", "hr"): [("2025-01-01T00:00:00Z", 70.0)],
+        ("b", "hr_max"): [("2025-01-01T00:00:00Z", 80.0)],
+    }
+
+
+def test_load_watermarks_maps_the_legacy_key_to_me(scan):
+    cur = FakeCur([("ai_last_day", "2025-01-05"), ("ai_last_day:b", "2025-01-07")])
+    marks = scan.load_watermarks(cur, ["me", "b", "c"])
+    assert set(cur.calls[0][1][0]) == {
+        "ai_last_day:me",
+        "ai_last_day:b",
+        "ai_last_day:c",
+        "ai_last_day",
+    }
+    assert marks == {"me": "2025-01-05", "b": "2025-01-07", "c": None}
+
+    # once "me" has its own watermark the legacy one is ignored
+    cur = FakeCur([("ai_last_day", "2025-01-05"), ("ai_last_day:me", "2025-01-09")])
+    assert scan.load_watermarks(cur, ["me"]) == {"me": "2025-01-09"}
+    cur = FakeCur()
+    scan.load_watermarks(cur, ["b"])
+    assert cur.calls[0][1] == (["ai_last_day:b"],)
+
+
+def test_findings_skip_days_up_to_the_watermark(scan):
+    days = [("2025-01-01T00:00:00Z", 60.0), ("2025-01-02T00:00:00Z", 90.0)]
+    series = {("a", "hr"): days}
+    scores = {("a", "hr"): [(days[0][0], 0.0), (days[1][0], 3.2)]}
+    rows = scan.findings(series, scores, last="2025-01-01T00:00:00Z")
+    assert len(rows) == 1
+    ts, metric, z, level, window, ctx = rows[0]
+    assert (ts, metric, z, level) == ("2025-01-02T00:00:00Z", "hr", 3.2, "alert")
+    assert json.loads(window) == {"n": 2, "metric": "hr", "agg": "median"}
+    assert json.loads(ctx) == {"value": 90.0, "code": "8867-4"}
+    assert len(scan.findings(series, scores)) == 2
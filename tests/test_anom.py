@@ -0,0 +1,83 @@
+import random
+import statistics
+
+import pytest
+
+from app.hp_etl import anom
+
+
+def _naive(series, window):
+    vals = [v for _, v in series]
+    out = []
+    for i, (ts, v) in enumerate(series):
+        win = vals[max(0, i - window + 1) : i + 1]
+        if len(win) < 2:
+            out.append((ts, 0.0))
+            continue
+        stdev = statistics.stdev(win)
+        mean = statistics.mean(win)
+        out.append((ts, (v - mean) / stdev if stdev > 1e-7 else 0.0))
+    return out
+
+
+def _series(n, seed=0, flat=10):
+    rnd = random.Random(seed)
+    vals = [60 + rnd.gauss(0, 8) for _ in range(n)] + [72.0] * flat
+    return [(f"d{i:04d}", v) for i, v in enumerate(vals)]
+
+
+def _close(a, b):
+    assert [ts for ts, _ in a] == [ts for ts, _ in b]
+    for (_, x), (_, y) in zip(a, b):
+        assert x == pytest.approx(y, rel=1e-9, abs=1e-9)
+
+
+@pytest.mark.parametrize("window", [1, 3, 21])
+def test_rolling_zscore_matches_naive(window):
+    s = _series(200, seed=window)
+    _close(anom.rolling_zscore(s, window), _naive(s, window))
+
+
+def test_flat_window_scores_zero():
+    s = [(str(i), 1e6 + 0.1) for i in range(100)]
+    assert all(z == 0.0 for _, z in anom.rolling_zscore(s, 7))
+
+
+def test_rolling_zscore_many_matches_per_series():
+    pytest.importorskip("numpy")
+    series = {
+        ("me", "hr"): _series(80, seed=1),
+        ("me", "spo2"): _series(5, seed=2, flat=0),
+        ("kid", "hr"): [],
+    }
+    out = anom.rolling_zscore_many(series, 21)
+    assert out[("kid", "hr")] == []
+    for key in series:
+        _close(out[key], _naive(series[key], 21))
+
+
+def test_window_must_be_positive():
+    with pytest.raises(ValueError):
+        anom.RollingZ(0)
+
+
+def test_small_spread_on_large_values_is_scored():
+    rnd = random.Random(3)
+    vals = [1e6 + rnd.gauss(0, 0.01) for _ in range(60)] + [1e6 + 0.1] * 30
+    vals += [1 + rnd.gauss(0, 1) for _ in range(40)]
+    s = [(f"d{i:04d}", v) for i, v in enumerate(vals)]
+    want = _naive(s, 7)
+    assert any(abs(z) > 1 for _, z in want[:60])
+    got = [anom.rolling_zscore(s, 7)]
+    if anom.np is not None:
+        got.append(anom.rolling_zscore_many({"k": s}, 7)["k"])
+    for res in got:
+        assert [ts for ts, _ in res] == [ts for ts, _ in want]
+        for (_, x), (_, y) in zip(res, want):
+            assert x == pytest.approx(y, rel=1e-6, abs=1e-6)
+
+
+def test_backend_names_the_implementation(monkeypatch):
+    assert anom.backend() == ("numpy" if anom.np is not None else "python")
+    monkeypatch.setattr(anom, "np", None)
+    assert anom.backend() == "python"
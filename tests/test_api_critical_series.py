@@ -3,7 +3,7 @@ import app.hp_etl.db as real_db
 
 from starlette.testclient import TestClient
 from srv.api.main import app
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
 
 client = TestClient(app)
 
@@ -44,6 +44,41 @@ def fake_pg_full(vitals_rows, person_exists=True, etl_row=None):
     yield Conn()
 
 
+class AsyncCur:
+    """Awaitable facade over a fake sync cursor, mirroring psycopg's AsyncCursor."""
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    async def execute(self, sql, params=None):
+        self._cur.execute(sql, params)
+
+    async def fetchone(self):
+        return self._cur.fetchone()
+
+    async def fetchall(self):
+        return self._cur.fetchall()
+
+
+class AsyncConn:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return AsyncCur(self._conn.cursor())
+
+
+def as_apg(pgctx):
+    """Wrap a fake pg() context manager factory as a fake apg()."""
+
+    @asynccontextmanager
+    async def apgctx(*a, **k):
+        with pgctx() as conn:
+            yield AsyncConn(conn)
+
+    return apgctx
+
+
 @contextmanager
 def pgctx_badparams():
     class Cur:
@@ -75,6 +110,7 @@ def test_happy_path(monkeypatch):
             yield conn
 
     monkeypatch.setattr(real_db, "pg", pgctx)
+    monkeypatch.setattr(real_db, "apg", as_apg(pgctx))
 
     r = client.get(
         "/labs/me/critical-series?metrics=hr,spo2&since=2025-09-01&until=2025-09-02"
@@ -91,6 +127,7 @@ def test_happy_path(monkeypatch):
 
 def test_bad_params(monkeypatch):
     monkeypatch.setattr(real_db, "pg", pgctx_badparams)
+    monkeypatch.setattr(real_db, "apg", as_apg(pgctx_badparams))
     r = client.get("/labs/me/critical-series")
     assert r.status_code == 400
     r2 = client.get("/labs/me/critical-series?metrics=unknown")
@@ -108,5 +145,6 @@ def test_unknown_person(monkeypatch):
             yield conn
 
     monkeypatch.setattr(real_db, "pg", pgctx)
+    monkeypatch.setattr(real_db, "apg", as_apg(pgctx))
     r = client.get("/labs/ghost/critical-series?metrics=hr")
     assert r.status_code == 404
@@ -0,0 +1,54 @@
+import io
+
+import pytest
+
+from app.hp_etl import apple_xml
+
+EXPORT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE HealthData [
+<!ELEMENT HealthData (ExportDate,Me,(Record|Correlation)*)>
+]>
+<HealthData locale="en_US">
+ <ExportDate value="2025-01-02 00:00:00 -0500"/>
+ <Me HKCharacteristicTypeIdentifierDateOfBirth=""/>
+ <Record type="HKQuantityTypeIdentifierHeartRate" value="61" startDate="2025-01-01 08:00:00 -0500">
+  <MetadataEntry key="HKMetadataKeyHeartRateMotionContext" value="0"/>
+ </Record>
+ <Correlation type="HKCorrelationTypeIdentifierBloodPressure">
+  <Record type="HKQuantityTypeIdentifierBloodPressureSystolic" value="120"/>
+ </Correlation>
+ <Record type="HKQuantityTypeIdentifierOxygenSaturation" value="0.97"/>
+</HealthData>
+"""
+
+
+@pytest.mark.parametrize("backend", sorted(apple_xml.BACKENDS))
+def test_backends_yield_the_same_records(backend):
+    if backend == "lxml" and apple_xml.lxml_etree is None:
+        pytest.skip("lxml not installed")
+    recs = list(apple_xml.iter_records(io.BytesIO(EXPORT), backend))
+    assert [r["value"] for r in recs] == ["61", "120", "0.97"]
+    assert recs[0]["type"] == "HKQuantityTypeIdentifierHeartRate"
+
+
+def test_expat_reads_in_small_chunks(monkeypatch):
+    monkeypatch.setattr(apple_xml, "READ_SIZE", 7)
+    recs = list(apple_xml.iter_records(io.BytesIO(EXPORT), "expat"))
+    assert len(recs) == 3
+
+
+def test_lxml_frees_non_record_siblings(monkeypatch):
+    if apple_xml.lxml_etree is None:
+        pytest.skip("lxml not installed")
+    parsers = []
+    iterparse = apple_xml.lxml_etree.iterparse
+
+    def spy(*a, **k):
+        parsers.append(iterparse(*a, **k))
+        return parsers[-1]
+
+    monkeypatch.setattr(apple_xml.lxml_etree, "iterparse", spy)
+    tail = b'<Workout workoutActivityType="Run"/>' * 50 + b"</HealthData>"
+    doc = EXPORT.replace(b"</HealthData>", tail)
+    assert len(list(apple_xml.iter_records(io.BytesIO(doc), "lxml"))) == 3
+    assert len(parsers[0].root) <= 1
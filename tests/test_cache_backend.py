@@ -0,0 +1,112 @@
+import asyncio
+import datetime as dt
+import threading
+from decimal import Decimal
+
+import pytest
+
+from app.hp_etl import cache, serializers
+
+CTX = {
+    "labels": ["2025-01-01"],
+    "findings": [
+        {
+            "score": Decimal("2.5"),
+            "finding_time": dt.datetime(2025, 1, 1, 8, tzinfo=dt.timezone.utc),
+            "day": dt.date(2025, 1, 1),
+        }
+    ],
+}
+
+
+@pytest.mark.parametrize("name", sorted(serializers._BY_NAME))
+def test_serializers_round_trip_datetimes(name):
+    ser = serializers.get_serializer(name)
+    out = serializers.loads(ser.dumps(CTX))
+    f = out["findings"][0]
+    assert f["finding_time"] == CTX["findings"][0]["finding_time"]
+    assert f["day"] == dt.date(2025, 1, 1)
+    assert f["score"] == 2.5
+
+
+def test_untagged_json_still_decodes():
+    assert serializers.loads(b'{"a": 1}') == {"a": 1}
+
+
+class FlakyRedis:
+    def __init__(self):
+        self.calls = 0
+        self.store = {}
+        self.down = True
+
+    def get(self, key):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("refused")
+        return self.store.get(key)
+
+    def mget(self, keys):
+        self.calls += 1
+        return [self.store.get(k) for k in keys]
+
+    def setex(self, key, ttl, raw):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("refused")
+        self.store[key] = raw
+
+
+def test_breaker_opens_and_falls_back_to_local(monkeypatch):
+    fake = FlakyRedis()
+    monkeypatch.setattr(cache, "redis", object())
+    monkeypatch.setattr(cache, "_client", fake)
+    monkeypatch.setattr(cache, "_serializer", serializers.get_serializer("json"))
+    monkeypatch.setattr(cache, "_breaker", {"failures": 0, "open_until": 0.0})
+    monkeypatch.setenv("HP_REDIS_BREAKER_THRESHOLD", "2")
+
+    cache.set("b:k", {"v": 1}, ttl=60)  # fails, stored locally
+    assert cache.get("b:k") == {"v": 1}  # second failure opens the breaker
+    calls = fake.calls
+    assert cache.get("b:k") == {"v": 1}
+    assert fake.calls == calls
+    assert cache.backend() == "local"
+
+    monkeypatch.setattr(cache, "_breaker", {"failures": 0, "open_until": 0.0})
+    fake.down = False
+    cache.set("b:a", [1], ttl=60)
+    cache.set("b:b", [2], ttl=60)
+    assert cache.get_many(["b:a", "b:b", "b:missing"]) == {"b:a": [1], "b:b": [2]}
+
+
+def test_async_redis_calls_leave_the_event_loop(monkeypatch):
+    fake = FlakyRedis()
+    fake.down = False
+    threads = []
+    get = fake.get
+    fake.get = lambda key: threads.append(threading.current_thread()) or get(key)
+    monkeypatch.setattr(cache, "redis", object())
+    monkeypatch.setattr(cache, "_client", fake)
+    monkeypatch.setattr(cache, "_serializer", serializers.get_serializer("json"))
+    monkeypatch.setattr(cache, "_breaker", {"failures": 0, "open_until": 0.0})
+
+    async def compute():
+        return {"v": 1}
+
+    assert asyncio.run(cache.aget_or_compute("b:async", compute, ttl=60)) == {"v": 1}
+    assert threads and threading.main_thread() not in threads
+    assert "b:async" in fake.store
+
+
+def test_unserializable_values_stay_readable_locally(monkeypatch):
+    fake = FlakyRedis()
+    fake.down = False
+    monkeypatch.setattr(cache, "redis", object())
+    monkeypatch.setattr(cache, "_client", fake)
+    monkeypatch.setattr(cache, "_serializer", serializers.get_serializer("json"))
+    monkeypatch.setattr(cache, "_breaker", {"failures": 0, "open_until": 0.0})
+    value = {"fn": object()}
+    cache.set("b:opaque", value, ttl=60)
+    assert "b:opaque" not in fake.store
+    assert cache.get("b:opaque") is value
+    assert cache.get_many(["b:opaque"]) == {"b:opaque": value}
+    cache.clear("b:opaque")
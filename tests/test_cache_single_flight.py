@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import time
+
+from app.hp_etl import cache
+
+
+def test_concurrent_misses_compute_once():
+    cache.clear("sf:threads")
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(2)
+        return {"v": 1}
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(
+                cache.get_or_compute("sf:threads", compute, ttl=60)
+            )
+        )
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert results == [{"v": 1}] * 8
+
+
+def test_async_coalescing_and_stale_while_revalidate():
+    cache.clear("sf:async")
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def scenario():
+        first = await asyncio.gather(
+            *(
+                cache.aget_or_compute("sf:async", compute, ttl=0, stale_ttl=60)
+                for _ in range(5)
+            )
+        )
+        # ttl=0: the value is immediately stale; it is served while refreshing
+        stale = await cache.aget_or_compute("sf:async", compute, ttl=0, stale_ttl=60)
+        await asyncio.sleep(0.1)
+        fresh = await cache.aget_or_compute("sf:async", compute, ttl=0, stale_ttl=60)
+        return first, stale, fresh
+
+    first, stale, fresh = asyncio.run(scenario())
+    assert first == [1] * 5
+    assert stale == 1
+    assert fresh == 2
+    assert len(calls) >= 2
+
+
+def test_errors_reach_every_waiter():
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("db down")
+
+    async def scenario():
+        return await asyncio.gather(
+            *(cache.aget_or_compute("sf:err", boom) for _ in range(3)),
+            return_exceptions=True,
+        )
+
+    errors = asyncio.run(scenario())
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert cache.get("sf:err") is None
@@ -0,0 +1,70 @@
+import asyncio
+
+from app.hp_etl import db
+
+
+class FakePgConn:
+    def __init__(self):
+        self.finished = False
+
+    def finish(self):
+        self.finished = True
+
+
+class FakeConn:
+    def __init__(self, autocommit=True):
+        self.autocommit = autocommit
+        self.pgconn = FakePgConn()
+
+    async def set_autocommit(self, value):
+        self.autocommit = value
+
+
+class FakePool:
+    check_connection = None
+
+    def __init__(self, dsn, **kwargs):
+        self.dsn = dsn
+        self.closed = False
+        self._pool = [FakeConn()]
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+def test_forked_child_builds_its_own_pools(monkeypatch):
+    monkeypatch.setattr(db, "ConnectionPool", FakePool)
+    monkeypatch.setattr(db, "_pools", {})
+    first = db.get_pool("postgresql://x")
+    assert db.get_pool("postgresql://x") is first
+    monkeypatch.setattr(db, "_pools_pid", -1)  # as seen from a forked child
+    child = db.get_pool("postgresql://x")
+    assert child is not first
+    # the parent still owns the inherited sockets; the child must not close them
+    assert not first.closed and not first._pool[0].pgconn.finished
+
+
+def test_new_event_loop_gets_a_pool_and_the_old_one_is_closed(monkeypatch):
+    monkeypatch.setattr(db, "AsyncConnectionPool", FakePool)
+    monkeypatch.setattr(db, "_async_pools", {})
+
+    async def get():
+        return await db.get_async_pool("postgresql://x")
+
+    first = asyncio.run(get())
+    second = asyncio.run(get())
+    assert second is not first
+    assert first._pool[0].pgconn.finished
+    assert list(db._async_pools.values()) == [second]
+
+
+def test_reset_hands_connections_back_in_autocommit():
+    conn = FakeConn(autocommit=False)
+    db._reset(conn)
+    assert conn.autocommit
+    conn = FakeConn(autocommit=False)
+    asyncio.run(db._areset(conn))
+    assert conn.autocommit
@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+
+from app.hp_etl import events
+
+
+class FakeCopy:
+    def __init__(self, sink):
+        self.sink = sink
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def write_row(self, row):
+        self.sink.append(row)
+
+
+class FakeCur:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def copy(self, sql):
+        self.conn.sql.append(sql)
+        return FakeCopy(self.conn.copied)
+
+    def execute(self, sql, params=None):
+        self.conn.sql.append(sql)
+        self.rowcount = len(self.conn.copied) - 1  # pretend one duplicate
+
+
+class FakeConn:
+    def __init__(self):
+        self.sql = []
+        self.copied = []
+        self.transactions = 0
+
+    def execute(self, sql, params=None):
+        self.sql.append(sql)
+
+    @contextmanager
+    def transaction(self):
+        self.transactions += 1
+        yield
+        self.copied.clear()
+
+    def cursor(self):
+        return FakeCur(self)
+
+
+def test_loader_copies_batches_over_one_connection(monkeypatch):
+    conns = []
+
+    @contextmanager
+    def fake_pg(dsn=None):
+        conns.append(FakeConn())
+        yield conns[-1]
+
+    monkeypatch.setattr(events, "pg", fake_pg)
+    rows = [
+        {
+            "person_id": "me",
+            "source": "apple_health",
+            "kind": "Observation",
+            "code": "8867-4",
+            "value_num": float(i),
+            "raw": "{}",
+        }
+        for i in range(5)
+    ]
+    with events.EventLoader(batch_size=2) as loader:
+        loader.extend(rows)
+
+    assert len(conns) == 1
+    conn = conns[0]
+    assert conn.transactions == 3
+    assert loader.staged == 5
+    assert loader.inserted == 2  # 1 + 1 + 0 after the fake duplicate per batch
+    assert "COPY data_events_stage" in conn.sql[1]
+    assert any("ON CONFLICT" in s for s in conn.sql)
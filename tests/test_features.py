@@ -0,0 +1,108 @@
+import math
+import random
+import statistics
+
+import pytest
+
+from app.hp_etl import features
+
+
+def _naive(xs, window, reduce):
+    return [
+        None if i + 1 < window else reduce(xs[i + 1 - window : i + 1])
+        for i in range(len(xs))
+    ]
+
+
+def _pstdev(chunk):
+    mean = sum(chunk) / len(chunk)
+    return math.sqrt(sum((x - mean) ** 2 for x in chunk) / len(chunk))
+
+
+CASES = [
+    (features.sma, lambda c: sum(c) / len(c)),
+    (features.rolling_min, min),
+    (features.rolling_max, max),
+    (features.volatility, _pstdev),
+]
+
+
+def _close(a, b):
+    assert len(a) == len(b)
+    for x, y in zip(a, b):
+        if y is None:
+            assert x is None
+        else:
+            assert x == pytest.approx(y, rel=1e-9, abs=1e-9)
+
+
+@pytest.mark.parametrize("fn,reduce", CASES)
+@pytest.mark.parametrize("window", [1, 3, 7, 50])
+def test_linear_kernels_match_naive(fn, reduce, window):
+    rnd = random.Random(window)
+    xs = [60 + rnd.gauss(0, 8) for _ in range(40)] + [72.0] * 10
+    _close(fn(xs, window), _naive(xs, window, reduce))
+
+
+def test_window_must_be_positive():
+    with pytest.raises(ValueError):
+        features.sma([1.0], 0)
+
+
+ARRAY_CASES = [
+    (features.sma_array, features.sma),
+    (features.rolling_min_array, features.rolling_min),
+    (features.rolling_max_array, features.rolling_max),
+    (features.volatility_array, features.volatility),
+]
+
+
+@pytest.mark.parametrize("arr_fn,list_fn", ARRAY_CASES)
+def test_array_backend_matches_lists_for_many_series(arr_fn, list_fn):
+    np = pytest.importorskip("numpy")
+    rnd = np.random.default_rng(0)
+    data = 70 + 10 * rnd.standard_normal((3, 23))
+    out = arr_fn(data, 5)
+    assert out.shape == data.shape
+    for row, res in zip(data, out):
+        _close(features.to_optional_list(res), list_fn(list(row), 5))
+
+
+@pytest.mark.parametrize("arr_fn,_", ARRAY_CASES)
+def test_array_backend_nan_only_poisons_its_windows(arr_fn, _):
+    np = pytest.importorskip("numpy")
+    data = np.arange(10, dtype=float)
+    data[4] = np.nan
+    out = arr_fn(data, 3)
+    assert np.isnan(out[:2]).all()
+    assert np.isnan(out[4:7]).all()
+    assert not np.isnan(out[[2, 3, 7, 8, 9]]).any()
+
+
+def test_volatility_keeps_small_variance_on_large_values():
+    rnd = random.Random(1)
+    # stdev 0.01 around 1e6, then a flat stretch, then small values after large
+    xs = [1e6 + rnd.gauss(0, 0.01) for _ in range(60)] + [1e6 + 0.1] * 30
+    xs += [1 + rnd.gauss(0, 1) for _ in range(40)]
+    want = _naive(xs, 7, statistics.pstdev)  # exact arithmetic
+    assert all(w == 0.0 for w in want[66:90])
+    got = [features.volatility(xs, 7)]
+    if features.np is not None:
+        got.append(features.to_optional_list(features.volatility_array(xs, 7)))
+    for res in got:
+        for x, y in zip(res, want):
+            if y is not None:
+                assert x == pytest.approx(y, rel=1e-6, abs=1e-12)
+
+
+@pytest.mark.parametrize("fn,reduce", [CASES[0], CASES[3]])
+def test_non_finite_values_only_reach_their_windows(fn, reduce):
+    xs = [1.0, math.nan, 1.0, 1.0, 3.0, math.inf, 2.0, 5.0, 4.0, 1.0]
+    got, want = fn(xs, 2), _naive(xs, 2, reduce)
+    for x, y in zip(got, want):
+        if y is None or not math.isfinite(y):
+            assert x == y or (math.isnan(x) and math.isnan(y))
+        else:
+            assert x == pytest.approx(y)
+    # the windows after each non-finite value are finite again
+    assert all(math.isfinite(x) for x in got[3:5] + got[7:])
@@ -0,0 +1,52 @@
+from app.hp_etl.fhir_events_sql import Mapping, Rule, compile
+
+MAPPING = Mapping(
+    name="t",
+    source="fhir",
+    rules=(
+        Rule("8867-4", "1/min", keep_unit=True),
+        Rule("59408-5", "ratio", percent_to_ratio=True),
+        Rule("8480-6", "mm[Hg]", keep_unit=True, panel="85354-9"),
+    ),
+    effective=("effectiveDateTime", "issued"),
+)
+
+
+def test_compile_expands_panels_and_scales_spo2():
+    sql = compile(MAPPING)
+    assert sql.count("UNION ALL") == 1
+    assert "jsonb_array_elements" in sql
+    assert "IN ('85354-9')" in sql and "IN ('8480-6')" in sql
+    assert "WHEN '59408-5' THEN CASE WHEN v > 1.5 THEN v / 100.0 ELSE v END" in sql
+    assert "WHEN '59408-5' THEN 'ratio'" in sql
+    assert "COALESCE(NULLIF(unit_in, ''), '1/min')" in sql
+    assert "COALESCE(r.resource->>'effectiveDateTime', r.resource->>'issued')" in sql
+
+
+def test_compile_is_one_parameterized_statement():
+    sql = compile(MAPPING)
+    for name in ("since", "until", "overlap_s", "person_id"):
+        assert f"%({name})s" in sql
+    # literal % must be escaped for psycopg
+    assert "'%%loinc.org'" in sql
+    assert sql.count("INSERT INTO analytics.data_events") == 1
+    assert "ON CONFLICT (person_id, code_system, code, effective_time)" in sql
+    assert "INSERT INTO analytics.rollup_dirty" in sql
+    assert "analytics.queue_eval(" in sql and "FROM ins CROSS JOIN touched" in sql
+
+
+def test_replace_mode_only_touches_changed_values():
+    merged = compile(MAPPING)
+    replaced = compile(
+        Mapping(name="r", source="ehr_fhir", rules=MAPPING.rules, update="replace")
+    )
+    assert "|| EXCLUDED.meta" in merged and "IS DISTINCT FROM" not in merged
+    assert "IS DISTINCT FROM EXCLUDED.value_num" in replaced
+    assert "UNION ALL" in replaced
+
+
+def test_window_overlaps_watermark_and_tolerates_bad_dates():
+    sql = compile(MAPPING)
+    assert "imported_at > %(since)s::timestamptz - make_interval" in sql
+    assert "analytics.try_timestamptz(eff)" in sql
+    assert "eff::timestamptz" not in sql
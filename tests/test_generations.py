@@ -0,0 +1,83 @@
+from app.hp_etl import generations
+
+
+class FakeCur:
+    def __init__(self):
+        self.calls = []
+
+    def execute(self, sql, params=None):
+        self.calls.append((sql, params))
+
+    def fetchall(self):
+        return [(k, "2") for k in self.calls[-1][1][0]]
+
+
+def test_bump_uses_view_names_and_drops_memo():
+    generations.remember({generations.MV_DAILY_VITALS: "1"})
+    cur = FakeCur()
+    out = generations.bump("analytics.mv_daily_vitals", "data_events", cur=cur)
+    assert cur.calls[0][1] == (["mv_daily_vitals_version", "data_events_version"],)
+    assert out == {"analytics.mv_daily_vitals": "2", "data_events": "2"}
+    assert generations.peek(generations.MV_DAILY_VITALS) is None
+
+
+def test_peek_requires_every_source(monkeypatch):
+    generations._memo.clear()
+    generations.remember({generations.DATA_EVENTS: "4"})
+    assert generations.peek(generations.DATA_EVENTS) == {"data_events": "4"}
+    assert generations.peek(generations.DATA_EVENTS, generations.AI_FINDINGS) is None
+
+    monkeypatch.setenv("HP_CACHE_GEN_TTL", "-1")
+    generations.remember({generations.DATA_EVENTS: "5"})
+    assert generations.peek(generations.DATA_EVENTS) is None
+
+
+def test_key_fragment_is_order_independent():
+    a = generations.key_fragment({"b": "2", "a": None})
+    assert a == "gen=a:0,b:2"
+    assert a == generations.key_fragment({"a": None, "b": "2"})
+
+
+def test_events_json_does_not_cache_a_failed_query(monkeypatch):
+    from contextlib import asynccontextmanager
+
+    from starlette.testclient import TestClient
+
+    import app.hp_etl.db as db
+    from app.hp_etl import cache
+    from srv.api.main import app
+
+    monkeypatch.setenv("HP_CACHE_BACKEND", "local")
+    monkeypatch.delenv("HP_API_KEY", raising=False)
+
+    async def acurrent(*names):
+        return {generations.DATA_EVENTS: "41"}
+
+    monkeypatch.setattr(generations, "acurrent", acurrent)
+    state = {"down": True}
+
+    class Cur:
+        async def execute(self, sql, params=None):
+            if state["down"]:
+                raise RuntimeError("connection lost")
+
+        async def fetchall(self):
+            return [
+                ("me", "apple", "obs", "LOINC", "8867-4", "HR", None, 61.0, "/min", {})
+            ]
+
+    class Conn:
+        def cursor(self):
+            return Cur()
+
+    @asynccontextmanager
+    async def apg(*a, **k):
+        yield Conn()
+
+    monkeypatch.setattr(db, "apg", apg)
+    client = TestClient(app)
+    url = "/dashboard/events.json?person_id=gen-test"
+    assert client.get(url).json() == []
+    state["down"] = False
+    assert client.get(url).json()[0]["value_num"] == 61.0
+    cache.clear("events:gen-test:None:None:100:gen=data_events:41")
@@ -0,0 +1,81 @@
+import json
+import sys
+from contextlib import contextmanager
+
+
+class FakeCopy:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def write_row(self, row):
+        self.conn.tx.append(("row", row))
+
+
+class FakeCur:
+    rowcount = 0
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def copy(self, sql):
+        return FakeCopy(self.conn)
+
+    def execute(self, sql, params=None):
+        self.conn.tx.append(("sql", sql, params))
+
+
+class FakeConn:
+    def __init__(self):
+        self.committed = []
+        self.tx = None
+
+    def execute(self, sql, params=None):
+        pass
+
+    @contextmanager
+    def transaction(self):
+        self.tx = []
+        yield
+        self.committed.append(self.tx)
+        self.tx = None
+
+    def cursor(self):
+        return FakeCur(self)
+
+
+def test_writer_commits_each_checkpoint_with_its_rows(load_job, monkeypatch):
+    job = load_job("import_apple_health")
+    conn = FakeConn()
+
+    @contextmanager
+    def fake_pg(dsn=None):
+        yield conn
+
+    monkeypatch.setattr(sys.modules[job.EventLoader.__module__], "pg", fake_pg)
+    writer = job.Writer(None, {"file": "export.xml"}, maxsize=4, checkpoint_every=2)
+    writer.start()
+    rows = [{"person_id": "me", "code": "HKSleep"}] * 3000
+    for done in (2000, 4000, 5000):
+        writer.put((done, rows, f"2025-01-0{done // 2000}T00:00:00Z"))
+    writer.close()
+
+    # more rows than the loader's default batch, but one commit per checkpoint
+    assert len(conn.committed) == 2
+    for tx, (records, n) in zip(conn.committed, ((4000, 6000), (5000, 3000))):
+        assert sum(1 for e in tx if e[0] == "row") == n
+        sql, params = tx[-1][1:]
+        assert "analytics.etl_state" in sql
+        assert params[0] == job.CHECKPOINT_KEY
+        assert json.loads(params[1])["records"] == records
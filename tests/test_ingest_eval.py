@@ -0,0 +1,111 @@
+import json
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from app.hp_etl import generations, ingest_eval
+from app.hp_etl.rules import compile_rules, rules_from_thresholds
+
+T0 = datetime(2025, 3, 1, 8, tzinfo=timezone.utc)
+ALT = [("1742-6", 0, 55, "ALT high")]
+
+
+class FakeCur:
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.calls.append((sql, params))
+        self.rows = self.results.get(sql, [])
+        if sql is ingest_eval.INSERT_SQL:
+            self.rowcount = len(params[0])
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConn:
+    def __init__(self, cur):
+        self.cur = cur
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+    def cursor(self):
+        return self.cur
+
+
+def test_mark_touched_sends_one_statement():
+    cur = FakeCur({})
+    ingest_eval.mark_touched(cur, [("me", "1742-6", T0), ("me", None, T0)])
+    assert cur.calls == [(ingest_eval.MARK_SQL, (["me"], ["1742-6"], [T0]))]
+
+
+def test_evaluate_only_reports_points_since_the_queue_mark():
+    ruleset = compile_rules(
+        rules_from_thresholds(ALT)
+        + [
+            {
+                "id": "alt-2d",
+                "when": {"metric": "1742-6", "op": ">", "value": 50, "consecutive": 2},
+            }
+        ]
+    )
+    rows = [
+        ("me", "1742-6", T0, 70.0),  # history: warms up the streak only
+        ("me", "1742-6", T0 + timedelta(days=1), 52.0),
+        ("me", "1742-6", T0 + timedelta(days=2), 40.0),
+    ]
+    out = ingest_eval.evaluate(ruleset, [("me", "1742-6", rows[1][2])], rows)
+    assert [(f[1], f[3], f[4]) for f in out] == [(rows[1][2], "rule", 52.0)]
+    assert json.loads(out[0][6])["consecutive"] == 2
+
+
+def test_process_claims_evaluates_and_writes(monkeypatch):
+    cur = FakeCur(
+        {
+            ingest_eval.CLAIM_SQL: [("me", "1742-6", T0), ("me", "8867-4", T0)],
+            ingest_eval.THRESHOLDS_SQL: ALT,
+            ingest_eval.POINTS_SQL: [("me", "1742-6", T0, 80.0)],
+        }
+    )
+    monkeypatch.setattr(ingest_eval, "pg", lambda dsn=None: nullctx(FakeConn(cur)))
+    bumped = []
+    monkeypatch.setattr(generations, "bump", lambda *s, **k: bumped.append(s))
+
+    assert ingest_eval.process(limit=10) == (2, 1)
+    points = [p for s, p in cur.calls if s is ingest_eval.POINTS_SQL][0]
+    # pairs without rules are not read back; thresholds need no history
+    assert points == (["me"], ["1742-6"], [T0], 0.0)
+    ins = [p for s, p in cur.calls if s is ingest_eval.INSERT_SQL][0]
+    assert ins[2] == ["1742-6"] and ins[3] == ["threshold"] and ins[5] == ["alert"]
+    assert bumped == [(generations.AI_FINDINGS,)]
+
+
+@contextmanager
+def nullctx(v):
+    yield v
+
+
+def test_failed_pass_is_logged_not_raised(monkeypatch, caplog):
+    results = [RuntimeError("deadlock detected"), (3, 1), (0, 0)]
+
+    def process(dsn, rules, limit):
+        r = results.pop(0)
+        if isinstance(r, Exception):
+            raise r
+        return r
+
+    monkeypatch.setattr(ingest_eval, "process", process)
+    ingest_eval._drain(None, [], 10)  # fails
+    ingest_eval._drain(None, [], 10)  # next pass drains the queue
+    assert results == []
+    assert "eval pass failed" in caplog.text
@@ -0,0 +1,65 @@
+from contextlib import contextmanager
+
+
+class FakeConn:
+    def __init__(self):
+        self.log = []
+        self.depth = 0
+
+    @contextmanager
+    def transaction(self):
+        self.depth += 1
+        try:
+            yield
+        except Exception:
+            self.log.append(("rollback", self.depth))
+            raise
+        finally:
+            self.depth -= 1
+        if self.depth == 0:
+            self.log.append(("commit", 0))
+
+
+class FakeCur:
+    def __init__(self, conn, bad_codes=()):
+        self.conn = conn
+        self.bad_codes = set(bad_codes)
+        self._rows = []
+
+    def executemany(self, sql, recs, returning=False):
+        if any(r["code"] in self.bad_codes for r in recs):
+            raise ValueError("bad row")
+        self._rows = [(True,) for _ in recs]
+
+    def execute(self, sql, params=None):
+        self.conn.log.append(("execute", self.conn.depth, sql, params))
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def nextset(self):
+        return bool(self._rows)
+
+
+def _rec(code):
+    return {
+        "person_id": "me",
+        "code": code,
+        "effective_time": "2025-01-01T00:00:00Z",
+        "meta": "{}",
+    }
+
+
+def test_write_batch_queues_marks_inside_its_transaction(load_job):
+    job = load_job("map_fhir_observations")
+    conn = FakeConn()
+    cur = FakeCur(conn, bad_codes={"bad"})
+    ins, upd, failed = job.write_batch(conn, cur, [_rec("8867-4"), _rec("bad")])
+    assert (ins, upd, [r["code"] for r, _ in failed]) == (1, 0, ["bad"])
+    marks = [e for e in conn.log if e[0] == "execute"]
+    assert marks and all(depth >= 1 for _, depth, *_ in marks)
+    assert len(marks) == 2  # rollup buckets, then rule evaluation
+    assert "queue_eval" in marks[1][2]
+    for mark in marks:
+        assert mark[3] == (["me"], ["8867-4"], ["2025-01-01T00:00:00Z"])
+    assert conn.log[-1] == ("commit", 0)
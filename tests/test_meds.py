@@ -0,0 +1,178 @@
+import random
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import app.hp_etl.db as real_db
+from app.hp_etl import meds
+from starlette.testclient import TestClient
+from srv.api.main import app
+
+
+def _greedy(expectations, events):
+    # the original O(doses x events) matcher, as the reference
+    evs = sorted(events, key=lambda e: e.taken_at)
+    used = set()
+    out = []
+    for dose in sorted(expectations, key=lambda d: d.due_at):
+        ws, we = meds.parse_isoz(dose.window_start), meds.parse_isoz(dose.window_end)
+        for status, lo, hi in (
+            ("on_time", ws, we),
+            ("late", we + timedelta(microseconds=1), we + timedelta(hours=12)),
+        ):
+            hit = next(
+                (
+                    i
+                    for i, ev in enumerate(evs)
+                    if i not in used
+                    and ev.med_id == dose.med_id
+                    and lo <= meds.parse_isoz(ev.taken_at) <= hi
+                ),
+                None,
+            )
+            if hit is not None:
+                used.add(hit)
+                out.append((dose.med_id, dose.due_at, status, evs[hit].taken_at))
+                break
+        else:
+            out.append((dose.med_id, dose.due_at, "missed", None))
+    return out
+
+
+def _case(seed):
+    rnd = random.Random(seed)
+    plans = [
+        meds.MedPlan(
+            f"m{j}",
+            "x",
+            "2025-01-01T08:00:00Z",
+            f"2025-01-{rnd.randint(2, 9):02d}T08:00:00Z",
+            rnd.choice([4, 8, 24]),
+            rnd.choice([30, 120]),
+        )
+        for j in range(2)
+    ]
+    base = datetime(2025, 1, 1, 6, tzinfo=timezone.utc)
+    events = [
+        meds.MedEvent(
+            f"m{rnd.randint(0, 2)}",
+            meds.isoformatz(base + timedelta(minutes=rnd.randrange(60 * 24 * 9))),
+        )
+        for _ in range(60)
+    ]
+    return plans, events
+
+
+def _rows(scores):
+    return [(s.med_id, s.due_at, s.status, s.taken_at) for s in scores]
+
+
+def test_score_adherence_matches_greedy_reference():
+    for seed in range(20):
+        plans, events = _case(seed)
+        exps = [e for p in plans for e in meds.expand_schedule(p)]
+        assert _rows(meds.score_adherence(exps, events)) == _greedy(exps, events)
+
+
+def test_score_plans_matches_expanded_schedule():
+    plans, events = _case(7)
+    exps = [e for p in plans for e in meds.expand_schedule(p)]
+    batch = meds.score_plans(plans, events)
+    flat = [r for scores in batch.values() for r in _rows(scores)]
+    assert sorted(flat) == sorted(_rows(meds.score_adherence(exps, events)))
+    s = meds.summarize(batch["m0"])
+    assert s["total"] == s["on_time"] + s["late"] + s["missed"] == len(batch["m0"])
+
+
+def test_adherence_endpoint(monkeypatch):
+    rows = [
+        ("aspirin", datetime(2025, 1, 1, 8, 10, tzinfo=timezone.utc)),
+        ("aspirin", datetime(2025, 1, 2, 12, 0, tzinfo=timezone.utc)),
+    ]
+
+    class Cur:
+        async def execute(self, sql, params=None):
+            assert "medications.events" in sql and params[1] == ["aspirin"]
+
+        async def fetchall(self):
+            return rows
+
+    class Conn:
+        def cursor(self):
+            return Cur()
+
+    @asynccontextmanager
+    async def apg(*a, **k):
+        yield Conn()
+
+    monkeypatch.delenv("HP_API_KEY", raising=False)
+    monkeypatch.setattr(real_db, "apg", apg)
+    plan = {
+        "med_id": "aspirin",
+        "name": "Aspirin",
+        "start": "2025-01-01T08:00:00Z",
+        "end": "2025-01-03T08:00:00Z",
+        "interval_h": 24,
+    }
+    r = TestClient(app).post(
+        "/medications/me/adherence", json={"plans": [plan], "detail": True}
+    )
+    assert r.status_code == 200
+    body = r.json()["aspirin"]
+    assert [d["status"] for d in body["doses"]] == ["on_time", "late", "missed"]
+    assert body["summary"]["adherence"] == 2 / 3
+
+
+def test_adherence_endpoint_db_error(monkeypatch):
+    @asynccontextmanager
+    async def apg(*a, **k):
+        raise RuntimeError("db down")
+        yield
+
+    monkeypatch.delenv("HP_API_KEY", raising=False)
+    monkeypatch.setattr(real_db, "apg", apg)
+    plan = {"med_id": "aspirin", "start": "2025-01-01T08:00:00Z", "interval_h": 24}
+    r = TestClient(app).post("/medications/me/adherence", json={"plans": [plan]})
+    assert r.status_code == 503
+
+
+def test_adherence_endpoint_rejects_bad_plans(monkeypatch):
+    monkeypatch.delenv("HP_API_KEY", raising=False)
+    monkeypatch.setattr(real_db, "apg", None)  # never reached
+    base = {"med_id": "aspirin", "start": "2025-01-01T08:00:00Z", "interval_h": 24}
+    bad = [
+        {"interval_h": 0},
+        {"interval_h": "8"},
+        {"interval_h": True},
+        {"start": "bad"},
+        {"start": None},
+        {"end": "2024-01-01T00:00:00Z"},
+        {"med_id": ""},
+    ]
+    client = TestClient(app)
+    for patch in bad:
+        plan = {**base, **patch}
+        r = client.post("/medications/me/adherence", json={"plans": [plan]})
+        assert r.status_code == 400, patch
+
+
+def test_score_plans_caps_doses():
+    plan = meds.MedPlan("a", "A", "2000-01-01T00:00:00Z", None, 1)
+    until = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    with pytest.raises(ValueError):
+        meds.score_plans([plan], [], until=until)
+
+
+def test_score_plans_skips_doses_not_yet_decided():
+    plan = meds.MedPlan(
+        "a", "A", "2026-10-01T08:00:00Z", "2026-12-31T08:00:00Z", 24, window_min=60
+    )
+    events = [meds.MedEvent("a", f"2026-10-{d:02d}T08:05:00Z") for d in range(1, 19)]
+    # the 10-18 dose is taken, but its late window is still open at noon
+    until = datetime(2026, 10, 18, 12, 0, tzinfo=timezone.utc)
+    s = meds.summarize(meds.score_plans([plan], events, until=until)["a"])
+    assert (s["on_time"], s["missed"], s["adherence"]) == (17, 0, 1.0)
+    until += timedelta(days=1)
+    s = meds.summarize(meds.score_plans([plan], events, until=until)["a"])
+    assert (s["on_time"], s["missed"]) == (18, 0)
@@ -0,0 +1,90 @@
+from contextlib import contextmanager
+
+from app.hp_etl import mv_refresh
+
+A, B, C = "analytics.mv_a", "analytics.mv_b", "analytics.mv_c"
+EVENTS = "analytics.data_events"
+
+
+class FakeCur:
+    def __init__(self, last):
+        self.last = last
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if sql is mv_refresh.DEPS_SQL:
+            # B reads A; A and C read data_events
+            self.rows = [(A, EVENTS, "r"), (B, A, "m"), (C, EVENTS, "r")]
+        elif sql is mv_refresh.CONCURRENT_OK_SQL:
+            self.rows = [(A, True), (B, False), (C, True)]
+        elif sql is mv_refresh.SIG_SQL:
+            self.rows = [(EVENTS, 42)]
+        elif sql is mv_refresh.LAST_SIG_SQL:
+            self.rows = list(self.last.items())
+
+    def fetchall(self):
+        return self.rows
+
+
+def _setup(monkeypatch, last):
+    calls, logged = [], []
+
+    class FakeConn:
+        def cursor(self):
+            return FakeCur(last)
+
+    @contextmanager
+    def fake_pg(dsn=None):
+        yield FakeConn()
+
+    def fake_refresh(view, concurrent, dsn=None, fallback=True):
+        calls.append((view, concurrent))
+        status = "concurrent" if concurrent else "exclusive"
+        return mv_refresh.Result(view, status, duration_ms=1.0, row_count=3)
+
+    monkeypatch.setattr(mv_refresh, "pg", fake_pg)
+    monkeypatch.setattr(mv_refresh, "refresh_one", fake_refresh)
+    monkeypatch.setattr(
+        mv_refresh, "log", lambda res, run_id, dsn=None: logged.extend(res)
+    )
+    return calls, logged
+
+
+def test_unchanged_sources_skip_view_and_dependents(monkeypatch):
+    sig = f"{EVENTS}=42"
+    calls, logged = _setup(monkeypatch, {A: sig, B: "", C: "stale"})
+    results = mv_refresh.refresh_all([B, A, C], workers=2)
+
+    assert [r.view for r in results] == [B, A, C]
+    status = {r.view: r.status for r in results}
+    assert status == {A: "skipped", B: "skipped", C: "concurrent"}
+    assert calls == [(C, True)]
+    assert [r.view for r in logged] == [B, A, C]
+    assert results[2].sig == sig
+
+
+def test_upstream_refresh_forces_dependent_and_runs_first(monkeypatch):
+    calls, _ = _setup(monkeypatch, {})
+    results = mv_refresh.refresh_all([B, A], workers=1)
+    assert calls == [(A, True), (B, False)]
+    assert all(r.refreshed for r in results)
+
+
+def test_failed_upstream_fails_dependent(monkeypatch):
+    calls, _ = _setup(monkeypatch, {})
+
+    def failing(view, concurrent, dsn=None, fallback=True):
+        calls.append((view, concurrent))
+        return mv_refresh.Result(view, "failed", error="boom")
+
+    monkeypatch.setattr(mv_refresh, "refresh_one", failing)
+    results = {r.view: r for r in mv_refresh.refresh_all([A, B])}
+    assert calls == [(A, True)]
+    assert results[B].status == "failed"
+    assert A in results[B].error
@@ -0,0 +1,89 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import srv.api.reports as reports
+from app.hp_etl import generations, simple_cache
+
+
+def fake_pg(rows, calls):
+    @contextmanager
+    def _pg(*args, **kwargs):
+        class Cur:
+            def execute(self, sql, params=None):
+                calls.append((sql, params))
+
+            def fetchall(self):
+                return rows
+
+        class Conn:
+            def cursor(self):
+                return Cur()
+
+        yield Conn()
+
+    return _pg
+
+
+def test_critical_series_single_round_trip(monkeypatch):
+    simple_cache.clear_all()
+    generations._memo.clear()
+    day = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rows = [
+        ("vital", "hr", day, 61.0, None, None, None, None),
+        ("vital", "spo2", day, 95.0, None, None, None, None),
+        ("meta", None, None, None, "7", "60", "UTC", True),
+    ]
+    calls = []
+    monkeypatch.setattr(reports.db, "pg", fake_pg(rows, calls))
+
+    resp = reports.critical_series("p1", metrics="hr,spo2")
+    assert resp.headers["Cache-Control"] == "no-store"
+    assert len(calls) == 1
+    assert "analytics.etl_state" in calls[0][0]
+    assert "analytics.person" in calls[0][0]
+
+    # warm cache: memoized etl version serves the repeat without a query
+    reports.critical_series("p1", metrics="hr,spo2")
+    assert len(calls) == 1
+
+
+def test_critical_series_unknown_person(monkeypatch):
+    simple_cache.clear_all()
+    generations._memo.clear()
+    rows = [("meta", None, None, None, None, None, None, False)]
+    monkeypatch.setattr(reports.db, "pg", fake_pg(rows, []))
+    with pytest.raises(HTTPException) as exc:
+        reports.critical_series("nobody", metrics="hr")
+    assert exc.value.status_code == 404
+
+
+def test_vitals_outage_falls_back_to_person_lookup(monkeypatch):
+    simple_cache.clear_all()
+    generations._memo.clear()
+    calls = []
+
+    @contextmanager
+    def _pg(*args, **kwargs):
+        class Cur:
+            def execute(self, sql, params=None):
+                calls.append(sql)
+                if len(calls) == 1:
+                    raise RuntimeError('relation "analytics.etl_state" does not exist')
+
+            def fetchall(self):
+                return [("Europe/Paris",)]
+
+        class Conn:
+            def cursor(self):
+                return Cur()
+
+        yield Conn()
+
+    monkeypatch.setattr(reports.db, "pg", _pg)
+    resp = reports.critical_series("p1", metrics="hr")
+    assert resp.status_code == 200
+    assert "etl_state" not in calls[1] and "analytics.person" in calls[1]
+    assert generations.peek(generations.MV_DAILY_VITALS) is None
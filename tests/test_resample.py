@@ -0,0 +1,79 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.hp_etl import resample as r
+
+
+def _points(n=2000, days=20, seed=0):
+    rnd = random.Random(seed)
+    base = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    return [
+        r.Point(
+            r.isoz(base + timedelta(seconds=rnd.randrange(86400 * days))),
+            60 + rnd.random() * 40,
+        )
+        for _ in range(n)
+    ]
+
+
+def _by_floor(points, key):
+    buckets = {}
+    for p in points:
+        buckets.setdefault(key(r.parse_isoz(p.ts)), []).append(p.v)
+    return [(r.isoz(k), r.agg_mean(vs)) for k, vs in sorted(buckets.items())]
+
+
+def _close(points, expected):
+    assert [p.ts for p in points] == [ts for ts, _ in expected]
+    for p, (_, v) in zip(points, expected):
+        assert p.v == pytest.approx(v, rel=1e-12)
+
+
+@pytest.mark.parametrize("freq", ["1min", "5min", "15min", "1h", "1d"])
+def test_resample_matches_floor_dt(freq):
+    pts = _points()
+    _close(r.resample(pts, freq), _by_floor(pts, lambda d: r.floor_dt(d, freq)))
+
+
+def test_local_days_across_dst():
+    from zoneinfo import ZoneInfo
+
+    tz = ZoneInfo("America/New_York")  # DST starts 2025-03-09
+
+    def local_midnight(d):
+        d = d.astimezone(tz)
+        return datetime(d.year, d.month, d.day, tzinfo=tz)
+
+    pts = _points()
+    expected = _by_floor(pts, local_midnight)
+    _close(r.resample(pts, "1d", tz="America/New_York"), expected)
+    assert "2025-03-09T05:00:00Z" in [ts for ts, _ in expected]
+    assert "2025-03-10T04:00:00Z" in [ts for ts, _ in expected]
+
+
+def test_resample_arrays_computes_several_aggregates():
+    np = pytest.importorskip("numpy")
+    pts = _points(500, days=3)
+    ts = r.epoch_ns([p.ts for p in pts])
+    v = np.array([p.v for p in pts])
+    v[::50] = np.nan
+    aggs = ["mean", "min", "max", "median", "count", "p90"]
+    res = r.resample_arrays(ts, v, "6h", aggs)
+    keys = r.bucket_ns(ts, "6h")
+    assert len(res["ts"]) == 12
+    for i, t in enumerate(res["ts"]):
+        vals = v[(keys == t) & ~np.isnan(v)]
+        assert res["count"][i] == len(vals)
+        assert res["mean"][i] == pytest.approx(vals.mean())
+        assert res["min"][i] == vals.min() and res["max"][i] == vals.max()
+        assert res["median"][i] == pytest.approx(np.median(vals))
+        assert res["p90"][i] == pytest.approx(np.percentile(vals, 90))
+
+
+def test_bad_freq_and_agg():
+    with pytest.raises(ValueError):
+        r.freq_ns("3 fortnights")
+    with pytest.raises(ValueError):
+        r.resample_arrays([0], [1.0], "1h", ["mode"])
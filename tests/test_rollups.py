@@ -0,0 +1,66 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from app.hp_etl import generations, rollups
+
+
+class FakeCur:
+    def __init__(self, result=None):
+        self.calls = []
+        self.result = result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.calls.append((sql, params))
+
+    def fetchone(self):
+        return (self.result,)
+
+
+class FakeConn:
+    def __init__(self, cur):
+        self.cur = cur
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+    def cursor(self):
+        return self.cur
+
+
+def test_mark_dirty_sends_one_statement_and_skips_incomplete():
+    t = datetime(2025, 3, 1, 8, tzinfo=timezone.utc)
+    cur = FakeCur()
+    rollups.mark_dirty(cur, [("me", "8867-4", t), ("me", "59408-5", None)])
+    assert len(cur.calls) == 1
+    sql, params = cur.calls[0]
+    assert sql is rollups.MARK_SQL
+    assert params == (["me"], ["8867-4"], [t])
+
+    empty = FakeCur()
+    rollups.mark_dirty(empty, [])
+    assert empty.calls == []
+
+
+def test_process_bumps_generations_only_when_buckets_claimed(monkeypatch):
+    bumped = []
+    monkeypatch.setattr(generations, "bump", lambda *s, **kw: bumped.append(s))
+
+    for claimed in (3, 0):
+        cur = FakeCur(result=claimed)
+
+        @contextmanager
+        def fake_pg(dsn=None):
+            yield FakeConn(cur)
+
+        monkeypatch.setattr(rollups, "pg", fake_pg)
+        assert rollups.process(limit=10) == claimed
+        assert cur.calls == [(rollups.PROCESS_SQL, (10,))]
+
+    assert bumped == [rollups.VIEWS]
@@ -0,0 +1,134 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from app.hp_etl import rules
+from app.hp_etl.rules import MetricPoint
+
+
+def _series(values, start=datetime(2025, 3, 1, 8, tzinfo=timezone.utc), step_h=24):
+    return [
+        MetricPoint(
+            (start + timedelta(hours=step_h * i)).strftime("%Y-%m-%dT%H:%M:%SZ"), v
+        )
+        for i, v in enumerate(values)
+    ]
+
+
+def test_latest_value_rules_keep_rule_order_and_skip_unknown_ops():
+    rs = [
+        {"id": "hi", "when": {"metric": "hr", "op": ">", "value": 90}, "level": "warn"},
+        {"id": "bad", "when": {"metric": "hr", "op": "~", "value": 1}},
+        {"id": "lo", "when": {"metric": "spo2", "op": "<", "value": 0.9}},
+        {"id": "any", "when": {"metric": "hr", "op": "!=", "value": 0}},
+    ]
+    series = {"hr": _series([80, 95, None]), "spo2": _series([0.95])}
+    out = rules.evaluate_rules(rs, series)
+    assert [r["rule_id"] for r in out] == ["hi", "any"]
+    assert out[0]["value"] == 95 and out[0]["at"].startswith("2025-03-02")
+
+
+def test_window_rules_match_naive_trailing_aggregates():
+    rnd = random.Random(0)
+    values = [rnd.uniform(50, 120) for _ in range(60)]
+    series = _series(values, step_h=7)
+    ruleset = rules.compile_rules(
+        [
+            {
+                "id": agg,
+                "when": {
+                    "metric": "hr",
+                    "agg": agg,
+                    "window": "2d",
+                    "op": ">=",
+                    "value": 0,
+                },
+            }
+            for agg in rules.WINDOW_AGGS
+        ]
+    )
+    st = ruleset.state()
+    for i, pt in enumerate(series):
+        got = {r["rule_id"]: r["value"] for _, r in st.push("hr", pt.ts, pt.v)}
+        win = [values[j] for j in range(i + 1) if 7 * (i - j) < 48]
+        assert got["count"] == len(win)
+        assert abs(got["mean"] - sum(win) / len(win)) < 1e-9
+        assert got["min"] == min(win) and got["max"] == max(win)
+
+
+def test_consecutive_days():
+    rule = {
+        "id": "c",
+        "when": {"metric": "hr", "op": ">", "value": 100, "consecutive": 3},
+    }
+
+    def fires(vals):
+        return bool(rules.evaluate_rules([rule], {"hr": _series(vals)}))
+
+    assert fires([90, 101, 102, 103])
+    assert not fires([101, 102, 90, 103])
+    # a missing day breaks the streak
+    gap = _series([101, 102, 103])
+    gap[2].ts = "2025-03-05T08:00:00Z"
+    assert not rules.evaluate_rules([rule], {"hr": gap})
+
+
+def test_rules_from_thresholds():
+    rs = rules.rules_from_thresholds([("1742-6", 0, 55, "ALT high")])
+    out = rules.evaluate_rules(rs, {"1742-6": _series([40, 70])})
+    assert [r["rule_id"] for r in out] == ["threshold:1742-6:max"]
+    assert out[0]["message"] == "ALT high" and out[0]["level"] == "alert"
+
+
+def test_unsorted_series_still_fire_plain_and_window_rules():
+    rs = [
+        {"id": "hi", "when": {"metric": "hr", "op": ">", "value": 100}},
+        {
+            "id": "max",
+            "when": {
+                "metric": "hr",
+                "agg": "max",
+                "window": "3d",
+                "op": ">",
+                "value": 110,
+            },
+        },
+    ]
+    d1, d2, d3 = _series([120, 90, 105])
+    out = rules.evaluate_rules(rs, {"hr": [d2, d1, d3]})
+    assert [r["rule_id"] for r in out] == ["hi", "max"]
+    # a point older than the newest one comes last: the plain rule still sees it
+    out = rules.evaluate_rules(rs, {"hr": [d3, d2, d1]})
+    assert [(r["rule_id"], r["value"]) for r in out] == [("hi", 120), ("max", 120)]
+    assert out[1]["at"] == d3.ts
+
+
+def test_consecutive_windowed_rule_tests_the_aggregate():
+    rule = {
+        "id": "c",
+        "when": {
+            "metric": "hr",
+            "agg": "mean",
+            "window": "2d",
+            "op": ">",
+            "value": 100,
+            "consecutive": 2,
+        },
+    }
+    # raw values 120 then 90: the last day fails on v but its 2-day mean is 105
+    out = rules.evaluate_rules([rule], {"hr": _series([120, 90])})
+    assert [(r["rule_id"], r["value"]) for r in out] == [("c", 105)]
+    # day one's mean is 90, so the streak is one day long
+    assert not rules.evaluate_rules([rule], {"hr": _series([90, 120])})
+
+
+def test_windowed_rules_without_a_valid_window_are_dropped():
+    when = {"metric": "hr", "op": ">", "value": 100, "agg": "mean"}
+    rs = [
+        {"id": "none", "when": when},
+        {"id": "typo", "when": {**when, "window": "7 days"}},
+        {"id": "ok", "when": {**when, "window": "2d"}},
+    ]
+    compiled = rules.compile_rules(rs)
+    assert [r.id for r in compiled.rules] == ["ok"]
+    out = rules.evaluate_rules(rs, {"hr": _series([120, 130])})
+    assert [r["rule_id"] for r in out] == ["ok"]
@@ -0,0 +1,42 @@
+import time
+
+from app.hp_etl import simple_cache
+
+
+def test_lru_evicts_least_recently_used(monkeypatch):
+    simple_cache.clear_all()
+    monkeypatch.setattr(simple_cache, "MAX_ENTRIES", 2)
+    before = simple_cache.stats()["evictions"]
+    simple_cache.set("a", 1)
+    simple_cache.set("b", 2)
+    assert simple_cache.get("a") == 1  # a is now most recent
+    simple_cache.set("c", 3)
+    assert simple_cache.get("b") is None
+    assert simple_cache.get("a") == 1
+    assert simple_cache.get("c") == 3
+    assert simple_cache.stats()["evictions"] == before + 1
+
+
+def test_byte_budget_is_enforced(monkeypatch):
+    simple_cache.clear_all()
+    payload = ["x" * 1000] * 10
+    monkeypatch.setattr(simple_cache, "MAX_BYTES", simple_cache.sizeof(payload) * 3)
+    for i in range(10):
+        simple_cache.set(f"k{i}", payload)
+    st = simple_cache.stats()
+    assert st["entries"] < 4
+    assert st["bytes"] <= st["max_bytes"]
+    simple_cache.set("huge", payload * 10)
+    assert simple_cache.get("huge") is None
+
+
+def test_sweep_drops_expired_and_counts():
+    simple_cache.clear_all()
+    simple_cache.set("old", 1, ttl=1)
+    simple_cache.set("keep", 2)
+    simple_cache._cache["old"] = (1, time.time() - 1, simple_cache._cache["old"][2])
+    assert simple_cache.sweep() == 1
+    st = simple_cache.stats()
+    assert st["entries"] == 1
+    assert simple_cache.get("keep") == 2
+    assert st["bytes"] == simple_cache.sizeof("keep") + simple_cache.sizeof(2)
@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi.testclient import TestClient
 import datetime as dt
 from srv.api.main import app
@@ -126,6 +127,34 @@ def fake_pg_factory(vitals_rows=None, findings_rows=None, events_rows=None):
     return FakeConn
 
 
+def fake_apg_factory(*args, **kwargs):
+    # async twin of fake_pg_factory for handlers that use db.apg()
+    FakeConn = fake_pg_factory(*args, **kwargs)
+
+    class AsyncCur:
+        def __init__(self, cur):
+            self._cur = cur
+
+        async def execute(self, q, p=None):
+            self._cur.execute(q, p)
+
+        async def fetchall(self):
+            return self._cur.fetchall()
+
+        async def fetchone(self):
+            return self._cur.fetchone()
+
+    class AsyncConn:
+        def cursor(self):
+            return AsyncCur(FakeConn().cursor())
+
+    @asynccontextmanager
+    async def apg(*a, **k):
+        yield AsyncConn()
+
+    return apg
+
+
 def test_dashboard_render(monkeypatch):
     vitals = make_vitals_rows()
     findings = make_findings_rows()
@@ -133,6 +162,7 @@ def test_dashboard_render(monkeypatch):
     monkeypatch.setattr(
         "app.hp_etl.db.pg", lambda *a, **k: fake_pg_factory(vitals, findings)()
     )
+    monkeypatch.setattr("app.hp_etl.db.apg", fake_apg_factory(vitals, findings))
 
     # first get login page
     r = client.get("/login")
@@ -156,6 +186,7 @@ def test_events_ajax(monkeypatch):
     monkeypatch.setattr(
         "app.hp_etl.db.pg", lambda *a, **k: fake_pg_factory(events_rows=events)()
     )
+    monkeypatch.setattr("app.hp_etl.db.apg", fake_apg_factory(events_rows=events))
     # login
     client.post("/login", data={"api_key": "testkey"})
     r = client.get("/dashboard/events.json?person_id=me&metric=hr&limit=5")
@@ -172,6 +203,7 @@ def test_events_page_dynamic(monkeypatch):
     monkeypatch.setattr(
         "app.hp_etl.db.pg", lambda *a, **k: fake_pg_factory(events_rows=events)()
     )
+    monkeypatch.setattr("app.hp_etl.db.apg", fake_apg_factory(events_rows=events))
     client.post("/login", data={"api_key": "testkey"})
     r = client.get("/dashboard/events")
     assert r.status_code == 200
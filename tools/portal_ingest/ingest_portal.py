@@ -26,6 +26,15 @@ from psycopg2.extras import execute_values
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
 MAP_PATH = os.path.join(THIS_DIR, "mappings", "loinc_map.csv")
 
+# generations.bump(generations.DATA_EVENTS) for this psycopg2 connection
+BUMP_DATA_EVENTS_SQL = """
+INSERT INTO analytics.etl_state(key, value) VALUES ('data_events_version', '1')
+ON CONFLICT (key) DO UPDATE SET value = (
+  CASE WHEN analytics.etl_state.value ~ '^[0-9]+$'
+       THEN analytics.etl_state.value::bigint + 1 ELSE 1 END
+)::text
+"""
+
 MONTHS = {
     "jan": 1,
     "feb": 2,
@@ -574,6 +583,31 @@ def main():
         merge_sql_exe = merge_sql.replace(":'run_id'", "%s")
         with conn.cursor() as cur:
             cur.execute(merge_sql_exe, (str(run_id),))
+            # recompute the analytics.labs_daily days this run touched
+            cur.execute(
+                "SELECT analytics.labs_daily_refresh(person_id, array_agg(effective_time)) "
+                "FROM ingest_portal.stg_portal_labs WHERE run_id = %s GROUP BY person_id",
+                (str(run_id),),
+            )
+            # and queue the vitals/liver rollup buckets (init/064)
+            cur.execute(
+                "INSERT INTO analytics.rollup_dirty (person_id, code, day) "
+                "SELECT DISTINCT person_id, code, (effective_time AT TIME ZONE 'UTC')::date "
+                "FROM ingest_portal.stg_portal_labs WHERE run_id = %s "
+                "AND effective_time IS NOT NULL AND code = ANY (analytics.rollup_codes()) "
+                "ON CONFLICT DO NOTHING",
+                (str(run_id),),
+            )
+            # and the (person, code) pairs for rule evaluation (init/069)
+            cur.execute(
+                "SELECT analytics.queue_eval("
+                "array_agg(person_id), array_agg(code), array_agg(effective_time)) "
+                "FROM ingest_portal.stg_portal_labs WHERE run_id = %s "
+                "AND code IS NOT NULL AND value_num IS NOT NULL",
+                (str(run_id),),
+            )
+            # retire cached responses built on the old events (app.hp_etl.generations)
+            cur.execute(BUMP_DATA_EVENTS_SQL)
         conn.commit()
 
     finally:
@@ -12,5 +12,31 @@ REPO_ROOT="$(git rev-parse --show-toplevel 2>/dev/null || echo "$PWD")"
 PSQL="${REPO_ROOT}/services/healthdb-pg-0001/scripts/psql.sh"
 
 echo "[merge] Merging run ${RUN_ID} into analytics.data_events ..."
-"${PSQL}" -v run_id="${RUN_ID}" < "${REPO_ROOT}/services/healthdb-pg-0001/init/057_portal_ingest_merge.sql"
+# one transaction: the merge, the derived-data queues and the cache generation
+{
+cat "${REPO_ROOT}/services/healthdb-pg-0001/init/057_portal_ingest_merge.sql"
+cat <<'SQL'
+SELECT analytics.labs_daily_refresh(person_id, array_agg(effective_time))
+FROM ingest_portal.stg_portal_labs
+WHERE run_id = :'run_id'
+GROUP BY person_id;
+INSERT INTO analytics.rollup_dirty (person_id, code, day)
+SELECT DISTINCT person_id, code, (effective_time AT TIME ZONE 'UTC')::date
+FROM ingest_portal.stg_portal_labs
+WHERE run_id = :'run_id'
+  AND effective_time IS NOT NULL AND code = ANY (analytics.rollup_codes())
+ON CONFLICT DO NOTHING;
+SELECT analytics.queue_eval(
+  array_agg(person_id), array_agg(code), array_agg(effective_time))
+FROM ingest_portal.stg_portal_labs
+WHERE run_id = :'run_id'
+  AND code IS NOT NULL AND value_num IS NOT NULL;
+-- retire cached responses built on the old events (app.hp_etl.generations)
+INSERT INTO analytics.etl_state(key, value) VALUES ('data_events_version', '1')
+ON CONFLICT (key) DO UPDATE SET value = (
+  CASE WHEN analytics.etl_state.value ~ '^[0-9]+$'
+       THEN analytics.etl_state.value::bigint + 1 ELSE 1 END
+)::text;
+SQL
+} | "${PSQL}" -1 -v ON_ERROR_STOP=1 -v run_id="${RUN_ID}" -f -
 echo "[merge] Done."
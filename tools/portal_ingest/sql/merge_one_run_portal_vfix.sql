@@ -1,5 +1,7 @@
 \set ON_ERROR_STOP on
 
+BEGIN;
+
 DO $merge$
 DECLARE
   has_source       boolean;
@@ -69,3 +71,33 @@ BEGIN
   END IF;
 END
 $merge$;
+
+-- recompute the analytics.labs_daily days this run touched
+SELECT analytics.labs_daily_refresh(person_id, array_agg(effective_time))
+FROM ingest_portal.stg_portal_labs
+WHERE run_id = :'RUN_ID'::uuid
+GROUP BY person_id;
+
+-- queue the vitals/liver rollup buckets this run touched (init/064)
+INSERT INTO analytics.rollup_dirty (person_id, code, day)
+SELECT DISTINCT person_id, code, (effective_time AT TIME ZONE 'UTC')::date
+FROM ingest_portal.stg_portal_labs
+WHERE run_id = :'RUN_ID'::uuid
+  AND effective_time IS NOT NULL AND code = ANY (analytics.rollup_codes())
+ON CONFLICT DO NOTHING;
+
+-- and the (person, code) pairs for rule evaluation (init/069)
+SELECT analytics.queue_eval(
+  array_agg(person_id), array_agg(code), array_agg(effective_time))
+FROM ingest_portal.stg_portal_labs
+WHERE run_id = :'RUN_ID'::uuid
+  AND code IS NOT NULL AND value_num IS NOT NULL;
+
+-- retire cached responses built on the old events (app.hp_etl.generations)
+INSERT INTO analytics.etl_state(key, value) VALUES ('data_events_version', '1')
+ON CONFLICT (key) DO UPDATE SET value = (
+  CASE WHEN analytics.etl_state.value ~ '^[0-9]+$'
+       THEN analytics.etl_state.value::bigint + 1 ELSE 1 END
+)::text;
+
+COMMIT;